@@ -10,15 +10,29 @@
 # Note that the 'NUM_LEDs' was adjusted to 1. Also
 # the GPIO for the addressable WS2812 RGB LED called
 # `PIN_NUM` was adjusted for the Pro Micro RP2040. 
+#
+# WS2812: the output path for long strips:
+# - fb: the persistent framebuffer, one word per LED, GRB (g<<16 | r<<8 | b), set() writes it
+# - show(): brightness and gamma by a 256 entry LUT (a viper loop, no float per pixel) into one of two
+#   DMA buffers, already left aligned for the SM (24bit frames, MSB first), then the DMA feeds the SM.
+#   It returns at once: the next frame renders while this one shifts out (30 us per LED), the next
+#   show() waits for the end of it (plus the latch time) only before it starts its own DMA.
+# WS2812Parallel: up to 8 strips from one SM, the framebuffers bit-transposed into planes for the DMA
+# color_chase(), rainbow_cycle(): effects of rp_ledfx.py (palettes, viper kernels, frame scheduler)
 
 import array, time
 from machine import Pin
 import rp2
+from rp_util import sm_dma_put, dma_busy, sm_wait_idle
+import rp_ledfx
 
 # Configure the number of WS2812 LEDs.
 NUM_LEDS = 1
 PIN_NUM = 25
 brightness = 0.2
+GAMMA = 1.0		# 1.0: linear, as before, about 2.2 looks linear to the eye
+LATCH_US = 80		# data low this long: the LEDs take the frame (>= 50 us, newer LEDs 280 us)
+DMA_CH = 4		# the DMA channel of a strip
 
 @rp2.asm_pio(sideset_init=rp2.PIO.OUT_LOW, out_shiftdir=rp2.PIO.SHIFT_LEFT, autopull=True, pull_thresh=24)
 def ws2812():
@@ -34,39 +48,181 @@ def ws2812():
     nop()                   .side(0)    [T2 - 1]
     wrap()
 
-# Create the StateMachine with the ws2812 program, outputting on pin
-sm = rp2.StateMachine(0, ws2812, freq=8_000_000, sideset_base=Pin(PIN_NUM))
+#the 256 entry LUT: a color byte scaled by brightness 0..1, with gamma
+def ws2812_lut(brightness, gamma=GAMMA):
+    lut = bytearray(256)
+    for v in range(256):
+        lut[v] = int(255 * (v / 255) ** gamma * brightness + 0.5)
+    return lut
+
+#n GRB words of src through the LUT into dst, left aligned: the SM shifts out bit 31 first
+@micropython.viper
+def ws2812_scale(src: ptr32, dst: ptr32, lut: ptr8, n: int):
+    for i in range(n):
+        c = src[i]
+        dst[i] = (lut[(c >> 16) & 0xff] << 24) | (lut[(c >> 8) & 0xff] << 16) | (lut[c & 0xff] << 8)
+
+class WS2812:
+
+    def __init__(self, sm_id, pin, n, brightness=brightness, gamma=GAMMA, dma=DMA_CH):
+        self._setup(sm_id, n, n, brightness, gamma, dma)
+        self._sm = rp2.StateMachine(sm_id, ws2812, freq=8_000_000, sideset_base=Pin(pin))
+        self._sm.active(1)
+
+    #n LEDs, nword: the words of a frame for the SM
+    def _setup(self, sm_id, n, nword, brightness, gamma, dma):
+        self.n = n
+        self.fb = array.array("I", [0] * n)
+        self._out = (array.array("I", [0] * nword), array.array("I", [0] * nword))	#DMA buffers: one shifts out, one renders
+        self._k = 0
+        self._busy = False				#a frame is on its way (DMA, SM, latch)
+        self._sm_id = sm_id
+        self._dma = dma
+        self.brightness(brightness, gamma)
+
+    #the framebuffer into the words for the SM
+    def _render(self, out):
+        ws2812_scale(self.fb, out, self._lut, self.n)
+
+    def brightness(self, brightness, gamma=GAMMA):
+        self._lut = ws2812_lut(brightness, gamma)
+
+    def set(self, i, color):
+        self.fb[i] = (color[1]<<16) + (color[0]<<8) + color[2]
+
+    def fill(self, color):
+        c = (color[1]<<16) + (color[0]<<8) + color[2]
+        fb = self.fb
+        for i in range(self.n):
+            fb[i] = c
+
+    def show(self):
+        out = self._out[self._k]
+        self._render(out)				#while the last frame still shifts out
+        self.wait()
+        sm_dma_put(self._dma, self._sm_id, out, len(out))
+        self._busy = True
+        self._k ^= 1
+
+    #the last frame is out and latched
+    def wait(self):
+        if self._busy:
+            while dma_busy(self._dma):
+                pass
+            sm_wait_idle(self._sm_id)			#the last bits out of the OSR
+            time.sleep_us(LATCH_US)
+            self._busy = False
+
+#parallel strands: up to 8 strips on consecutive pins from one SM, all pins high at the start of a bit,
+#then each pin its bit, then all low: a bit plane (one byte, bit s: strand s) per bit time
+#out(x, 8) takes the plane while the pins are low (it stalls there when the FIFO is empty), mov(pins, x)
+#drives it: mov/out on pins drive nstrand pins (out_init), the upper bits of a plane are not used
+#T0H 3, T1H 6 of 10 SM cycles: 375 ns / 750 ns at 8 MHz (measured by rp_piosim.py)
+def ws2812_parallel_program(nstrand):
+    @rp2.asm_pio(out_init=(rp2.PIO.OUT_LOW,) * nstrand, out_shiftdir=rp2.PIO.SHIFT_RIGHT, autopull=True,
+                 pull_thresh=32)
+    def ws2812_parallel():
+        T1 = 3
+        T2 = 3
+        T3 = 4
+        wrap_target()
+        out(x, 8)
+        mov(pins, invert(null)) [T1 - 1]
+        mov(pins, x)            [T2 - 1]
+        mov(pins, null)         [T3 - 2]
+        wrap()
+    return ws2812_parallel
+
+_par_prog = {}		#nstrand: program, built once
 
-# Start the StateMachine, it will wait for data on its FIFO.
-sm.active(1)
+def ws2812_parallel(nstrand):
+    prog = _par_prog.get(nstrand)
+    if prog is None:
+        prog = ws2812_parallel_program(nstrand)
+        _par_prog[nstrand] = prog
+    return prog
 
-# Display a pattern on the LEDs via an array of LED RGB values.
-ar = array.array("I", [0 for _ in range(NUM_LEDS)])
+#the framebuffers of nstrand strips (fb: nled words each, strand s at s * nled) through the LUT into the
+#bit planes: 24 bytes per LED (G, R, B, MSB first), byte b bit s = bit 23 - b of strand s
+#8x8 bit transpose per color byte of 8 strands (Hacker's Delight transpose8): x holds strands 7..4 (row
+#0 = strand 7 in the MSB), y strands 3..0, the rows come out as the planes
+@micropython.viper
+def ws2812_transpose(fb: ptr32, nstrand: int, nled: int, lut: ptr8, dst: ptr8):
+    o = 0
+    for i in range(nled):
+        k = 16
+        while k >= 0:
+            x = 0
+            y = 0
+            s = 0
+            while s < nstrand:
+                v = lut[(fb[s * nled + i] >> k) & 0xff]
+                if s < 4:
+                    y |= v << (8 * s)
+                else:
+                    x |= v << (8 * (s - 4))
+                s += 1
+            t = (x ^ (x >> 7)) & 0x00AA00AA
+            x = x ^ t ^ (t << 7)
+            t = (y ^ (y >> 7)) & 0x00AA00AA
+            y = y ^ t ^ (t << 7)
+            t = (x ^ (x >> 14)) & 0x0000CCCC
+            x = x ^ t ^ (t << 14)
+            t = (y ^ (y >> 14)) & 0x0000CCCC
+            y = y ^ t ^ (t << 14)
+            t = (x & 0xF0F0F0F0) | ((y >> 4) & 0x0F0F0F0F)
+            y = ((x << 4) & 0xF0F0F0F0) | (y & 0x0F0F0F0F)
+            dst[o] = t >> 24
+            dst[o + 1] = t >> 16
+            dst[o + 2] = t >> 8
+            dst[o + 3] = t
+            dst[o + 4] = y >> 24
+            dst[o + 5] = y >> 16
+            dst[o + 6] = y >> 8
+            dst[o + 7] = y
+            o += 8
+            k -= 8
+
+#nstrand strips of nled LEDs on pins pin..pin + nstrand - 1, one SM, one DMA: a frame takes as long as
+#one strip (30 us per LED), not nstrand times. fb: strand s at s * nled, set(s * nled + i, color),
+#n: all LEDs (the effects of rp_ledfx.py see one long strip, folded over the strands)
+class WS2812Parallel(WS2812):
+
+    def __init__(self, sm_id, pin, nstrand, nled, brightness=brightness, gamma=GAMMA, dma=DMA_CH):
+        assert 1 <= nstrand <= 8
+        self.nstrand = nstrand
+        self.nled = nled
+        self._setup(sm_id, nstrand * nled, 6 * nled, brightness, gamma, dma)	#24 planes per LED
+        self._sm = rp2.StateMachine(sm_id, ws2812_parallel(nstrand), freq=8_000_000, out_base=Pin(pin))
+        self._sm.active(1)
+
+    def _render(self, out):
+        ws2812_transpose(self.fb, self.nstrand, self.nled, self._lut, out)
 
 ##########################################################################
+leds = None		#the strip of the pixels_...() functions
+
+def pixels_init(n=NUM_LEDS, pin=PIN_NUM, sm_id=0):
+    global leds
+    leds = WS2812(sm_id, pin, n)
+    return leds
+
 def pixels_show():
-    dimmer_ar = array.array("I", [0 for _ in range(NUM_LEDS)])
-    for i,c in enumerate(ar):
-        r = int(((c >> 8) & 0xFF) * brightness)
-        g = int(((c >> 16) & 0xFF) * brightness)
-        b = int((c & 0xFF) * brightness)
-        dimmer_ar[i] = (g<<16) + (r<<8) + b
-    sm.put(dimmer_ar, 8)
-    time.sleep_ms(10)
+    leds.show()
 
 def pixels_set(i, color):
-    ar[i] = (color[1]<<16) + (color[0]<<8) + color[2]
+    leds.set(i, color)
 
 def pixels_fill(color):
-    for i in range(len(ar)):
-        pixels_set(i, color)
+    leds.fill(color)
+
+#the effects by rp_ledfx.py: rendered into the framebuffer by viper kernels, at a fixed frame rate
+FPS = 60
 
 def color_chase(color, wait):
-    for i in range(NUM_LEDS):
-        pixels_set(i, color)
-        time.sleep(wait)
-        pixels_show()
+    dropped = rp_ledfx.FrameScheduler(leds, 1 / wait if wait else FPS).run(rp_ledfx.Chase(color), leds.n)
     time.sleep(0.2)
+    return dropped
 
 def wheel(pos):
     # Input a value 0 to 255 to get a color value.
@@ -81,13 +237,13 @@ def wheel(pos):
     pos -= 170
     return (pos * 3, 0, 255 - pos * 3)
 
+_wheel_pal = None	#wheel() over 0..255, computed once
+
 def rainbow_cycle(wait):
-    for j in range(255):
-        for i in range(NUM_LEDS):
-            rc_index = (i * 256 // NUM_LEDS) + j
-            pixels_set(i, wheel(rc_index & 255))
-        pixels_show()
-        time.sleep(wait)
+    global _wheel_pal
+    if _wheel_pal is None:
+        _wheel_pal = rp_ledfx.palette(wheel)
+    return rp_ledfx.FrameScheduler(leds, 1 / wait if wait else FPS).run(rp_ledfx.Rainbow(_wheel_pal), 255)
 
 BLACK = (0, 0, 0)
 RED = (255, 0, 0)
@@ -99,18 +255,20 @@ PURPLE = (180, 0, 255)
 WHITE = (255, 255, 255)
 COLORS = (BLACK, RED, YELLOW, GREEN, CYAN, BLUE, PURPLE, WHITE)
 
-print("fills")
-for color in COLORS:       
-    pixels_fill(color)
-    pixels_show()
-    time.sleep(0.2)
+if __name__ == "__main__":
+    pixels_init()
+
+    print("fills")
+    for color in COLORS:       
+        pixels_fill(color)
+        pixels_show()
+        time.sleep(0.2)
 
-print("chases")
-for color in COLORS:       
-    color_chase(color, 0.01)
+    print("chases")
+    for color in COLORS:       
+        color_chase(color, 0.01)
 
-while True:
-    print("rainbow")
-    rainbow_cycle(0)
+    while True:
+        print("rainbow, %d frames dropped" % rainbow_cycle(0))
 
 
@@ -1,5 +1,8 @@
 import rp2
 from machine import Pin
+from array import array
+from rp_util import sm_dma_put, sm_dma_get, dma_busy, sm_wait_idle, sm_irq_force, sm_irq_take
+from RP2350_PIO_MDIO import mgmt_prog, mgmt_encode
 
 #BSTI interface with RP2350:
 #===========================
@@ -11,6 +14,11 @@ from machine import Pin
 #GPIO3: MDOUT - output signal
 #GPIO4: DIR   - output signal (for debug and level shifter, see where the read phase is)
 #GPIO5: MDIN  - input signal: ATT: it needs a config to be an input
+#the preamble: a read (dataRead) asks for it with IRQ 7 and waits on IRQ 6 (preamble done) - no CPU involved,
+#so a register set is read as one burst: the read words by DMA into dataRead, the values by DMA into an array('H')
+#(BSTIScan: only the changed registers are reported), a write: the CPU raises IRQ 7 and waits for IRQ 6
+#or single=True: one SM with MCLK by side-set (RP2350_PIO_MDIO.mgmt_program(False)), the preamble is part of
+#the command stream: no IRQ latency, MCLK up to SYS_CLK / 4, three SMs free - DIR has to be the GPIO after MDOUT
 
 #clock generator - free running clock, INTs for rising (IRQ 4) and falling edge (IRQ 5)
 #we have to tweak code so that out level changing happens on falling edge, too fast does not work anymore
@@ -20,57 +28,60 @@ def clk():
     #this results in 18.75MHz clock
     #trim this so that other SM changes bits on falling edge when sending
     #it divides freq by 8
+    #the SMs waiting with irq(block, 4/5) raise the flag themselves, the clear releases them: 4 cycles high, 4 low
     wrap_target()
-    irq(4)			[0]	.side(1)			#1
-    irq(clear, 4)		[0]	        			#2
-    nop()			[1]	.side(0)			#3: needed just to create a 50% duty cycle, without it looks wrong
-    irq(5)			[0]	        			#4
-    irq(clear, 5)		[0]	        			#5
-    nop()			[1]     .side(1)			#6: just for the duty cycle as approx. 50%
+    nop()			[2]	.side(1)			#1: 3 cycles high
+    irq(clear, 4)		[0]	        			#2: last cycle high
+    nop()			[2]	.side(0)			#3: 3 cycles low
+    irq(clear, 5)		[0]	        			#4: last cycle low
     wrap()
     
 #preamble generator: at least 32bit with MCLK and MDOUT high
 @rp2.asm_pio(set_init=rp2.PIO.OUT_HIGH)
 def pre():
     wrap_target()
-    pull()								#7: just wait for trigger (any value)
-    set(x, 31)								#8: 32bit preamble
-    set(pins, 1)							#8:
+    wait(1, irq, 7)							#5: wait for the trigger (dataRead or the CPU), clears it
+    set(x, 31)								#6: 32bit preamble
+    set(pins, 1)							#7:
     label("preloop")
-    irq(block, 4)							#10: wait for clock edge
-    jmp(x_dec, "preloop")						#11:
-    push(x)								#12: just trigger main() (any value) to keep going
+    irq(block, 4)							#8: wait for clock edge
+    jmp(x_dec, "preloop")						#9:
+    irq(6)								#10: preamble done
     wrap()
     
 #generate a 32bit write transaction: 2bit (START) 2bit (CMD) 10bit (ADDR) 2bit (TA) 16bit (DATA write)
 @rp2.asm_pio(out_shiftdir=0, pull_thresh=32, out_init=rp2.PIO.OUT_LOW, set_init=rp2.PIO.OUT_LOW, sideset_init=rp2.PIO.OUT_LOW)
 def dataWrite():
     wrap_target()
-    pull()								#13: get 32bit to send out, START (2bit), CMD (2bit), PHY+ADDR (10bit),
+    pull()								#11: get 32bit to send out, START (2bit), CMD (2bit), PHY+ADDR (10bit),
                                                                         #    with TA (2bit) plus 16bit data to write
-    set(x, 31)								#14: 32bit
+    set(x, 31)								#12: 32bit
     label("loop")
-    irq(block, 4)							#15: wait for clock edge
-    out(pins, 1)		.side(1)				#16: shift out now one bit, keep DIR high
-    jmp(x_dec, "loop")							#17: keep going until all 32bits out
-    irq(block, 4)							#18: last bit cycle
-    set(pins, 1)							#19: keep MDOUT high afterwards
+    irq(block, 4)							#13: wait for clock edge
+    out(pins, 1)		.side(1)				#14: shift out now one bit, keep DIR high
+    jmp(x_dec, "loop")							#15: keep going until all 32bits out
+    irq(block, 4)							#16: last bit cycle
+    set(pins, 1)							#17: keep MDOUT high afterwards
     wrap()
     
 #generate a 16bit read transaction: 2bit (START) 2bit (CMD) 10bit (ADDR), 2bit (TA), 16bit (DATA read) - read with falling edge!
-@rp2.asm_pio(out_shiftdir=0, pull_thresh=14, push_thresh=16, out_init=rp2.PIO.OUT_LOW, set_init=rp2.PIO.OUT_LOW, sideset_init=rp2.PIO.OUT_LOW)
+#pull_thresh=32: not used by pull(), but the DMA feeding the words takes its transfer size from it
+@rp2.asm_pio(out_shiftdir=0, pull_thresh=32, push_thresh=16, out_init=rp2.PIO.OUT_LOW, set_init=rp2.PIO.OUT_LOW, sideset_init=rp2.PIO.OUT_LOW)
 def dataRead():
     wrap_target()
-    pull()								#20: wait for CMD prefix to write
+    pull()								#18: wait for CMD prefix to write
+    irq(7)								#19: start the preamble
+    wait(1, irq, 6)							#20: preamble done
     set(x, 15)								#21: START (2bit), CMD (2bit), PHY+ADDR (8bit), TA (2bit, 1.5 used)
     label("loop")
     irq(block, 4)							#22: wait for clock egdge
     out(pins, 1)							#23: shift one bit out
     jmp(x_dec, "loop")							#24: keep going
     
-    set(x, 15)								#25: now 16bit data to read - sampling with falling edge
-    irq(block, 5)							#26: wait a half cycle, other edge, for TA
-    set(pins, 1)		.side(0)				#27: set DIR signal to low (now we read)
+    irq(block, 5)							#25: wait a half cycle, other edge, for TA: right after the
+                                                                        #    last out, a set(x) before it misses this edge
+    set(x, 15)			.side(0)				#26: now 16bit data to read - sampling with falling edge, DIR low
+    set(pins, 1)							#27: keep MDOUT high
     
     label("rx")
     irq(block, 4)							#28: wait for clock edge (falling, to sample)
@@ -83,48 +94,170 @@ def dataRead():
     
 FREQ = 10000000								#max: 18750000MHz, best is <= 10000000, faster gets more wrong
 
-#this is needed to do, otherwise "in(pins,1)" does not work!
-pin_5 = Pin(5, mode=Pin.IN, pull=Pin.PULL_UP)
-
 SM = 4
+DMA_TX = 6						#DMA channel: the read words of a scan
+DMA_RX = 7						#DMA channel: the read values of a scan
+BSTI_PRE = 7						#IRQ flag: start a preamble
+BSTI_PRE_DONE = 6					#IRQ flag: preamble done
+
+#the START and CMD bits (bits 31..28 of the word): BSTI has READ and WRITE swapped against MDIO clause 22,
+#clause 22 only (no clause 45 frames: read45()/write45() are MDIO only)
+BSTI_RD = 0b0101
+BSTI_WR = 0b0110
+
+#the word to put into sm1 (write cycle: value is the data) or into sm2 (read cycle)
+def bsti_word(op, phy, reg, value=0):
+    w = (op << 28) | ((phy & 0x1f) << 23) | ((reg & 0x1f) << 18)
+    if bsti_read(w):
+        return w
+    return w | (2 << 16) | (value & 0xffff)
+
+#a word for a read cycle?
+def bsti_read(word):
+    return (word >> 28) == BSTI_RD
+
+class BSTI:
+
+    #sm_no: first of the 4 SMs (clk, dataWrite, dataRead, pre), pins: MCLK, MDOUT, DIR, MDIN
+    #single: just SM sm_no, with MCLK by side-set (DIR = MDOUT + 1)
+    def __init__(self, sm_no=SM, freq=FREQ, mclk=2, mdout=3, dir=4, mdin=5, dma_tx=DMA_TX, dma_rx=DMA_RX, single=False):
+        self.sm_no = sm_no
+        self.dma_tx = dma_tx
+        self.dma_rx = dma_rx
+        self.single = single
+        self._one = array('H', [0])			#result of read_word(), single SM
+        #this is needed to do, otherwise "in(pins,1)" does not work!
+        self.pin_in = Pin(mdin, mode=Pin.IN, pull=Pin.PULL_UP)
+
+        if single:
+            assert dir == mdout + 1
+            self.sm_read = sm_no
+            self.sm1 = rp2.StateMachine(sm_no, mgmt_prog(False), freq=freq * 4, sideset_base=Pin(mclk),
+                                        out_base=Pin(mdout), in_base=Pin(mdin), set_base=Pin(mdout))
+            self.sm1.active(1)
+            return
+        self.sm_read = sm_no + 2
+
+        #CLK generator: SM0
+        self.sm0 = rp2.StateMachine(sm_no + 0, clk, freq=freq * 8, sideset_base=Pin(mclk)) #times 8 is because of code in clk SM (8 cycles)
+        #write cycle: SM1
+        self.sm1 = rp2.StateMachine(sm_no + 1, dataWrite, out_base=Pin(mdout), set_base=Pin(mdout), sideset_base=Pin(dir))
+        #read cycle: SM2
+        self.sm2 = rp2.StateMachine(sm_no + 2, dataRead, out_base=Pin(mdout), in_base=Pin(mdin), set_base=Pin(mdout), sideset_base=Pin(dir))
+        #prefix 32bit high: SM3 - we use all four SMs
+        self.sm3 = rp2.StateMachine(sm_no + 3, pre, set_base=Pin(mdout))
+        self.sm1.active(1)
+        self.sm2.active(1)
+        self.sm3.active(1)
+        self.sm0.active(1)
+
+    #the words (from bsti_word()) as fed into burst(): one per read cycle, single SM: the command stream
+    def stream(self, words):
+        if not self.single:
+            return array('I', words)
+        cmd = array('I')
+        for w in words:
+            mgmt_encode(cmd, w, 1 if bsti_read(w) else 0, 1)
+        return cmd
+
+    #one read cycle, the word from bsti_word()
+    def read_word(self, word):
+        if self.single:
+            return self.burst(self.stream([word]), self._one)[0]
+        self.sm2.put(word)				#dataRead asks for the preamble itself
+        return self.sm2.get()
+
+    #one write cycle: the preamble from the CPU, returns when the last bit is out
+    def write_word(self, word):
+        if self.single:
+            for w in self.stream([word]):
+                self.sm1.put(w)
+            sm_wait_idle(self.sm_no)
+            return
+        sm_irq_force(self.sm_no, BSTI_PRE)
+        while not sm_irq_take(self.sm_no, BSTI_PRE_DONE):
+            pass
+        self.sm1.put(word)
+        sm_wait_idle(self.sm_no + 1)			#the next preamble must not start before
+
+    def read(self, phy, reg):
+        return self.read_word(bsti_word(BSTI_RD, phy, reg))
+
+    def write(self, phy, reg, value):
+        self.write_word(bsti_word(BSTI_WR, phy, reg, value))
+
+    #read cycles for all words of cmd (array('I') from stream()), the values into out (array('H'), one per read), by DMA
+    def burst(self, cmd, out):
+        sm = self.sm_read
+        sm_dma_get(self.dma_rx, sm, out, len(out))	#arm RX first
+        sm_dma_put(self.dma_tx, sm, cmd, len(cmd))
+        while dma_busy(self.dma_rx):
+            pass
+        return out
+
+#compare a scan with the snapshot before: the indices of the changed values into idx, copy them into prev
+#returns the number of changed values
+@micropython.viper
+def scan_diff(cur: ptr16, prev: ptr16, idx: ptr16, n: int) -> int:
+    k = 0
+    i = 0
+    while i < n:
+        v = cur[i]
+        if v != prev[i]:
+            prev[i] = v
+            idx[k] = i
+            k += 1
+        i += 1
+    return k
+
+#a register set, read as one burst, reporting just the changed registers
+#regs: list of (phy, reg), the words are encoded once
+class BSTIScan:
+
+    def __init__(self, bsti, regs):
+        n = len(regs)
+        self.bsti = bsti
+        self.regs = regs
+        self.cmd = bsti.stream([bsti_word(BSTI_RD, phy, reg) for phy, reg in regs])
+        self.value = array('H', [0 for _ in range(n)])	#the last scan
+        self.prev = array('H', [0 for _ in range(n)])	#the snapshot to compare with
+        self.idx = array('H', [0 for _ in range(n)])	#the changed indices
+        self.first = True				#the first scan reports all
+
+    #one scan: a memoryview of the indices (into regs, value) which have changed since the scan before
+    def scan(self):
+        self.bsti.burst(self.cmd, self.value)
+        if self.first:
+            self.first = False
+            for i in range(len(self.value)):
+                self.prev[i] = self.value[i] ^ 0xffff
+        n = scan_diff(self.value, self.prev, self.idx, len(self.value))
+        return memoryview(self.idx)[:n]
 
-#CLK generator: SM0
-sm0 = rp2.StateMachine(SM + 0, clk, freq=FREQ * 8, sideset_base=Pin(2)) #times 8 is because of code in clk SM (8 cycles)
-sm0.active(1)
-
-#write cycle: SM1
-sm1 = rp2.StateMachine(SM + 1, dataWrite, out_base=Pin(3), set_base=Pin(3), sideset_base=Pin(4))
-sm1.active(1)
- 
-#read cycle: SM2
-sm2 = rp2.StateMachine(SM + 2, dataRead, out_base=Pin(3), in_base=Pin(5), set_base=Pin(3), sideset_base=Pin(4))
-sm2.active(1)
-
-#prefix 32bit high: SM3 - we use all four SMs
-sm3 = rp2.StateMachine(SM + 3, pre, set_base=Pin(3))
-sm3.active(1)
-        
-prevR = 0					    #just to print when changed
-#for testing with scope:
-while True:
-    #Read:
-    sm3.put(0)					    #pre: any value is fine to trigger
-    sm3.get()					    #wait for 32bit clock preamble cycles done
-    sm2.put(0x5A440000)				    #generate 14bits of CMD, 2bit TA (1.5bits) and read 16bit as input - CMD prefix
-    r = sm2.get()				    #get the read result from the READ
-    if prevR != r:
-        prevR = r				    #print just if changed (otherwise slows down too much for scope and IDE)
-        print(hex(r))
-    #Write:
-    sm3.put(0)					    #pre: any value is fine to trigger
-    sm3.get()					    #wait for 32bit clock preamble cycles done
-    sm1.put(0x6A46C082)				    #generate a write, 2bit (START) + 2bit (CMD) + 10bit (ADDR) + 2bit (TA) + 16bit (DATA write)
+if __name__ == "__main__":
+    SCAN = False				    #True: each loop also scans the BMSR (reg 1) of 32 PHYs, reported when changed
+    bsti = BSTI(SM, FREQ)
+    prevR = 0					    #just to print when changed
+    if SCAN:
+        mon = BSTIScan(bsti, [(phy, 1) for phy in range(32)])
+    #for testing with scope:
+    while True:
+        #Read:
+        r = bsti.read(0x14, 0x11)			    #0x5A440000: 14bits of CMD, 2bit TA (1.5bits) and read 16bit as input
+        if prevR != r:
+            prevR = r				    #print just if changed (otherwise slows down too much for scope and IDE)
+            print(hex(r))
+        #Write:
+        bsti.write(0x14, 0x11, 0xC082)		    #0x6A46C082: 2bit (START) + 2bit (CMD) + 10bit (ADDR) + 2bit (TA) + 16bit (DATA write)
+        if SCAN:
+            for i in mon.scan():
+                print(mon.regs[i], hex(mon.value[i]))
 
 #Remark:
 #the 32bit word we write as CMD prefix (for READ and WRITE) has to be encoded properly:
 #bits:
 # 31, 30 : the START bits: clause 22: b01
-# 29, 28 : the CMD bits: here b10 for WRITE, b01 for READ (might be wrong, or if clause 45 - modify!)
+# 29, 28 : the CMD bits: b10 for WRITE, b01 for READ (swapped against MDIO)
 # 27..23 : PHY address
 # 22..18 : REG address (clause 22)
 # 17, 16 : Turn Around bits (2bits on write, 1.5bits on read)
@@ -1,7 +1,26 @@
-import time
 import rp2
 from machine import Pin
-import time
+from array import array
+from rp_util import sm_dma_put, sm_dma_get, dma_busy, sm_wait_idle
+
+#+++++++++++++++++++++++++++++++++++++++++++++++++
+# MDIO (clause 22 and clause 45) with PIO, batched:
+# a list of operations (phy, reg, op, value) is encoded once into a command stream (array('I'))
+# and streamed by DMA into one frame SM, the read results land by DMA in an array('H').
+# pins:
+# GPIO 2: MDC
+# GPIO 3: MDIO (bi-directional)
+# GPIO 4: DIR signal (for the level shifter: high = we drive MDIO, low = the PHY drives it)
+# SM 0: clk - the free running MDC, IRQ 4/5 for the edges
+# SM 1: mdio_frame - preamble (optional, per PHY), the frame, for a read the turn around and 16bit in
+# or single=True: one SM runs it all, MDC by side-set (mgmt_program()): no IRQ latency, 4 SM cycles
+# per MDC period (up to SYS_CLK / 4), three SMs free - DIR has to be the GPIO after MDIO
+# Preamble suppression: PHYs which support it (IEEE 802.3 22.2.4.1.1) can skip the 32bit
+# preamble: MDIO.preamble(phy, False) - the very first access after a reset needs one.
+# Clause 45: (prtad, devad, op, value) with the MDIO45_ ops: ADDRESS, WRITE, READ and
+# POST-READ-INCREMENT-ADDRESS: mdio45_burst() reads a register block with one ADDRESS frame,
+# then one frame per register (instead of an ADDRESS + READ pair per register).
+#+++++++++++++++++++++++++++++++++++++++++++++++++
 
 #clock generator - free running clock, INTs for rising (read) and falling edge (write)
 @rp2.asm_pio(sideset_init=rp2.PIO.OUT_LOW)
@@ -15,92 +34,227 @@ def clk():
     irq(5)			[1]	.side(0)	#3
     irq(clear, 5)		[0]			#4
     wrap()
-    
-@rp2.asm_pio()
-def pre():
-    wrap_target()
-    pull()						#5 : just wait for trigger (any value)
-    set(x, 31)						#6
-    label("preloop")
-    irq(block, 4)					#7
-    irq(block, 4)					#8 : why do we need 2x?, otherwise too short!
-    jmp(x_dec, "preloop")				#9
-    push(x)						#10 : just trigger main() (any value)
-    wrap()
-    
-#generate a 32bit write transaction: 2bit (START) 2bit (CMD) 10bit (ADDR) 2bit (TA) 16bit (DATA write)
-@rp2.asm_pio(out_shiftdir=0, pull_thresh=32, out_init=rp2.PIO.OUT_LOW, set_init=rp2.PIO.OUT_LOW, sideset_init=rp2.PIO.OUT_LOW)
-def dataWrite():
-    wrap_target()
-    pull()						#11
-    
-    set(x, 31)						#12
-    label("loop")
-    irq(block, 4)					#13
-    out(pins, 1)		.side(1)		#14
-    jmp(x_dec, "loop")					#15
-    
-    irq(block, 4)					#16
-    set(pins, 1)		.side(1)		#17
-    wrap()
-    
-#generate a 16bit read transaction: 2bit (START) 2bit (CMD) 10bit (ADDR), 2bit (TA), 16bit (DATA read) - read with rising edge!
-@rp2.asm_pio(out_shiftdir=0, pull_thresh=14, push_thresh=16, out_init=rp2.PIO.OUT_LOW, set_init=rp2.PIO.OUT_LOW, sideset_init=rp2.PIO.OUT_LOW)
-def dataRead():
+
+#one transaction from the command stream, with autopull the words form one bit stream:
+#control word: bits 31..25 = number of bits to send - 1, bit 24 = read, bits 23..0 dropped
+#then the bits to send: [32x 1 preamble] + 32bit write frame, or 14bit read frame (ST, OP, PHYAD/PRTAD, REGAD/DEVAD)
+#a read: turn around, 16bit in, push - and drop the rest of the read frame word
+@rp2.asm_pio(out_shiftdir=0, autopull=True, pull_thresh=32, push_thresh=16, out_init=rp2.PIO.OUT_HIGH, set_init=rp2.PIO.OUT_HIGH, sideset_init=rp2.PIO.OUT_HIGH)
+def mdio_frame():
     wrap_target()
-    pull()						#18
-    
-    set(x, 13)						#19
-    label("loop")
-    irq(block, 4)					#20
-    out(pins, 1)					#21
-    jmp(x_dec, "loop")					#22
-    
-    irq(block, 4)					#23
-    
-    set(pindirs, 0)		.side(0)		#24
-    irq(block, 4)					#25
-    set(x, 15)						#26
-    irq(block, 5)					#27
-    
+    out(x, 7)				.side(1)	#5: bits to send - 1: stall here on the empty FIFO
+    out(y, 1)				.side(1)	#6: read?
+    out(null, 24)			.side(1)	#7: the next word is autopulled
+    label("bitloop")
+    irq(block, 4)			.side(1)	#8: wait for clock edge
+    out(pins, 1)			.side(1)	#9: shift out one bit, keep DIR high
+    jmp(x_dec, "bitloop")		.side(1)	#10
+    jmp(not_y, "end")			.side(1)	#11: a write is done
+
+    irq(block, 4)			.side(1)	#12: turn around
+    set(pindirs, 0)			.side(0)	#13: release MDIO, DIR low (now we read)
+    irq(block, 4)			.side(0)	#14
+    set(x, 15)				.side(0)	#15: 16bit data to read - sampling with rising edge
+    irq(block, 5)			.side(0)	#16
     label("rx")
-    irq(block, 5)					#28
-    in_(pins, 1)					#29
-    jmp(x_dec, "rx")					#30
-    
-    push()						#31
-    set(pindirs, 1)		.side(1)		#32 - full 32 instructions on PIO0
+    irq(block, 5)			.side(0)	#17
+    in_(pins, 1)			.side(0)	#18
+    jmp(x_dec, "rx")			.side(0)	#19
+    push()				.side(0)	#20: the 16bit read to the RX FIFO (DMA)
+    set(pindirs, 1)			.side(1)	#21: we drive MDIO again
+    out(null, 32)			.side(1)	#22: drop the unused bits of the read frame word
+    label("end")
+    irq(block, 4)			.side(1)	#23: last bit cycle
+    set(pins, 1)			.side(1)	#24: keep MDIO high afterwards
     wrap()
-    
+
+#one SM: MDC by side-set, the same command stream as mdio_frame, 4 SM cycles per bit (MDC low 2, high 2)
+#set pins: MDIO (bit 0), DIR (bit 1)
+#mdio = True: MDIO is released for the read, sampled with the rising edge
+#mdio = False (BSTI): MDOUT stays driven (high), MDIN sampled with the falling edge
+def mgmt_program(mdio=True):
+
+    @rp2.asm_pio(out_shiftdir=0, autopull=True, pull_thresh=32, push_thresh=16, sideset_init=rp2.PIO.OUT_LOW,
+                 out_init=rp2.PIO.OUT_HIGH, set_init=(rp2.PIO.OUT_HIGH, rp2.PIO.OUT_HIGH))
+    def mgmt_frame():
+        wrap_target()
+        out(x, 7)			.side(0)	# bits to send - 1: stall here with MDC low
+        out(y, 1)			.side(0)	# read?
+        out(null, 24)			.side(0)
+        label("bitloop")
+        out(pins, 1)			.side(0) [1]	# change with MDC low
+        jmp(x_dec, "bitloop")		.side(1) [1]	# the PHY samples with the rising edge
+        jmp(not_y, "end")		.side(0)	# a write is done
+
+        if mdio:
+            set(pindirs, 2)		.side(0)	# turn around: release MDIO
+            set(pins, 0)		.side(1) [1]	# DIR low (now we read)
+        else:
+            set(pins, 1)		.side(0)	# turn around: MDOUT high, DIR low (now we read)
+            nop()			.side(1) [1]
+        set(x, 15)			.side(0) [1]
+        nop()				.side(1) [1]
+        label("rx")
+        if mdio:
+            nop()			.side(0) [1]
+            in_(pins, 1)		.side(1)	# sample with the rising edge
+            jmp(x_dec, "rx")		.side(1)
+        else:
+            in_(pins, 1)		.side(0)	# sample with the falling edge
+            nop()			.side(0)
+            jmp(x_dec, "rx")		.side(1) [1]
+        push()				.side(0)	# the 16bit read
+        set(pins, 3)			.side(0)	# DIR high, MDIO high
+        if mdio:
+            set(pindirs, 3)		.side(0)	# we drive MDIO again
+        out(null, 32)			.side(0)	# drop the unused bits of the read frame word
+        label("end")
+        set(pins, 3)			.side(0)	# keep MDIO high afterwards
+        wrap()
+
+    return mgmt_frame
+
+_mgmt_prog = {}
+
+#the mgmt_program() variants, built once (PIO instruction memory)
+def mgmt_prog(mdio):
+    p = _mgmt_prog.get(mdio)
+    if p is None:
+        p = mgmt_program(mdio)
+        _mgmt_prog[mdio] = p
+    return p
+
 FREQ = 20000000
+SM_NO = 0						#SM 0..3: PIO0, 4..7: PIO1, 8..11: PIO2
+
+#the ops: ST (2bit) and OP (2bit) of the frame, a read if bit 1 (OP = 1x) is set
+MDIO_WR = 0b0101					#clause 22: ST = 01
+MDIO_RD = 0b0110
+MDIO45_ADDR = 0b0000					#clause 45: ST = 00, the register address for the next frames
+MDIO45_WR = 0b0001
+MDIO45_RD = 0b0011
+MDIO45_RD_INC = 0b0010					#read, then the PHY increments the address
+
+#the bits of one operation: control word, [preamble], frame word
+def mdio_encode(cmd, phy, reg, op, value, pre):
+    rd = (op >> 1) & 1
+    f = (op << 28) | ((phy & 0x1f) << 23) | ((reg & 0x1f) << 18)
+    if not rd:
+        f |= (2 << 16) | (value & 0xffff)
+    mgmt_encode(cmd, f, rd, pre)
+
+#a frame word (bits 31..0: START, OP, PHY, REG, TA, data) as the command stream, rd: a read (14 bits sent)
+def mgmt_encode(cmd, f, rd, pre):
+    n = 14 if rd else 32
+    if pre:
+        n += 32
+    cmd.append(((n - 1) << 25) | (rd << 24))
+    if pre:
+        cmd.append(0xffffffff)
+    cmd.append(f)
+
+class MDIO:
+
+    #sm_no: first of the 2 SMs (clk, frame), pins: MDC, MDIO, DIR
+    #single: just SM sm_no, with MDC by side-set (DIR = MDIO + 1)
+    def __init__(self, sm_no=SM_NO, freq=FREQ, mdc=2, mdio=3, dir=4, dma_tx=4, dma_rx=5, single=False):
+        self.sm_no = sm_no
+        self.dma_tx = dma_tx				#DMA channel to feed the command stream
+        self.dma_rx = dma_rx				#DMA channel to drain the read results
+        self.no_pre = 0					#bit n: PHY n without preamble
+        self._one = array('H', [0])			#result of read()
+
+        if single:
+            assert dir == mdio + 1
+            self.sm_frame = sm_no
+            self.sm1 = rp2.StateMachine(sm_no, mgmt_prog(True), freq=freq * 4, sideset_base=Pin(mdc),
+                                        out_base=Pin(mdio), in_base=Pin(mdio), set_base=Pin(mdio))
+            self.sm1.active(1)
+            return
+        self.sm_frame = sm_no + 1
+        #CLK generator SM0
+        self.sm0 = rp2.StateMachine(sm_no + 0, clk, freq=freq * 6, sideset_base=Pin(mdc))
+        #frame SM1
+        self.sm1 = rp2.StateMachine(sm_no + 1, mdio_frame, out_base=Pin(mdio), in_base=Pin(mdio), set_base=Pin(mdio), sideset_base=Pin(dir))
+        self.sm1.active(1)
+        self.sm0.active(1)
+
+    #preamble suppression per PHY: on = False skips the preamble for this PHY
+    def preamble(self, phy, on=True):
+        if on:
+            self.no_pre &= ~(1 << phy)
+        else:
+            self.no_pre |= 1 << phy
+
+    #encode a list of (phy, reg, op, value) once: returns (command stream, number of reads)
+    #clause 45: (prtad, devad, op, value), value is the register address for MDIO45_ADDR
+    #reuse it with run(), e.g. to poll the link status of many PHYs
+    def batch(self, ops):
+        cmd = array('I')
+        nread = 0
+        no_pre = self.no_pre
+        for phy, reg, op, value in ops:
+            mdio_encode(cmd, phy, reg, op, value, not ((no_pre >> phy) & 1))
+            nread += (op >> 1) & 1
+        return (cmd, nread)
+
+    #run a batch (or a list of operations): the reads in order into out (array('H'), len >= number of reads),
+    #out None: a new array('H') of the reads
+    def run(self, batch, out=None):
+        if not isinstance(batch, tuple):
+            batch = self.batch(batch)
+        cmd, nread = batch
+        sm = self.sm_frame
+        if out is None:
+            out = array('H', [0] * nread)
+        assert len(out) >= nread, "MDIO: %d reads, out holds %d" % (nread, len(out))
+        if nread:
+            sm_dma_get(self.dma_rx, sm, out, nread)	#arm RX first
+        sm_dma_put(self.dma_tx, sm, cmd, len(cmd))
+        while dma_busy(self.dma_tx):
+            pass
+        sm_wait_idle(sm)				#back on out(x, 7): the last frame is done
+        while nread and dma_busy(self.dma_rx):
+            pass
+        return out
+
+    def read(self, phy, reg):
+        self.run([(phy, reg, MDIO_RD, 0)], self._one)
+        return self._one[0]
+
+    def write(self, phy, reg, value):
+        self.run([(phy, reg, MDIO_WR, value)])
+
+    #clause 45: the MMD register addr of PHY (port) prtad, MMD devad
+    def read45(self, prtad, devad, addr):
+        self.run([(prtad, devad, MDIO45_ADDR, addr), (prtad, devad, MDIO45_RD, 0)], self._one)
+        return self._one[0]
+
+    def write45(self, prtad, devad, addr, value):
+        self.run([(prtad, devad, MDIO45_ADDR, addr), (prtad, devad, MDIO45_WR, value)])
+
+    #clause 45: the registers addr.. into out (array('H'), len(out) registers), one burst
+    def read45_block(self, prtad, devad, addr, out):
+        return self.run(mdio45_burst(prtad, devad, addr, len(out)), out)
+
+#clause 45: the ops to read n registers from addr on: one ADDRESS, then n POST-READ-INCREMENT-ADDRESS
+def mdio45_burst(prtad, devad, addr, n):
+    return [(prtad, devad, MDIO45_ADDR, addr)] + [(prtad, devad, MDIO45_RD_INC, 0)] * n
 
-#CLK generator SM0
-sm0 = rp2.StateMachine(0, clk, freq=FREQ * 6, sideset_base=Pin(2))
-sm0.active(1)
-
-#read cycle SM2
-sm2 = rp2.StateMachine(2, dataRead, out_base=Pin(3), in_base=Pin(3), set_base=Pin(3), sideset_base=Pin(4))
-sm2.active(1)
-
-#write cycle SM1
-sm1 = rp2.StateMachine(1, dataWrite, out_base=Pin(3), in_base=Pin(3), set_base=Pin(3), sideset_base=Pin(4))
-sm1.active(1)
-
-sm3 = rp2.StateMachine(3, pre)
-sm3.active(1)
-        
-prevR = 0
-while True:
-    #Read:
-    sm3.put(0)				#pre: any value is fine
-    sm3.get()				#wait for 32bit clock pre cycles done
-    sm2.put(0x1A440000)		#generate 13bits of frame start, 2bit TA and read 16bit
-    r = sm2.get()		#get the read result
-    if prevR != r:
-        prevR = r		#print just if changed (otherwise slows down too much)
-        print(hex(r))
-    #Write
-    sm3.put(0)				#pre: any value is fine
-    sm3.get()				#wait for 32bit clock pre cycles done
-    sm1.put(0x01A44C084)	#generate a write, 2bit (START) + 2bit (CMD) + 10bit (ADDR) + 2bit (TA) + 16bit (DATA write)
+if __name__ == "__main__":
+    mdio = MDIO(SM_NO, FREQ)
+    #link status (BMSR, reg 1) of 16 PHYs in one batch
+    poll = mdio.batch([(phy, 1, MDIO_RD, 0) for phy in range(16)])
+    status = array('H', [0 for _ in range(16)])
+    pma = array('H', [0 for _ in range(32)])
 
+    prevR = 0				#just to print when changed
+    while True:
+        r = mdio.read(0x0D, 0x01)
+        if prevR != r:
+            prevR = r		#print just if changed (otherwise slows down too much)
+            print(hex(r))
+        mdio.write(0x0D, 0x00, 0xC084)
+        mdio.run(poll, status)
+        #clause 45: the first 32 registers of the PMA/PMD MMD (1) of port 0x0D
+        mdio.read45_block(0x0D, 1, 0x0000, pma)
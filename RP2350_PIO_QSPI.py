@@ -1,6 +1,10 @@
 import rp2
 from machine import Pin
+from array import array
 import time
+from rp_util import sm_wait_idle, sm_restart, sm_irq_clear, sm_dma_put, sm_dma_get, dma_busy, DMA_BSWAP, bswap32_bench
+from rp_util import SMRing, SMPingPong, DMA_IRQ, buf_nbytes
+from rp_async import DMAIrq, sm_irq, sm_idle
 
 #+++++++++++++++++++++++++++++++++++++++++++++++++
 # QSPI implementation with PIO:
@@ -17,283 +21,14 @@ import time
 # Remark:
 # the order of the 32bit words written or read are in the wrong "endian":
 # we have to flip the bytes before sending or after reading!
+# bswap32() (rp_util.py) does it in place, or swap=True on the data phase lets the DMA do it (DMA_BSWAP).
+# class QSPI owns the three SMs: QSPI.write(addr, buf), QSPI.read(addr, buf)
+# The data phase (dataWrite, dataRead) is driven by DMA directly from/to
+# the caller's buffer: array('I'), bytearray or a memoryview of them (length a multiple of 4 bytes).
+# AsyncQSPI: the same with "await", done by the PIO/DMA IRQs (rp_async.py), the core is free meanwhile.
+# On a PC: see rp_emu.py, it runs this file against an emulated PIO/DMA.
 #+++++++++++++++++++++++++++++++++++++++++++++++++
 
-#-------------------------------------------------
-# rp_util.py:
-#
-# set set of small functions supporting the use of the PIO
-# we use this in order to free instructions on PIO:
-# example: instead to wait for PIO state machine has completed, e.g. via "push()"
-# and "sm.get()" - we check the FIFO level (or PIO SM status), which saves PIO instructions
-#
-
-PIO0_BASE = const(0x50200000)
-PIO1_BASE = const(0x50300000)
-PIO2_BASE = const(0x50400000)
-
-# register indices into the array of 32 bit registers
-PIO_CTRL = const(0)
-PIO_FSTAT = const(1)
-PIO_FLEVEL = const(3)
-SM_REG_BASE = const(0x32)  # start of the SM state tables
-# register offsets into the per-SM state table
-SMx_CLKDIV = const(0)
-SMx_EXECCTRL = const(1)
-SMx_SHIFTCTRL = const(2)
-SMx_ADDR = const(3)
-SMx_INSTR = const(4)
-SMx_PINCTRL = const(5)
-
-SMx_SIZE = const(6)  # SM state table size
-
-SM_FIFO_RXFULL  = const(0x00000001)
-SM_FIFO_RXEMPTY = const(0x00000100)
-SM_FIFO_TXFULL  = const(0x00010000)
-SM_FIFO_TXEMPTY = const(0x01000000)
-
-@micropython.viper
-def sm_restart(sm: int, program) -> uint:
-    if sm < 4:   # PIO 0
-        pio = ptr32(uint(PIO0_BASE))
-        initial_pc = uint(program[1])
-    elif sm < 8:  # PIO1
-        pio = ptr32(uint(PIO1_BASE))
-        initial_pc = uint(program[2])
-    else:		  # PIO2
-        pio = ptr32(uint(PIO2_BASE))
-        initial_pc = uint(program[3])
-    sm %= 4
-    smx = SM_REG_BASE + sm * SMx_SIZE + SMx_INSTR
-    pio[PIO_CTRL] = 1 << (sm + 4)  # reset the registers
-    # now execute a jmp instruction to the initial PC
-    # Since the code for the unconditional jump is
-    # 0 + binary address, this is effectively the address
-    # to be written in the INSTR register.
-    pio[smx] = initial_pc  # set the actual PC to the start adress
-    return initial_pc
-
-@micropython.viper
-def sm_rx_fifo_level(sm: int) -> int:
-    if sm < 4:   # PIO 0
-        pio = ptr32(uint(PIO0_BASE))
-    elif sm < 8: # PIO1
-        pio = ptr32(uint(PIO1_BASE))
-    else:
-        pio = ptr32(uint(PIO2_BASE))
-    sm %= 4
-    return (pio[PIO_FLEVEL] >> (8 * sm + 4)) & 0x0f
-
-@micropython.viper
-def sm_tx_fifo_level(sm: int) -> int:
-    if sm < 4:   # PIO 0
-        pio = ptr32(uint(PIO0_BASE))
-    elif sm < 8: # PIO1
-        pio = ptr32(uint(PIO1_BASE))
-    else:
-        pio = ptr32(uint(PIO2_BASE))
-    sm %= 4
-    return (pio[PIO_FLEVEL] >> (8 * sm)) & 0x0f
-
-@micropython.viper
-def sm_fifo_status(sm: int) -> int:
-    if sm < 4:   # PIO 0
-        pio = ptr32(uint(PIO0_BASE))
-    elif sm < 8: # PIO1
-        pio = ptr32(uint(PIO1_BASE))
-    else:
-        pio = ptr32(uint(PIO2_BASE))
-    sm %= 4
-    return (pio[PIO_FSTAT] >> sm) & 0x01010101
-
-@micropython.viper
-def sm_fifo_join(sm: int, action: int):
-    if sm < 4:   # PIO 0
-        pio = ptr32(uint(PIO0_BASE))
-    elif sm < 8: # PIO1
-        pio = ptr32(uint(PIO1_BASE))
-    else:
-        pio = ptr32(uint(PIO2_BASE))
-    sm %= 4
-    smx = SM_REG_BASE + sm * SMx_SIZE + SMx_SHIFTCTRL
-
-    if action == 0:  # disable join
-        pio[smx] = ((pio[smx] >> 16) & 0x3fff) << 16
-    elif action == 1:  # join RX
-        pio[smx] = (((pio[smx] >> 16) & 0x3fff) | (1 << 15)) << 16
-    elif action == 2:  # join TX
-        pio[smx] = (((pio[smx] >> 16) & 0x3fff) | (1 << 14)) << 16
-
-#
-# PIO register byte address offsets
-#
-PIO_TXF0 = const(0x10)
-PIO_TXF1 = const(0x14)
-PIO_TXF2 = const(0x18)
-PIO_TXF3 = const(0x1c)
-PIO_RXF0 = const(0x20)
-PIO_RXF1 = const(0x24)
-PIO_RXF2 = const(0x28)
-PIO_RXF3 = const(0x2c)
-
-#
-# DMA registers
-#
-DMA_BASE = const(0x50000000)
-# Register indices into the DMA register table
-READ_ADDR = const(0)
-WRITE_ADDR = const(1)
-TRANS_COUNT = const(2)
-CTRL_TRIG = const(3)
-CTRL_ALIAS = const(4)
-TRANS_COUNT_ALIAS = const(9)
-CHAN_ABORT = const(0x111)  # Address offset / 4
-BUSY = const(1 << 24)
-#
-# Template for assembling the DMA control word
-#
-IRQ_QUIET = const(1)  # do not generate an interrupt
-CHAIN_TO = const(0)  # do not chain
-RING_SEL = const(0)
-RING_SIZE = const(0)  # no wrapping
-HIGH_PRIORITY = const(1)
-EN = const(1)
-#
-# Read from the State machine using DMA:
-# DMA channel, State machine number, buffer, buffer length
-#
-@micropython.viper
-def sm_dma_get(chan:int, sm:int, dst:ptr32, nword:int) -> int:
-
-    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
-    if sm < 4:   # PIO 0
-        pio = ptr32(uint(PIO0_BASE))
-        TREQ_SEL = sm + 4  # range 4-7
-    else:  # PIO1
-        sm %= 4
-        pio = ptr32(int(PIO1_BASE))
-        TREQ_SEL = sm + 12  # range 12 - 13
-    smx = SM_REG_BASE + sm * SMx_SIZE + SMx_SHIFTCTRL  # get the push threshold
-    DATA_SIZE = (pio[smx] >> 20) & 0x1f  # to determine the transfer size
-    smx = DATA_SIZE
-    if DATA_SIZE > 16 or DATA_SIZE == 0:
-        DATA_SIZE = 2  # 32 bit transfer
-    elif DATA_SIZE > 8:
-        DATA_SIZE = 1  # 16 bit transfer
-    else:
-        DATA_SIZE = 0  # 8 bit transfer
-
-    INCR_WRITE = 1  # 1 for increment while writing
-    INCR_READ = 0  # 0 for no increment while reading
-    DMA_control_word = ((IRQ_QUIET << 21) | (TREQ_SEL << 15) | (CHAIN_TO << 11) | (RING_SEL << 10) |
-                        (RING_SIZE << 6) | (INCR_WRITE << 5) | (INCR_READ << 4) | (DATA_SIZE << 2) |
-                        (HIGH_PRIORITY << 1) | (EN << 0))
-    dma[READ_ADDR] = uint(pio) + PIO_RXF0 + sm * 4
-    dma[WRITE_ADDR] = uint(dst)
-    dma[TRANS_COUNT] = nword
-    dma[CTRL_TRIG] = DMA_control_word  # and this starts the transfer
-    return DMA_control_word
-
-#
-# Write to the State machine using DMA:
-# DMA channel, State machine number, buffer, buffer length
-#
-@micropython.viper
-def sm_dma_put(chan:int, sm:int, src:ptr32, nword:int) -> int:
-
-    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
-    if sm < 4:   # PIO 0
-        pio = ptr32(uint(PIO0_BASE))
-        TREQ_SEL = sm  # range 0-3
-    else:  # PIO1
-        sm %= 4
-        pio = ptr32(uint(PIO1_BASE))
-        TREQ_SEL = sm + 8  # range 8-11
-    smx = SM_REG_BASE + sm * SMx_SIZE + SMx_SHIFTCTRL  # get the pull threshold
-    DATA_SIZE = (pio[smx] >> 25) & 0x1f  # to determine the transfer size
-    if DATA_SIZE > 16 or DATA_SIZE == 0:
-        DATA_SIZE = 2  # 32 bit transfer
-    elif DATA_SIZE > 8:
-        DATA_SIZE = 1  # 16 bit transfer
-    else:
-        DATA_SIZE = 0  # 8 bit transfer
-
-    INCR_WRITE = 0  # 1 for increment while writing
-    INCR_READ = 1  # 0 for no increment while reading
-    DMA_control_word = ((IRQ_QUIET << 21) | (TREQ_SEL << 15) | (CHAIN_TO << 11) | (RING_SEL << 10) |
-                        (RING_SIZE << 9) | (INCR_WRITE << 5) | (INCR_READ << 4) | (DATA_SIZE << 2) |
-                        (HIGH_PRIORITY << 1) | (EN << 0))
-    dma[READ_ADDR] = uint(src)
-    dma[WRITE_ADDR] = uint(pio) + PIO_TXF0 + sm * 4
-    dma[TRANS_COUNT] = nword
-    dma[CTRL_TRIG] = DMA_control_word  # and this starts the transfer
-    return DMA_control_word
-
-#
-# UART registers
-#
-UART0_BASE = const(0x40034000)
-UART1_BASE = const(0x40038000)
-
-#
-# Read from UART using DMA:
-# DMA channel, UART number, buffer, buffer length
-#
-@micropython.viper
-def uart_dma_read(chan:int, uart_nr:int, data:ptr32, nword:int) -> int:
-
-    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
-    if uart_nr == 0:   # UART0
-        uart_dr = uint(UART0_BASE)
-        TREQ_SEL = 21
-    else:  # UART1
-        uart_dr = uint(UART1_BASE)
-        TREQ_SEL = 23
-    DATA_SIZE = 0  # byte transfer
-    INCR_WRITE = 1  # 1 for increment while writing
-    INCR_READ = 0  # 0 for no increment while reading
-    DMA_control_word = ((IRQ_QUIET << 21) | (TREQ_SEL << 15) | (CHAIN_TO << 11) | (RING_SEL << 10) |
-                        (RING_SIZE << 9) | (INCR_WRITE << 5) | (INCR_READ << 4) | (DATA_SIZE << 2) |
-                        (HIGH_PRIORITY << 1) | (EN << 0))
-    dma[READ_ADDR] = uart_dr
-    dma[WRITE_ADDR] = uint(data)
-    dma[TRANS_COUNT] = nword
-    dma[CTRL_TRIG] = DMA_control_word  # and this starts the transfer
-    return DMA_control_word
-#
-# Get the current transfer count
-#
-@micropython.viper
-def dma_transfer_count(chan:uint) -> int:
-    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
-    return dma[TRANS_COUNT]
-#
-# Get the current write register value
-#
-@micropython.viper
-def dma_write_addr(chan:uint) -> int:
-    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
-    return dma[WRITE_ADDR]
-
-#
-# Get the current read register value
-#
-@micropython.viper
-def dma_read_addr(chan:uint) -> int:
-    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
-    return dma[READ_ADDR]
-#
-# Abort an transfer
-#
-@micropython.viper
-def dma_abort(chan:uint):
-    dma=ptr32(uint(DMA_BASE))
-    dma[CHAN_ABORT] = 1 << chan
-    while dma[CHAN_ABORT]:
-        time.sleep_us(10)
-
-#-------------------------------------------------
-        
 #RP2350 PIO QSPI example:
 #=======================
 
@@ -332,9 +67,11 @@ def dataWrite():
     jmp(x_dec, "WORD_OUT")	.side(4)	    	#18:
     #push()						#  : wait for done of one 32bit word- otherwise a clock glitch!
     jmp(y_dec, "ALL_DATA_OUT")			    	#19:
-    nop()			.side(6)	    	#20: set nCS high = end of transfer, there is a gap after last SCLK
+    irq(rel(0))			.side(6)	    	#20: set nCS high = end of transfer, there is a gap after last SCLK
+                                                        #  : and raise our IRQ flag: AsyncQSPI waits on it
     wrap()
     #Remark: this generates a gap between the 32bit words sent - but why?
+    #the jmp(y_dec), set(x, 7) and pull() between two words run with SCLK low: +3 SM cycles (rp_piosim.py)
     
 @rp2.asm_pio(in_shiftdir=0, pull_thresh=32, push_thresh=32, autopull=False, autopush=False, sideset_init=(rp2.PIO.OUT_LOW, rp2.PIO.OUT_HIGH, rp2.PIO.OUT_HIGH), set_init=(rp2.PIO.OUT_LOW, rp2.PIO.OUT_LOW, rp2.PIO.OUT_LOW, rp2.PIO.OUT_LOW))
 def dataRead():
@@ -358,50 +95,154 @@ def dataRead():
     wrap()
 
 FREQ = 1000000					        #our frequency to generate (SCLK)
-SM_NO = 4						#PIO2 does not work (yet)!
-
-#the SM for sending the pre-fix: CMD (single-lane), ADDR (32bit, 4-lane), ALT (24bit, 4-lane)
-sm0 = rp2.StateMachine(SM_NO + 0, pio, freq=2*FREQ, sideset_base=Pin(0), out_base=Pin(3))
-sm0.active(1)
-
-#the SM to continue to append a WRITE transaction (no Turn Around)
-sm1 = rp2.StateMachine(SM_NO + 1, dataWrite, freq=2*FREQ, sideset_base=Pin(0), out_base=Pin(3))
-sm1.active(1)
-
-#the SM to continue to append a READ transaction (with 2bit Turn Around)
-sm2 = rp2.StateMachine(SM_NO + 2, dataRead, freq=2*FREQ, sideset_base=Pin(0), in_base=Pin(3), set_base=Pin(3))
-sm2.active(1)
-
-oldR = 0x12345678					#just print changes
-
-while True:
-    #WRITE:
-    sm0.put(0x01010101)
-    sm0.put(0x01234567)
-    sm0.put(0x65432100)
-    while sm_tx_fifo_level(SM_NO + 0) > 0:
-        pass
-    #sm0.get()
-    
-    sm1.put(12 -1)			                #ATT: inside SM it is NUM-1 for NUM loops!
-    for i in range(12):
-        sm1.put(0x12345678)			        #the byte order is "inversed"! flip before to BIG_ENDIAN
-        while sm_tx_fifo_level(SM_NO + 1) > 3:
+SM_NO = 4						#SM 0..3: PIO0, 4..7: PIO1, 8..11: PIO2
+
+#number of 32bit words for the DMA: nword, 0 = all of buf (array('I'), bytearray, memoryview: by its item size)
+def qspi_nword(buf, nword=0):
+    n = buf_nbytes(buf) >> 2
+    if nword == 0:
+        return n
+    assert nword <= n, "QSPI: %d words, the buffer holds %d" % (nword, n)
+    return nword
+
+#the CMD is single-lane (DIO0), but pio() shifts it as 8x 4bit: one CMD bit into bit 0 of each nibble
+def qspi_spread(cmd):
+    w = 0
+    for i in range(8):
+        w |= ((cmd >> i) & 1) << (4 * i)
+    return w
+
+class QSPI:
+
+    #sm_no: first of the 3 SMs (pio, dataWrite, dataRead), pins: SCLK, nCS, DIR = sclk + 0..2, DIO0..3 = dio0 + 0..3
+    def __init__(self, sm_no=SM_NO, freq=FREQ, sclk=0, dio0=3, dma_tx=0, dma_rx=1, wr_cmd=0x55, rd_cmd=0xAA):
+        self.sm_no = sm_no
+        self.dma_tx = dma_tx				#DMA channel to feed dataWrite
+        self.dma_rx = dma_rx				#DMA channel to drain dataRead
+        self.wr_cmd = wr_cmd
+        self.rd_cmd = rd_cmd
+        self._cmd = {}					#opcode: (CMD word, ALT word), encoded once
+        self.stream = None				#the consumer of a continuous READ
+
+        #the SM for sending the pre-fix: CMD (single-lane), ADDR (32bit, 4-lane), ALT (24bit, 4-lane)
+        self.sm0 = rp2.StateMachine(sm_no + 0, pio, freq=2*freq, sideset_base=Pin(sclk), out_base=Pin(dio0))
+        #the SM to continue to append a WRITE transaction (no Turn Around)
+        self.sm1 = rp2.StateMachine(sm_no + 1, dataWrite, freq=2*freq, sideset_base=Pin(sclk), out_base=Pin(dio0))
+        #the SM to continue to append a READ transaction (with 2bit Turn Around)
+        self.sm2 = rp2.StateMachine(sm_no + 2, dataRead, freq=2*freq, sideset_base=Pin(sclk), in_base=Pin(dio0), set_base=Pin(dio0))
+        self.sm0.active(1)
+        self.sm1.active(1)
+        self.sm2.active(1)
+
+    #define an opcode with its 24bit ALT value: the lane-spread words are cached
+    def command(self, cmd, alt=0):
+        p = (qspi_spread(cmd), (alt << 8) & 0xffffffff)
+        self._cmd[cmd] = p
+        return p
+
+    #send the prefix: CMD, ADDR, ALT - wait until all is out (sm0 back on pull())
+    def prefix(self, cmd, addr):
+        p = self._cmd.get(cmd)
+        if p is None:
+            p = self.command(cmd)
+        sm0 = self.sm0
+        sm0.put(p[0])
+        sm0.put(addr)					#ADDR is sent as is: 8x 4bit on 4 lanes
+        sm0.put(p[1])
+        sm_wait_idle(self.sm_no)
+
+    #WRITE transaction: prefix, preload the word count, DMA streams the words from buf into the TX FIFO
+    #swap = True: the byte order is "inversed"! the DMA flips it to BIG_ENDIAN on the fly (e.g. for a bytearray)
+    def write(self, addr, buf, nword=0, cmd=-1, swap=False):
+        nword = qspi_nword(buf, nword)
+        self.prefix(self.wr_cmd if cmd < 0 else cmd, addr)
+        self.sm1.put(nword - 1)				#ATT: inside SM it is NUM-1 for NUM loops!
+        sm_dma_put(self.dma_tx | (DMA_BSWAP if swap else 0), self.sm_no + 1, buf, nword)
+        while dma_busy(self.dma_tx):
             pass
-        #sm1.get()
-
-    #READ:
-    sm0.put(0x10101010)
-    sm0.put(0x87654321)
-    sm0.put(0x12345F00)
-    while sm_tx_fifo_level(SM_NO + 0) > 0:
-        pass
-    #sm0.get()
-    
-    sm2.put(12 - 1)			                #ATT: inside SM it is NUM-1 for NUM loops!
-    for i in range(12):
-        r = sm2.get()		                        #the same issue here: the byte order is "inversed"! flip it back to LITTLE ENDIAN
-        if (oldR != r):
-            oldR = r
-            print(hex(r))
-
+        sm_wait_idle(self.sm_no + 1)			#all words shifted out, nCS high
+        sm_irq_clear(self.sm_no + 1)			#the IRQ flag of dataWrite: nobody waits on it here
+
+    #READ transaction: prefix, arm the DMA on the RX FIFO first, then preload the word count
+    #swap = True: the same issue here: the byte order is "inversed"! the DMA flips it back to LITTLE ENDIAN
+    def read(self, addr, buf, nword=0, cmd=-1, swap=False):
+        nword = qspi_nword(buf, nword)
+        self.prefix(self.rd_cmd if cmd < 0 else cmd, addr)
+        sm_dma_get(self.dma_rx | (DMA_BSWAP if swap else 0), self.sm_no + 2, buf, nword)
+        self.sm2.put(nword - 1)				#ATT: inside SM it is NUM-1 for NUM loops!
+        while dma_busy(self.dma_rx):
+            pass
+        sm_wait_idle(self.sm_no + 2)
+
+    #continuous READ (e.g. a sampling device): prefix, then the DMA fills a ring buffer of nbytes forever
+    #returns the consumer: rp_util.SMRing, or SMPingPong (it uses the DMA channels dma_rx and dma_rx + 1)
+    def read_stream(self, addr, nbytes, pingpong=False, cmd=-1):
+        self.prefix(self.rd_cmd if cmd < 0 else cmd, addr)
+        if pingpong:
+            self.stream = SMPingPong(self.dma_rx, self.sm_no + 2, nbytes)
+        else:
+            self.stream = SMRing(self.dma_rx, self.sm_no + 2, nbytes)
+        self.sm2.put(0xffffffff)			#NUM-1: 4G words, "forever"
+        return self.stream
+
+    #end the continuous READ: stop the DMA, restart dataRead, end the transaction (nCS high, DIR high)
+    def stop_stream(self):
+        self.stream.stop()
+        self.stream = None
+        sm_restart(self.sm_no + 2, dataRead)
+        self.sm2.exec("set(pindirs, 0xf) .side(6)")
+        while self.sm2.rx_fifo():
+            self.sm2.get()
+
+#the same transactions as awaitables: the write is done when dataWrite raises its IRQ flag (nCS high),
+#the read when its DMA channel raises the IRQ; the DMA channels are claimed from rp2.DMA
+class AsyncQSPI(QSPI):
+
+    def __init__(self, sm_no=SM_NO, freq=FREQ, sclk=0, dio0=3, wr_cmd=0x55, rd_cmd=0xAA):
+        self.tx_irq = DMAIrq()
+        self.rx_irq = DMAIrq()
+        super().__init__(sm_no, freq, sclk, dio0, self.tx_irq.channel, self.rx_irq.channel, wr_cmd, rd_cmd)
+
+    async def aprefix(self, cmd, addr):
+        p = self._cmd.get(cmd)
+        if p is None:
+            p = self.command(cmd)
+        sm0 = self.sm0
+        sm0.put(p[0])
+        sm0.put(addr)
+        sm0.put(p[1])
+        await sm_idle(self.sm_no)
+
+    async def write(self, addr, buf, nword=0, cmd=-1, swap=False):
+        nword = qspi_nword(buf, nword)
+        await self.aprefix(self.wr_cmd if cmd < 0 else cmd, addr)
+        done = sm_irq(self.sm_no + 1)
+        self.sm1.put(nword - 1)
+        sm_dma_put(self.dma_tx | (DMA_BSWAP if swap else 0), self.sm_no + 1, buf, nword)
+        await done.wait()
+
+    async def read(self, addr, buf, nword=0, cmd=-1, swap=False):
+        nword = qspi_nword(buf, nword)
+        await self.aprefix(self.rd_cmd if cmd < 0 else cmd, addr)
+        self.rx_irq.clear()
+        sm_dma_get(self.dma_rx | DMA_IRQ | (DMA_BSWAP if swap else 0), self.sm_no + 2, buf, nword)
+        self.sm2.put(nword - 1)
+        await self.rx_irq.wait()
+        await sm_idle(self.sm_no + 2)			#just the last instruction: nCS high
+
+if __name__ == "__main__":
+    qspi = QSPI(SM_NO, FREQ)
+    qspi.command(0x55, 0x654321)			#WRITE: CMD = 0x01010101, ALT = 0x65432100
+    qspi.command(0xAA, 0x12345F)			#READ:  CMD = 0x10101010, ALT = 0x12345F00
+    wbuf = array('I', [0x12345678 for _ in range(12)])
+    rbuf = array('I', [0 for _ in range(12)])
+    oldR = 0x12345678					#just print changes
+    bswap32_bench()
+
+    while True:
+        qspi.write(0x01234567, wbuf)
+        qspi.read(0x87654321, rbuf)
+        for r in rbuf:
+            if (oldR != r):
+                oldR = r
+                print(hex(r))
@@ -1,72 +1,224 @@
 import rp2
 from machine import Pin
+from array import array
+from rp_util import sm_dma_put, sm_dma_get, dma_busy, sm_wait_idle, sm_autopush, sm_shift_thresh, SMModes, DMA_BSWAP, DMA_FIXED, buf_itemsize
 
-@rp2.asm_pio(out_shiftdir=0, autopull=True, pull_thresh=8, autopush=True, push_thresh=8, sideset_init=(rp2.PIO.OUT_LOW), out_init=rp2.PIO.OUT_LOW)
-def spi_cpha0():
-    # Note X must be preinitialised by setup code before first byte, we reload after sending each byte
-    # Would normally do this via exec() but in this case it's in the instruction memory and is only run once
-    set(x, 6)
-    # Actual program body follows
-    wrap_target()
-    pull(ifempty)            .side(0x0)   [1]
-    label("bitloop")
-    out(pins, 1)             .side(0x0)   [1]
-    in_(pins, 1)             .side(0x1)
-    jmp(x_dec, "bitloop")    .side(0x1)
+#+++++++++++++++++++++++++++++++++++++++++++++++++
+# SPI master via PIO, all four modes (CPOL, CPHA), frames of 4..32 bits, MSB first
+# A program is built per mode: spi_program(cpha, cpol, cs), the frame width is set at runtime.
+# cs: the program drives nCS (a set pin): it gets the frame count first and holds nCS low
+# for exactly that many frames, no CPU timing involved (no gap when the TX FIFO runs empty).
+# A frame is one FIFO word, right aligned: a 24bit register is one frame, not three bytes.
+# The data phase is done by DMA from/to the caller's buffers, the DMA transfer size is the
+# frame container: bits <= 8: bytes, <= 16: 16bit, else 32bit (array('B'/'H'/'I'), bytearray,
+# a memoryview of them: by its item size). A byte buffer with 16/32bit containers: the DMA swaps
+# the bytes (DMA_BSWAP), so the bytes go out in buffer order.
+# Half-duplex: write() is TX-only (autopush off: nothing to drain), readinto() is RX-only:
+# the dummy frames come from one word, by a DMA which does not increment (DMA_FIXED).
+# mode(): switches CPHA/CPOL/width on the same SM and pins, e.g. for a fixture alternating devices:
+# the first use of a mode configures the SM (rp2.StateMachine(), its program loaded), later switches
+# only load the saved SM registers (rp_util.SMModes), all programs of the modes stay loaded.
+# A width is a SHIFTCTRL write and a FIFO word: any number of widths, no more instructions.
+#+++++++++++++++++++++++++++++++++++++++++++++++++
 
-    out(pins, 1)             .side(0x0) # last bit (of 8) and prepare next byte shift
-    set(x, 6)                .side(0x0) # Note this could be replaced with mov x, y for programmable frame size
-    in_(pins, 1)             .side(0x1)
-    jmp(not_osre, "bitloop") .side(0x1) # Fallthru if TXF empties
+#CPHA = 0: MOSI changes with the trailing clock edge (and before the first), MISO sampled on the leading edge
+#CPHA = 1: MOSI changes with the leading clock edge, MISO sampled on the trailing edge
+#CPOL: the idle level of SCLK; 4 SM cycles per bit, the clock idles between the frames
+#The frame width is set at runtime, one program per mode: the first word after a (re)start is the
+#width (spi_width()), kept in Y and executed per frame (mov(exec, y)): it drops the unused upper bits
+#of the right aligned frame. mov(osr, osr) resets the shift count, the bit loop ends on the pull
+#threshold (jmp(not_osre)), autopush on the push threshold: both are the width (sm_shift_thresh()).
+#cs: nCS low 4..7 SM cycles before the first clock edge (CPHA = 0: 7), high 1 SM cycle after the
+#last one (measured by rp_piosim.py)
+def spi_program(cpha, cpol, cs=0):
+    I = cpol						#side-set: SCLK idle level
+    A = cpol ^ 1					#side-set: SCLK active level
 
-    #nop()                    .side(0x0)   [1] # CSn back porch - we drive nCS as GPIO
-    wrap()
+    @rp2.asm_pio(out_shiftdir=0, autopull=False, autopush=True, sideset_init=(rp2.PIO.OUT_HIGH if cpol else rp2.PIO.OUT_LOW),
+                 out_init=rp2.PIO.OUT_LOW, set_init=rp2.PIO.OUT_HIGH)
+    def spi_cs():
+        pull()                   .side(I)		# the width: spi_width()
+        mov(y, osr)              .side(I)
+        wrap_target()
+        pull()                   .side(I)		# number of frames - 1: ATT: NUM-1 is needed here!
+        mov(x, osr)              .side(I)
+        set(pins, 0)             .side(I)		# nCS low
+        label("frame")
+        pull()                   .side(I)
+        mov(exec, y)             .side(I)		# out(null, 32 - bits)
+        mov(osr, osr)            .side(I)		# shift count 0: bits to the pull threshold
+        label("bitloop")
+        if cpha:
+            out(pins, 1)         .side(A)   [1]
+            in_(pins, 1)         .side(I)
+            jmp(not_osre, "bitloop") .side(I)
+        else:
+            out(pins, 1)         .side(I)   [1]
+            in_(pins, 1)         .side(A)
+            jmp(not_osre, "bitloop") .side(A)
+        jmp(x_dec, "frame")      .side(I)
+        set(pins, 1)             .side(I)		# nCS high: the next count can follow at once
+        wrap()
 
+    if cs:
+        return spi_cs
+
+    @rp2.asm_pio(out_shiftdir=0, autopull=False, autopush=True, sideset_init=(rp2.PIO.OUT_HIGH if cpol else rp2.PIO.OUT_LOW),
+                 out_init=rp2.PIO.OUT_LOW)
+    def spi_cpha0():
+        pull()                   .side(I)		# the width: spi_width()
+        mov(y, osr)              .side(I)
+        wrap_target()
+        pull()                   .side(I)		# one frame, right aligned - stall here with SCLK idle
+        mov(exec, y)             .side(I)		# out(null, 32 - bits): drop the unused upper bits
+        mov(osr, osr)            .side(I)
+        label("bitloop")
+        out(pins, 1)             .side(I)   [1]
+        in_(pins, 1)             .side(A)
+        jmp(not_osre, "bitloop") .side(A)
+        wrap()
+
+    @rp2.asm_pio(out_shiftdir=0, autopull=False, autopush=True, sideset_init=(rp2.PIO.OUT_HIGH if cpol else rp2.PIO.OUT_LOW),
+                 out_init=rp2.PIO.OUT_LOW)
+    def spi_cpha1():
+        pull()                   .side(I)
+        mov(y, osr)              .side(I)
+        wrap_target()
+        pull()                   .side(I)
+        mov(exec, y)             .side(I)
+        mov(osr, osr)            .side(I)
+        label("bitloop")
+        out(pins, 1)             .side(A)   [1]	# leading edge: next bit out
+        in_(pins, 1)             .side(I)		# trailing edge: sample
+        jmp(not_osre, "bitloop") .side(I)
+        wrap()
+
+    return spi_cpha1 if cpha else spi_cpha0
+
+_spi_prog = {}						#(cpha, cpol, cs): program, built once (PIO instruction memory)
+
+#the program of a mode, built once: the same object for PIOSPI and e.g. rp_pioload.py
+def spi_prog(cpha, cpol, cs=0):
+    key = (cpha, cpol, cs)
+    prog = _spi_prog.get(key)
+    if prog is None:
+        prog = spi_program(*key)
+        _spi_prog[key] = prog
+    return prog
+
+#the width word of spi_program(): out(null, 32 - bits) .side(cpol) (mov(y, y): 32 bits, nothing to drop)
+#as encoded with one side-set bit (bit 12), no delay
+def spi_width(bits, cpol):
+    if bits == 32:
+        return 0xa042 | (cpol << 12)
+    return 0x6060 | (32 - bits) | (cpol << 12)
+
+#number of frames in a buffer, by its item size (a memoryview as its object): a byte buffer holds
+#a frame in 1, 2 or 4 bytes, an array('H'/'I') a frame per item
+def spi_nframe(buf, bits):
+    if buf_itemsize(buf) == 1:
+        return len(buf) // ((bits + 7) >> 3 if bits <= 16 else 4)
+    return len(buf)
+
+#a byte buffer with 16/32bit frames: the DMA swaps the bytes, so they go out in buffer order
+def spi_swap(buf, bits):
+    return DMA_BSWAP if bits > 8 and buf_itemsize(buf) == 1 else 0
 
 class PIOSPI:
 
-    def __init__(self, sm_id, pin_mosi, pin_miso, pin_sclk, cpha=False, cpol=False, freq=1000000):
-        assert(not(cpol or cpha))
+    #bits: frame width 4..32, cs: GPIO for nCS, driven by the PIO (None: the caller drives it)
+    def __init__(self, sm_id, pin_mosi, pin_miso, pin_sclk, cpha=False, cpol=False, freq=1000000,
+                 bits=8, cs=None, dma_tx=2, dma_rx=3):
         #MISO input must be configured as input!
         MISO = Pin(pin_miso, Pin.IN)
-        self._sm = rp2.StateMachine(sm_id, spi_cpha0, freq=4*freq, sideset_base=Pin(pin_sclk), out_base=Pin(pin_mosi), in_base=Pin(pin_miso))
-        self._sm.active(1)
-
-    # Note this code will die spectacularly cause we're not draining the RX FIFO
-    def write_blocking(self, wdata):
-        #this creates Python error message, but hard to see!
-        nCS.value(0)
-        for b in wdata:
-            self._sm.put(b << 24)
-        nCS.value(1)
-
-    def read_blocking(self, n):
-        #how can this work without to shift out anything on MOSI?
-        data = []
-        for i in range(n):
-            data.append(self._sm.get() & 0xff)
-        return data
+        self._sm_id = sm_id
+        self._tx = dma_tx
+        self._rx = dma_rx
+        self._cs = cs is not None
+        self._dummy = array('I', [0])			#the frame sent by readinto()
+        self._pins = dict(freq=4*freq, sideset_base=Pin(pin_sclk), out_base=Pin(pin_mosi), in_base=Pin(pin_miso),
+                          set_base=None if cs is None else Pin(cs))
+        self._sm = rp2.StateMachine(sm_id)
+        self._modes = SMModes(sm_id)
+        self.mode(cpha, cpol, bits)
+
+    #switch to another mode or frame width: between transactions, the same pins and SCLK
+    def mode(self, cpha, cpol, bits=8):
+        assert 4 <= bits <= 32
+        key = (1 if cpha else 0, 1 if cpol else 0)
+        if not self._modes.select(key):
+            prog = spi_prog(key[0], key[1], 1 if self._cs else 0)
+            self._sm.init(prog, **self._pins)
+            self._modes.add(key, prog)
+            self._sm.active(1)
+        sm_shift_thresh(self._sm_id, bits, bits)	#the frame width, the DMA transfer size
+        self._sm.put(spi_width(bits, key[1]))		#into Y: the program is at its start again
+        self._bits = bits
+        self._cpol = key[1]
+        self._push = 1					#autopush on: full duplex or RX-only
+
+    #full duplex: nframe frames (0 = all of wbuf) out of wbuf, the frames read into rbuf (can be wbuf)
+    def write_readinto(self, wbuf, rbuf, nframe=0):
+        bits = self._bits
+        if nframe == 0:
+            nframe = spi_nframe(wbuf, bits)
+        assert spi_nframe(rbuf, bits) >= nframe
+        swap = spi_swap(wbuf, bits)
+        self._transfer(wbuf, swap, rbuf, swap, nframe)
+
+    #RX-only: nframe frames (0 = all of buf) into buf, each frame sends the byte write in all its bytes
+    #(as MicroPython SPI.readinto()), the TX DMA reads it again and again from one word
+    def readinto(self, buf, write=0x00, nframe=0):
+        bits = self._bits
+        if nframe == 0:
+            nframe = spi_nframe(buf, bits)
+        self._dummy[0] = (write & 0xff) * 0x01010101
+        swap = spi_swap(buf, bits)
+        self._transfer(self._dummy, DMA_FIXED, buf, swap, nframe)
+
+    #TX-only: nframe frames (0 = all of wbuf), nothing is pushed into the RX FIFO
+    #returns when the last bit is out
+    def write(self, wbuf, nframe=0):
+        bits = self._bits
+        if nframe == 0:
+            nframe = spi_nframe(wbuf, bits)
+        swap = spi_swap(wbuf, bits)
+        if self._push:
+            sm_autopush(self._sm_id, 0)
+            self._push = 0
+        if self._cs:
+            self._sm.put(nframe - 1)
+        sm_dma_put(self._tx | swap, self._sm_id, wbuf, nframe)
+        while dma_busy(self._tx):
+            pass
+        sm_wait_idle(self._sm_id)			#back on pull(): all frames out (and nCS high)
+
+    def _transfer(self, wbuf, wflags, rbuf, rflags, nframe):
+        if not self._push:
+            self._sm.exec("mov(isr, null) .side(%d)" % self._cpol)	#clears the ISR filled by the TX-only in()s, keeps Y
+            sm_autopush(self._sm_id, 1)
+            self._push = 1
+        sm_dma_get(self._rx | rflags, self._sm_id, rbuf, nframe)	#arm RX first: it must not miss a frame
+        if self._cs:
+            self._sm.put(nframe - 1)				#the transaction length: nCS low for nframe frames
+        sm_dma_put(self._tx | wflags, self._sm_id, wbuf, nframe)
+        while dma_busy(self._rx):
+            pass
 
     def write_read_blocking(self, wdata):
-        rdata = []
-        nCS.value(0)
-        for b in wdata:
-            self._sm.put(b << 24)
-            rdata.append(self._sm.get() & 0xff)
-        nCS.value(1)
-        return rdata
-    
-print("PIO SPI")
-nCS = Pin(0, Pin.OUT)
-nCS.value(1)
-spi = PIOSPI(0, 3, 4, 2, freq=15000000)
-    
-while True:
-    #after 1 MHz SCLK - the clock becomes not 50% duty cycle and slower,
-    #the max. SCLK is 37,500,000 Hz, but beyond 15.1 MHz we get bit errors on MISO!
-    #just 1MHz seems to be OK for 50% duty cycle
-    nCS.value(0)
-    wdata = [1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16]
-    rdata = spi.write_read_blocking(wdata)
-    nCS.value(1)
-    print(rdata)
\ No newline at end of file
+        rdata = bytearray(wdata)
+        self.write_readinto(rdata, rdata)
+        return list(rdata)
+
+if __name__ == "__main__":
+    print("PIO SPI")
+    spi = PIOSPI(0, 3, 4, 2, freq=15000000, bits=32, cs=0)
+    wbuf = bytearray([1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16])
+    rbuf = bytearray(len(wbuf))
+
+    while True:
+        #after 1 MHz SCLK - the clock becomes not 50% duty cycle and slower,
+        #the max. SCLK is 37,500,000 Hz, but beyond 15.1 MHz we get bit errors on MISO!
+        #just 1MHz seems to be OK for 50% duty cycle
+        spi.write_readinto(wbuf, rbuf)
+        print(rbuf)
@@ -1,64 +1,173 @@
 #memory read via MircoPython
+#
+# block reads for diagnostics: a region is read in chunks into a preallocated buffer, no call per word
+# - read_block(addr, buf, nword): nword 32bit words from addr into buf, asm_thumb with a load/store
+#   multiple loop (4 words per LDMIA/STMIA), on a PC (rp_emu.py) the viper loop
+# - dump(addr, nword): a hex dump (16 bytes per line, address first) or the raw bytes (binary=True),
+#   chunk by chunk, then a line with the CRC32 of all bytes: compare it on the PC side
+# - search(addr, nword, pattern, mask): the addresses of the words matching pattern (under mask)
+# - snapshot(addr, nword), compare(addr, snap): the words changed since the snapshot
+# ATT: reads have side effects on some registers (RX FIFOs of PIO and UART pop a word), an address
+# without a device (a gap in a peripheral block) is a bus fault: read only what is there
 
-import rp2
+import sys
+import binascii
+import uctypes
+from array import array
+from rp_util import buf_nbytes
+
+CHUNK = 256		# words per read_block() of dump(), search(), compare(): the buffer is allocated once
 
 @micropython.asm_thumb
 def ReadMem(r0):
     ldr(r0, [r0, 0])
-   
+
 def tohex(val, nbits):
   return hex((val + (1 << nbits)) % (1 << nbits))
 
-print("bootrom:")
-v = ReadMem(0x0)	#SP top
-print(tohex(v, 32))
-v = ReadMem(0x4)	#ResetHandler
-print(tohex(v, 32))
-v = ReadMem(0x8)	#NMI - enabled always
-print(tohex(v, 32))
-v = ReadMem(0xc)	#HardFault - enabled always
-print(tohex(v, 32))
-v = ReadMem(0x10)	#memory fault!
-print(tohex(v, 32))
-v = ReadMem(0x14)	#bus fault!
-print(tohex(v, 32))
-
-v = ReadMem(0x18)
-print(tohex(v, 32))
-v = ReadMem(0x1C)
-print(tohex(v, 32))
-v = ReadMem(0x20)
-print(tohex(v, 32))
-v = ReadMem(0x24)
-print(tohex(v, 32))
-v = ReadMem(0x28)
-print(tohex(v, 32))
-v = ReadMem(0x2C)
-print(tohex(v, 32))
-v = ReadMem(0x30)
-print(tohex(v, 32))
-v = ReadMem(0x34)
-print(tohex(v, 32))
-v = ReadMem(0x38)
-print(tohex(v, 32))
-v = ReadMem(0x3C)
-print(tohex(v, 32))
-v = ReadMem(0x40)
-print(tohex(v, 32))
-v = ReadMem(0x44)
-print(tohex(v, 32))
-v = ReadMem(0x48)
-print(tohex(v, 32))
-
-print("chip ID:")
-v = ReadMem(0x40000000)
-print(tohex(v, 32))
-v = ReadMem(0x40000004)
-print(tohex(v, 32))
-v = ReadMem(0x40000008)
-print(tohex(v, 32))
-v = ReadMem(0x40000014)
-print(tohex(v, 32))
-
-v = ReadMem(0x2f8)
-print(tohex(v, 32))
+@micropython.asm_thumb
+def read_block_asm(r0, r1, r2):	# r0 = address, r1 = buffer, r2 = number of 32bit words
+    b(LOOP4_END)
+    label(LOOP4)
+    data(2, 0xc878)		# ldmia(r0!, {r3-r6})
+    data(2, 0xc178)		# stmia(r1!, {r3-r6})
+    sub(r2, 4)
+    label(LOOP4_END)
+    cmp(r2, 4)
+    bge(LOOP4)
+    b(LOOP_END)
+    label(LOOP)
+    ldr(r3, [r0, 0])
+    str(r3, [r1, 0])
+    add(r0, 4)
+    add(r1, 4)
+    sub(r2, 1)
+    label(LOOP_END)
+    cmp(r2, 0)
+    bgt(LOOP)
+
+@micropython.viper
+def read_block_viper(addr: ptr32, buf: ptr32, nword: int):
+    for i in range(nword):
+        buf[i] = addr[i]
+
+_read = read_block_asm if sys.platform == "rp2" else read_block_viper
+
+#nword words (0: all the buffer holds) from addr into buf (array('I')), or into the address of a buffer:
+#then nword is required and not checked
+def read_block(addr, buf, nword=0):
+    if isinstance(buf, int):
+        assert nword > 0, "read_block: nword is required for a buffer address"
+    else:
+        n = buf_nbytes(buf) >> 2
+        if nword == 0:
+            nword = n
+        assert nword <= n, "read_block: %d words, the buffer holds %d" % (nword, n)
+    _read(addr, buf, nword)
+    return buf
+
+_chunk = None
+_chunk_bytes = None
+_idx = None
+
+#the chunk buffer (words), a bytes view of it and the indices found in a chunk (search(), compare())
+def _chunk_buf():
+    global _chunk, _chunk_bytes, _idx
+    if _chunk is None:
+        _chunk = array('I', [0] * CHUNK)
+        _chunk_bytes = memoryview(uctypes.bytearray_at(uctypes.addressof(_chunk), 4 * CHUNK))
+        _idx = array('I', [0] * CHUNK)
+    return _chunk
+
+#out: a stream (default: the console), binary: the raw bytes (little endian words) instead of hex lines
+#returns the CRC32 of the bytes, written as the last line
+def dump(addr, nword, binary=False, out=None):
+    if out is None:
+        out = sys.stdout.buffer if binary else sys.stdout
+    buf = _chunk_buf()
+    crc = 0
+    a = addr
+    while nword > 0:
+        n = min(nword, CHUNK)
+        read_block(a, buf, n)
+        data = _chunk_bytes[:4 * n]
+        crc = binascii.crc32(data, crc)
+        if binary:
+            out.write(data)
+        else:
+            for i in range(0, 4 * n, 16):
+                out.write("%08x: %s\n" % (a + i, binascii.hexlify(data[i:i + 16], " ").decode()))
+        a += 4 * n
+        nword -= n
+    line = "crc32 %08x\n" % crc
+    out.write(("\n" + line).encode() if binary else line)
+    return crc
+
+#the indices of the words in buf[:n] with (word & mask) == pattern, into idx, returns how many (max. len(idx))
+@micropython.viper
+def find_words(buf: ptr32, n: int, pattern: uint, mask: uint, idx: ptr32, nmax: int) -> int:
+    k = 0
+    for i in range(n):
+        if (uint(buf[i]) & mask) == pattern:
+            if k < nmax:
+                idx[k] = i
+            k += 1
+    return k
+
+#the indices of the words differing between a[:n] and b[:n], into idx, returns how many
+@micropython.viper
+def diff_words(a: ptr32, b: ptr32, n: int, idx: ptr32, nmax: int) -> int:
+    k = 0
+    for i in range(n):
+        if a[i] != b[i]:
+            if k < nmax:
+                idx[k] = i
+            k += 1
+    return k
+
+#the addresses of the words matching pattern under mask, at most nmax
+def search(addr, nword, pattern, mask=0xffffffff, nmax=64):
+    buf = _chunk_buf()
+    idx = _idx
+    found = []
+    a = addr
+    pattern &= mask
+    while nword > 0 and len(found) < nmax:
+        n = min(nword, CHUNK)
+        read_block(a, buf, n)
+        k = min(find_words(buf, n, pattern, mask, idx, CHUNK), nmax - len(found))
+        found.extend(a + 4 * idx[i] for i in range(k))
+        a += 4 * n
+        nword -= n
+    return found
+
+def snapshot(addr, nword):
+    return read_block(addr, array('I', [0] * nword))
+
+#the words changed since snap (taken at addr): [(address, old, new)], at most nmax
+def compare(addr, snap, nmax=64):
+    buf = _chunk_buf()
+    idx = _idx
+    changed = []
+    for off in range(0, len(snap), CHUNK):
+        n = min(len(snap) - off, CHUNK)
+        read_block(addr + 4 * off, buf, n)
+        k = diff_words(buf, memoryview(snap)[off:off + n], n, idx, CHUNK)
+        for i in range(min(k, nmax - len(changed))):
+            j = idx[i]
+            changed.append((addr + 4 * (off + j), snap[off + j], buf[j]))
+        if len(changed) >= nmax:
+            break
+    return changed
+
+if __name__ == "__main__":
+    print("bootrom:")
+    dump(0x0, 0x4c >> 2)	#SP top, ResetHandler, NMI, HardFault, memory fault, bus fault, ...
+    print("chip ID:")
+    for a in (0x40000000, 0x40000004, 0x40000008, 0x40000014):
+        print(tohex(ReadMem(a), 32))
+    print(tohex(ReadMem(0x2f8), 32))
+    print("TIMER0 TIMERAWH, TIMERAWL: the words changed since the snapshot")
+    snap = snapshot(0x400b0024, 2)
+    for a, old, new in compare(0x400b0024, snap):
+        print("%08x: %08x -> %08x" % (a, old, new))
@@ -0,0 +1,103 @@
+#-------------------------------------------------
+# rp_async.py:
+#
+# asyncio awaitables for the PIO/DMA transactions, instead of spin-polling the FIFOs:
+# the completion comes from an interrupt, the ISR sets a ThreadSafeFlag, the task waits on it
+# and the core runs the other tasks in the meantime (e.g. the host link)
+# - DMA channel done:  DMAIrq, a claimed rp2.DMA channel, started with DMA_IRQ (not IRQ_QUIET)
+# - PIO IRQ flag 0..3: pio_irq(n).flag(i), raised by a SM program with irq(rel(0)) or irq(i)
+# - no IRQ source:     sm_idle(), sm_get(), dma_abort() poll, but give up the core in between
+#
+# sm: the state machine number as for rp2.StateMachine(): 0..3 PIO0, 4..7 PIO1, 8..11 PIO2
+# On a PC: rp_emu.py provides a stand-in asyncio and raises the IRQs of the emulated PIO/DMA.
+#-------------------------------------------------
+
+import asyncio
+import rp2
+from rp_util import sm_stall_clear, sm_stalled, sm_irq_clear, dma_abort_start, dma_aborting
+
+#
+# a DMA channel (claimed from rp2, use .channel with the rp_util DMA functions) and its done flag
+#
+class DMAIrq:
+
+    def __init__(self):
+        self.dma = rp2.DMA()
+        self.channel = self.dma.channel
+        self.flag = asyncio.ThreadSafeFlag()
+        self.dma.irq(self._isr, hard=True)
+
+    def _isr(self, dma):
+        self.flag.set()
+
+    #call it before the channel is started: a late IRQ of the transfer before must not count
+    def clear(self):
+        self.flag.clear()
+
+    async def wait(self):
+        await self.flag.wait()
+
+    def close(self):
+        self.dma.irq(None)
+        self.dma.close()
+
+#
+# the IRQ flags 0..3 of a PIO block: one handler per block, a ThreadSafeFlag per flag
+#
+class PIOIrq:
+
+    def __init__(self, pio):
+        self.flags = [asyncio.ThreadSafeFlag() for _ in range(4)]
+        self.pio = rp2.PIO(pio)
+        self.pio.irq(self._isr, trigger=rp2.PIO.IRQ_SM0 | rp2.PIO.IRQ_SM1 | rp2.PIO.IRQ_SM2 | rp2.PIO.IRQ_SM3,
+                     hard=True)
+
+    def _isr(self, pio):
+        f = pio.irq().flags() >> 8		#IRQ_SM0 is bit 8: the PIO IRQ flags are cleared already
+        i = 0
+        while f:
+            if f & 1:
+                self.flags[i].set()
+            f >>= 1
+            i += 1
+
+    def flag(self, i):
+        return self.flags[i]
+
+_pio_irq = {}
+
+#the PIOIrq of a PIO block (0..2), created once: a second handler would replace the first
+def pio_irq(pio):
+    p = _pio_irq.get(pio)
+    if p is None:
+        p = PIOIrq(pio)
+        _pio_irq[pio] = p
+    return p
+
+#the flag a SM raises with irq(rel(0)), cleared (PIO and flag): arm it before the SM can raise it
+def sm_irq(sm):
+    f = pio_irq(sm >> 2).flag(sm & 3)
+    sm_irq_clear(sm)
+    f.clear()
+    return f
+
+#
+# no interrupt for these: poll, but let the other tasks run
+#
+
+#the SM has stalled on pull(): all bits out (see rp_util.sm_wait_idle())
+async def sm_idle(sm):
+    sm_stall_clear(sm)
+    while not sm_stalled(sm):
+        await asyncio.sleep_ms(0)
+
+#get() from a rp2.StateMachine, without blocking the core while the RX FIFO is empty
+async def sm_get(sm, shift=0):
+    while sm.rx_fifo() == 0:
+        await asyncio.sleep_ms(0)
+    return sm.get(None, shift)
+
+async def dma_abort(chan):
+    dma_abort_start(chan)
+    while dma_aborting(chan):
+        await asyncio.sleep_ms(0)
@@ -0,0 +1,223 @@
+#-------------------------------------------------
+# rp_bench.py:
+#
+# throughput and latency of the bus drivers, the same code on the board and on a PC (rp_emu.py):
+# - spi_hw: the SPI peripheral (machine.SPI, as RP2350_SPI.py), nCS by the CPU
+# - pio_spi, pio_spi_cs: RP2350_PIO_SPI.py without and with nCS by the PIO
+# - qspi_write, qspi_read: RP2350_PIO_QSPI.py, prefix + data phase
+# - mdio, mdio_1sm: RP2350_PIO_MDIO.py (clk + frame SM, single SM), batches of register reads
+# - bsti, bsti_1sm: RP2350_PIO_BSTI.py (4 SMs, single SM), bursts of register reads
+# per driver and transfer size a CSV line:
+#   driver,bytes,us,bytes_per_s,ovh_us,cpu_us,gap_us
+# - us: one transaction (call), the mean of REPEAT calls, the first call is not counted
+# - ovh_us: us minus the time of the bits on the wire at the bus clock: what the call costs beyond
+#   the wire (Python, SM/DMA setup, FIFO latency, gaps), the part a faster CPU (or a better driver) can save
+# - cpu_us: us minus the time the driver waits on the end of the transfer: its dma_busy() spins and
+#   sm_wait_idle() calls are timed. What the CPU has to do per call, the rest is free for other work with
+#   an async driver. spi_hw: cpu_us = us, machine.SPI moves the bytes by the CPU. On the board only, -1 on
+#   a PC (the emulated CPU is charged for its register accesses, not for the Python of a call)
+# - gap_us: the time between two frames (words) the PIO program adds, from rp_piosim.py: on a PC only,
+#   -1 on the board (and for the drivers without a PIO program to simulate)
+# The SMs 0..3 (PIO0) and the default DMA channels of the drivers are used, one driver after the other.
+# On a PC the SMs run the programs (rp_emu.py, cycle accurate by rp_piosim.py), no device on the pins,
+# the CPU by its register accesses only: compare drivers and clocks on a PC, measure on the board.
+# usage: python3 rp_bench.py, or on the board: import rp_bench; rp_bench.bench("bench.csv")
+#-------------------------------------------------
+
+import sys
+if sys.platform != "rp2" and "rp2" not in sys.modules:
+    import rp_emu
+    rp_emu.install()
+
+import time
+from array import array
+import rp2
+from machine import Pin, SPI
+import rp_util
+
+REPEAT = 10
+SIZES = (4, 64, 1024)					#bytes per transaction: SPI, QSPI
+NREGS = (1, 8, 32)					#registers per transaction: MDIO, BSTI (2 bytes each)
+#bus clock: SCLK, MDC, MCLK in Hz
+CLOCK = {"spi": 10000000, "qspi": 10000000, "mdio": 2500000, "bsti": 10000000}
+
+emu = sys.modules.get("rp_emu")				#on a PC: the emulation
+gaps = {}						#on a PC: driver: SM cycles between two frames (rp_piosim.py)
+
+#the waits on the DMA/SM of the drivers (rp_util helpers, as imported by the driver modules), timed
+WAITS = ("dma_busy", "sm_wait_idle")
+_ticks = time.ticks_us
+_wait = [0, None]					#ticks waited, the start of a dma_busy() spin
+
+#a dma_busy() spin: from its first call to the call which returns 0
+def _busy(fn):
+    def busy(chan):
+        if _wait[1] is None:
+            _wait[1] = _ticks()
+        r = fn(chan)
+        if not r:
+            _wait[0] += time.ticks_diff(_ticks(), _wait[1])
+            _wait[1] = None
+        return r
+    return busy
+
+def _idle(fn):
+    def idle(sm):
+        t0 = _ticks()
+        fn(sm)
+        _wait[0] += time.ticks_diff(_ticks(), t0)
+    return idle
+
+#time the waits of a driver module (on the board), on=False: the rp_util helpers again
+def _timed(mod, on=True):
+    if emu:
+        return
+    for name, wrap in zip(WAITS, (_busy, _idle)):
+        if hasattr(mod, name):
+            fn = getattr(rp_util, name)
+            setattr(mod, name, wrap(fn) if on else fn)
+
+class Bench:
+
+    def __init__(self, path=None):
+        self.rows = []
+        self.f = open(path, "w") if path else None
+        self._line("driver,bytes,us,bytes_per_s,ovh_us,cpu_us,gap_us")
+
+    def _line(self, s):
+        print(s)
+        if self.f:
+            self.f.write(s + "\n")
+
+    #op(): one transaction of nbytes, wire_us: the time of its bits on the wire
+    def run(self, name, op, nbytes, wire_us, gap_us=-1, repeat=REPEAT):
+        op()						#program load, allocations
+        w0 = _wait[0]
+        t0 = time.ticks_us()
+        for _ in range(repeat):
+            op()
+        us = time.ticks_diff(time.ticks_us(), t0) / repeat
+        cpu_us = -1 if emu else us - (_wait[0] - w0) / repeat
+        row = (name, nbytes, us, int(nbytes * 1000000 / us) if us else 0, us - wire_us, cpu_us, gap_us)
+        self.rows.append(row)
+        self._line("%s,%d,%.1f,%d,%.1f,%.1f,%.3f" % row)
+        return row
+
+    def close(self):
+        if self.f:
+            self.f.close()
+            self.f = None
+
+#the gap of the program of a driver in us, SM clock sm_hz
+def _gap(name, sm_hz):
+    n = gaps.get(name)
+    return -1 if n is None else n * 1000000 / sm_hz
+
+#stop the SMs, free the instruction memory of PIO0 for the next driver, the waits of mod untimed
+def _release(sms, progs, mod):
+    _timed(mod, False)
+    for sm in sms:
+        sm.active(0)
+    pio = rp2.PIO(0)
+    for p in progs:
+        pio.remove_program(p)
+
+def bench_spi_hw(b, clk):
+    spi = SPI(0, clk, polarity=0, phase=0)
+    ncs = Pin(21, Pin.OUT, value=1)
+    for n in SIZES:
+        w = bytearray(n)
+        r = bytearray(n)
+        def op():
+            ncs.value(0)
+            spi.write_readinto(w, r)
+            ncs.value(1)
+        b.run("spi_hw", op, n, 8 * n * 1000000 / clk)
+    spi.deinit()
+
+def bench_pio_spi(b, clk, cs=None):
+    import RP2350_PIO_SPI as pspi
+    name = "pio_spi" if cs is None else "pio_spi_cs"
+    _timed(pspi)
+    spi = pspi.PIOSPI(0, 3, 4, 2, freq=clk, cs=cs)
+    for n in SIZES:
+        w = bytearray(n)
+        r = bytearray(n)
+        b.run(name, lambda: spi.write_readinto(w, r), n, 8 * n * 1000000 / clk, _gap(name, 4 * clk))
+    _release((spi._sm,), pspi._spi_prog.values(), pspi)
+
+def bench_qspi(b, clk):
+    import RP2350_PIO_QSPI as qspi
+    _timed(qspi)
+    dev = qspi.QSPI(0, clk)
+    bufs = [array('I', [0] * (n >> 2)) for n in SIZES]
+    for buf in bufs:
+        n = len(buf) << 2
+        b.run("qspi_write", lambda: dev.write(0, buf), n, (22 + 2 * n) * 1000000 / clk, _gap("qspi_write", 2 * clk))
+    for buf in bufs:
+        n = len(buf) << 2
+        b.run("qspi_read", lambda: dev.read(0, buf), n, (24 + 2 * n) * 1000000 / clk, _gap("qspi_read", 2 * clk))
+    _release((dev.sm0, dev.sm1, dev.sm2), (qspi.pio, qspi.dataWrite, qspi.dataRead), qspi)
+
+#reads of the BMSR of PHY 0x0d, with preamble: 64 MDC periods each
+def bench_mdio(b, clk, single=False):
+    import RP2350_PIO_MDIO as mdio_mod
+    name = "mdio_1sm" if single else "mdio"
+    _timed(mdio_mod)
+    md = mdio_mod.MDIO(0, clk, single=single)
+    for k in NREGS:
+        batch = md.batch([(0x0d, 1, mdio_mod.MDIO_RD, 0)] * k)
+        out = array('H', [0] * k)
+        b.run(name, lambda: md.run(batch, out), 2 * k, 64 * k * 1000000 / clk,
+              _gap(name, (4 if single else 6) * clk))
+    if single:
+        _release((md.sm1,), (mdio_mod.mgmt_prog(True),), mdio_mod)
+    else:
+        _release((md.sm0, md.sm1), (mdio_mod.clk, mdio_mod.mdio_frame), mdio_mod)
+
+def bench_bsti(b, clk, single=False):
+    import RP2350_PIO_BSTI as bsti_mod
+    name = "bsti_1sm" if single else "bsti"
+    _timed(bsti_mod)
+    bs = bsti_mod.BSTI(0, clk, single=single)
+    for k in NREGS:
+        cmd = bs.stream([bsti_mod.bsti_word(bsti_mod.BSTI_RD, 0x0d, 1)] * k)
+        out = array('H', [0] * k)
+        b.run(name, lambda: bs.burst(cmd, out), 2 * k, 64 * k * 1000000 / clk, _gap(name, (4 if single else 8) * clk))
+    if single:
+        _release((bs.sm1,), (bsti_mod.mgmt_prog(False),), bsti_mod)
+    else:
+        _release((bs.sm0, bs.sm1, bs.sm2, bs.sm3), (bsti_mod.clk, bsti_mod.dataWrite, bsti_mod.dataRead, bsti_mod.pre), bsti_mod)
+
+#the gaps of the programs, in SM cycles, by rp_piosim.py (CPython only)
+def piosim_gaps():
+    import rp_piosim
+    import RP2350_PIO_QSPI as qspi
+    import RP2350_PIO_SPI as pspi
+    import RP2350_PIO_MDIO as mdio_mod
+    import RP2350_PIO_BSTI as bsti_mod
+    res = rp_piosim.check_qspi(qspi, verbose=False)
+    res.update(rp_piosim.check_spi(pspi, verbose=False))
+    res.update(rp_piosim.check_mgmt(mdio_mod, bsti_mod, verbose=False))
+    return {"pio_spi": res["spi"][1], "pio_spi_cs": res["spi_cs"][2], "qspi_write": res["qspi_write"][1],
+            "qspi_read": res["qspi_read"][1], "mdio": res["mdio_2sm"][1], "mdio_1sm": res["mdio_1sm"][1],
+            "bsti": res["bsti_4sm"][1], "bsti_1sm": res["bsti_1sm"][1]}
+
+#all drivers, path: the CSV also into this file, returns the rows
+def bench(path=None, clock=CLOCK):
+    b = Bench(path)
+    bench_spi_hw(b, clock["spi"])
+    bench_pio_spi(b, clock["spi"])
+    bench_pio_spi(b, clock["spi"], cs=5)
+    bench_qspi(b, clock["qspi"])
+    bench_mdio(b, clock["mdio"])
+    bench_mdio(b, clock["mdio"], single=True)
+    bench_bsti(b, clock["bsti"])
+    bench_bsti(b, clock["bsti"], single=True)
+    b.close()
+    return b.rows
+
+if __name__ == "__main__":
+    if emu:
+        gaps.update(piosim_gaps())
+    bench()
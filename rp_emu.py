@@ -0,0 +1,2123 @@
+#-------------------------------------------------
+# rp_emu.py:
+#
+# host-side (CPython) emulation of the RP2350 parts our MicroPython scripts poke,
+# so the viper helpers and the drivers can run (and be checked) on a PC:
+# - a memory map with the PIO0/1/2, DMA and UART0/1 register blocks (incl. the atomic XOR/SET/CLR aliases)
+# - buffers (array, bytearray) are mapped into an emulated SRAM, so the DMA can move them
+# - the viper pointer types ptr32/ptr16/ptr8, uint() and const() as builtins
+# - small 'micropython', 'rp2', 'machine' (Pin, SPI, mem32), 'uctypes' modules and the MicroPython 'time' functions
+# - the PIO and DMA interrupts (rp2.PIO.irq(), rp2.DMA.irq()) and a stand-in 'asyncio' event loop
+#
+# rp2.asm_pio assembles the programs and the state machines execute them cycle accurate: a PIO block
+# runs a rp_piosim.PIOSim with the block's instruction memory, IRQ flags, FDEBUG and FIFOs, the devices
+# on its pins are rp_piosim devices (QSPI memory, SPI slave, MDIO/BSTI PHY):
+#
+#   phy = rp_piosim.MgmtPhy(2, 3, 3, {(0x0d, 1): 0x796d})
+#   rp_emu.pio_sim(0).devices.append(phy)	#the block of SM 0
+#
+# A state machine can run a "model" instead, where just the timing of the FIFOs matters (e.g. a LED strip):
+# a Python generator which consumes one SM clock cycle per "yield", e.g.:
+#
+#   def model(sm):
+#       while True:
+#           n = yield from sm.pull()	#blocking pull(), sets TXSTALL like the PIO
+#           yield from sm.push(n)	#blocking push()
+#
+#   rp_emu.attach(4, model)		#SM4 = PIO1, SM0
+#
+# Time runs in system clock cycles (SYS_CLK): every CPU access to a register advances
+# the emulated time, so the busy-wait loops of the drivers terminate.
+# An IRQ handler runs between two cycles, like an ISR preempting the code.
+# asyncio.run(): with no task ready the chip runs until an IRQ or a sleep makes one ready.
+#
+# usage:
+#   import rp_emu
+#   rp_emu.install()
+#   import RP2350_PIO_QSPI
+# or run it as a script: a self-check of the drivers and helpers, a check per driver
+#-------------------------------------------------
+
+import builtins
+import ctypes
+import sys
+import time
+import types
+from array import array
+from collections import deque
+import rp_piosim
+
+SYS_CLK = 150000000
+
+SRAM_BASE = 0x20000000
+DMA_BASE = 0x50000000
+PIO_BASES = (0x50200000, 0x50300000, 0x50400000)
+
+CPU_ACCESS_CYCLES = 2		#system clock cycles we charge for one CPU register access
+CYCLE_LIMIT = 50000000		#a blocking wait running longer than this is a deadlock
+
+class EmuError(Exception):
+    pass
+
+#
+# memory map: regions of devices, a device has read(offset, size) and write(offset, value, size)
+#
+class Ram:
+    atomic = False
+
+    def __init__(self, mv):
+        self.mv = mv
+
+    def read(self, off, size):
+        return int.from_bytes(self.mv[off:off + size], "little")
+
+    def write(self, off, value, size):
+        self.mv[off:off + size] = value.to_bytes(size, "little")
+
+#the address of a buffer in the host process: to find the offset of a memoryview
+def _host_addr(buf):
+    return ctypes.addressof(ctypes.c_char.from_buffer(buf))
+
+class Memory:
+
+    def __init__(self):
+        self.regions = []
+        self.buffers = {}
+        self.next_ram = SRAM_BASE
+        self.last = None
+
+    def map(self, base, size, dev):
+        self.regions.append((base, base + size, dev))
+
+    #place a buffer into the emulated SRAM (once), return its address
+    #a memoryview is a window into its object: same emulated memory, at its offset
+    def map_buffer(self, buf):
+        entry = self.buffers.get(id(buf))
+        if entry is not None:
+            return entry[0]
+        if isinstance(buf, memoryview) and buf.obj is not None:
+            off = _host_addr(buf) - _host_addr(buf.obj) if len(buf) else 0
+            return self.map_buffer(buf.obj) + off
+        mv = memoryview(buf).cast("B")
+        addr = self.next_ram
+        self.next_ram = (addr + max(len(mv), 4) + 3) & ~3
+        self.buffers[id(buf)] = (addr, buf)		#keep buf alive, id() stays unique
+        self.map(addr, len(mv), Ram(mv))
+        return addr
+
+    def find(self, addr):
+        r = self.last
+        if r is not None and r[0] <= addr < r[1]:
+            return r
+        for r in self.regions:
+            if r[0] <= addr < r[1]:
+                self.last = r
+                return r
+        raise EmuError("bus fault: no device at 0x%08x" % addr)
+
+    def read(self, addr, size=4):
+        base, end, dev = self.find(addr)
+        off = addr - base
+        if not dev.atomic:
+            return dev.read(off, size)
+        #peripherals: 32bit registers, narrow reads get their byte lane
+        lane = off & 3
+        v = dev.read((off & 0xfff) & ~3, size)
+        return (v >> (8 * lane)) & ((1 << (8 * size)) - 1)
+
+    def write(self, addr, value, size=4):
+        base, end, dev = self.find(addr)
+        off = addr - base
+        value &= (1 << (8 * size)) - 1
+        if not dev.atomic:
+            dev.write(off, value, size)
+            return
+        #peripherals: narrow writes are replicated over the 32bit word
+        if size == 1:
+            value *= 0x01010101
+        elif size == 2:
+            value *= 0x00010001
+        alias = (off >> 12) & 3
+        off = (off & 0xfff) & ~3
+        if alias:
+            old = dev.read(off, 4)
+            if alias == 1:
+                value = old ^ value
+            elif alias == 2:
+                value = old | value
+            else:
+                value = old & ~value
+        dev.write(off, value & 0xffffffff, 4)
+
+#
+# PIO: register file, FIFOs, the programs run by rp_piosim, SM models
+#
+PIO_CTRL = 0x000
+PIO_FSTAT = 0x004
+PIO_FDEBUG = 0x008
+PIO_FLEVEL = 0x00c
+PIO_TXF0 = 0x010
+PIO_RXF0 = 0x020
+PIO_IRQ = 0x030
+PIO_IRQ_FORCE = 0x034
+PIO_DBG_CFGINFO = 0x044
+PIO_INSTR_MEM0 = 0x048
+PIO_SM0_CLKDIV = 0x0c8
+PIO_SM_SIZE = 0x018
+
+SM_CLKDIV = 0
+SM_EXECCTRL = 1
+SM_SHIFTCTRL = 2
+SM_ADDR = 3
+SM_INSTR = 4
+SM_PINCTRL = 5
+
+class SMEmu:
+
+    def __init__(self, pio, index):
+        self.pio = pio
+        self.index = index
+        self.id = pio.index * 4 + index
+        self.model = None
+        self.gen = None
+        self.log = []				#what the model has put on the bus
+        self.events = []			#other things a model wants to record, e.g. nCS low phases
+        self.tx = deque()
+        self.rx = deque()
+        self.reset()
+
+    def reset(self):
+        self.clkdiv = 1 << 16
+        self.div = 256
+        self.frac = 0
+        self.execctrl = 0x1f << 12
+        self.shiftctrl = 0x000c0000
+        self.pinctrl = 0x14000000
+        self.addr = 0
+        self.instr = 0
+        self.tx.clear()
+        self.rx.clear()
+        self.cycles = 0
+        if self.pio.sim is not None:
+            self.pio.sim.sm[self.index].restart()
+            self.sim_config()
+
+    def tx_depth(self):
+        if self.shiftctrl & (1 << 31):
+            return 0
+        return 8 if self.shiftctrl & (1 << 30) else 4
+
+    def rx_depth(self):
+        if self.shiftctrl & (1 << 30):
+            return 0
+        return 8 if self.shiftctrl & (1 << 31) else 4
+
+    def read_reg(self, reg):
+        if reg == SM_CLKDIV:
+            return self.clkdiv
+        if reg == SM_EXECCTRL:
+            return self.execctrl
+        if reg == SM_SHIFTCTRL:
+            return self.shiftctrl
+        if reg == SM_ADDR:
+            return self.addr if self.model is not None else self.pio.sim.sm[self.index].pc
+        if reg == SM_INSTR:
+            return self.instr
+        return self.pinctrl
+
+    def write_reg(self, reg, value):
+        if reg == SM_CLKDIV:
+            self.clkdiv = value & 0xffffff00
+            div = (value >> 8) & 0xffffff		#INT 16bit, FRAC 8bit
+            if div < 256:
+                div += 1 << 24				#INT = 0 means 65536
+            self.div = div
+        elif reg == SM_EXECCTRL:
+            self.execctrl = (self.execctrl & (1 << 31)) | (value & 0x7fffffff)
+        elif reg == SM_SHIFTCTRL:
+            if (value ^ self.shiftctrl) & (3 << 30):
+                self.tx.clear()			#changing the FIFO join flushes both FIFOs
+                self.rx.clear()
+            self.shiftctrl = value
+        elif reg == SM_INSTR:
+            self.exec(value & 0xffff)
+        elif reg == SM_PINCTRL:
+            self.pinctrl = value
+        if reg != SM_INSTR:
+            self.sim_config()
+
+    #the registers into the SM of the PIOSim, the words in the FIFOs kept (a change of the join cleared them)
+    def sim_config(self):
+        s = self.pio.sim.sm[self.index]
+        s.div = self.div
+        e = self.execctrl
+        s.wrap_top = (e >> 12) & 0x1f
+        s.wrap_bottom = (e >> 7) & 0x1f
+        s.jmp_pin = (e >> 24) & 0x1f
+        s.side_pindir = (e >> 29) & 1
+        s.side_en = (e >> 30) & 1
+        p = self.pinctrl
+        s.side_count = p >> 29
+        s.set_count = (p >> 26) & 7
+        s.out_count = (p >> 20) & 0x3f
+        s.in_base = (p >> 15) & 0x1f
+        s.side_base = (p >> 10) & 0x1f
+        s.set_base = (p >> 5) & 0x1f
+        s.out_base = p & 0x1f
+        tx, rx = list(self.tx), list(self.rx)
+        s.config(self.shiftctrl)
+        self.tx.extend(tx)
+        self.rx.extend(rx)
+
+    #an instruction written into SMx_INSTR: the SM executes it (a disabled one right away),
+    #a model just takes the unconditional jmp: it starts again
+    def exec(self, instr):
+        self.instr = instr
+        if self.model is None:
+            s = self.pio.sim.sm[self.index]
+            s.enabled = (self.pio.ctrl >> self.index) & 1
+            self.pio.sim.exec(self.index, instr)
+        elif (instr >> 13) == 0 and ((instr >> 5) & 7) == 0:
+            self.addr = instr & 0x1f
+            self.gen = None				#the model starts again
+
+    def tx_put(self, value):
+        if len(self.tx) < self.tx_depth():
+            self.tx.append(value)
+        else:
+            self.pio.fdebug |= 1 << (16 + self.index)	#TXOVER
+
+    def rx_get(self):
+        if self.rx:
+            return self.rx.popleft()
+        self.pio.fdebug |= 1 << (8 + self.index)	#RXUNDER
+        return 0
+
+    def tick(self):
+        self.cycles += 1
+        if self.gen is None:
+            if self.model is None:
+                return
+            self.gen = self.model(self)
+        try:
+            next(self.gen)
+        except StopIteration:
+            self.model = None
+            self.gen = None
+
+    #--- used inside the models ---
+
+    def pull(self):
+        while not self.tx:
+            self.pio.fdebug |= 1 << (24 + self.index)	#TXSTALL
+            yield
+        value = self.tx.popleft()
+        yield
+        return value
+
+    def push(self, value):
+        while len(self.rx) >= self.rx_depth():
+            self.pio.fdebug |= 1 << self.index		#RXSTALL
+            yield
+        self.rx.append(value & 0xffffffff)
+        yield
+
+    def wait(self, n):
+        for _ in range(n):
+            yield
+
+    #irq(n), not blocking: raise the PIO IRQ flag n (irq(rel(0)) is n = self.index)
+    def irq(self, n):
+        self.pio.irq |= 1 << n
+        self.pio.chip.irq_pending = True
+        yield
+
+    #wait(1, irq, n): until the PIO IRQ flag n is set (by a SM or the CPU), then clear it
+    def wait_irq(self, n):
+        while not (self.pio.irq >> n) & 1:
+            yield
+        self.pio.irq &= ~(1 << n)
+        yield
+
+#the programs of a PIO block, cycle accurate: the time, the IRQ flags, FDEBUG, the instruction memory
+#and the FIFOs are the ones of the block
+class BlockSim(rp_piosim.PIOSim):
+
+    def __init__(self, pio):
+        self.pio = pio
+        super().__init__(SYS_CLK)
+        self.mem = pio.instr_mem
+        for s, sm in zip(self.sm, pio.sm):
+            s.tx, s.rx = sm.tx, sm.rx
+
+    cycle = property(lambda self: self.pio.chip.cycle, lambda self, v: None)
+    irq = property(lambda self: self.pio.irq, lambda self, v: setattr(self.pio, "irq", v))
+    fdebug = property(lambda self: self.pio.fdebug, lambda self, v: setattr(self.pio, "fdebug", v))
+
+    def execctrl_status_n(self, sm):
+        return self.pio.sm[sm.index].execctrl & 0x1f
+
+class PIOBlock:
+    atomic = True
+
+    def __init__(self, chip, index):
+        self.chip = chip
+        self.index = index
+        self.base = PIO_BASES[index]
+        self.ctrl = 0
+        self.fdebug = 0
+        self.irq = 0
+        self.inte0 = 0				#IRQ0_INTE: enabled by rp2.PIO.irq()
+        self.handler = None
+        self.isr = IRQ()
+        self.instr_mem = [0] * 32
+        self.sim = None
+        self.sm = [SMEmu(self, i) for i in range(4)]
+        self.sim = BlockSim(self)
+        for sm in self.sm:
+            sm.sim_config()
+
+    def fstat(self):
+        v = 0
+        for sm in self.sm:
+            i = sm.index
+            if len(sm.rx) >= sm.rx_depth():
+                v |= 1 << i
+            if not sm.rx:
+                v |= 1 << (8 + i)
+            if len(sm.tx) >= sm.tx_depth():
+                v |= 1 << (16 + i)
+            if not sm.tx:
+                v |= 1 << (24 + i)
+        return v
+
+    def flevel(self):
+        v = 0
+        for sm in self.sm:
+            v |= (len(sm.tx) | (len(sm.rx) << 4)) << (8 * sm.index)
+        return v
+
+    def read(self, off, size):
+        if off == PIO_CTRL:
+            return self.ctrl & 0xf
+        if off == PIO_FSTAT:
+            return self.fstat()
+        if off == PIO_FDEBUG:
+            return self.fdebug
+        if off == PIO_FLEVEL:
+            return self.flevel()
+        if PIO_RXF0 <= off < PIO_RXF0 + 16:
+            return self.sm[(off - PIO_RXF0) >> 2].rx_get()
+        if off == PIO_IRQ:
+            return self.irq
+        if off == PIO_DBG_CFGINFO:
+            return (1 << 28) | (32 << 16) | (4 << 8) | 4
+        if PIO_SM0_CLKDIV <= off < PIO_SM0_CLKDIV + 4 * PIO_SM_SIZE:
+            sm, reg = divmod(off - PIO_SM0_CLKDIV, PIO_SM_SIZE)
+            return self.sm[sm].read_reg(reg >> 2)
+        return 0
+
+    def write(self, off, value, size):
+        if off == PIO_CTRL:
+            for sm, s in zip(self.sm, self.sim.sm):
+                if value & (1 << (4 + sm.index)):		#SM_RESTART: the PC stays
+                    sm.gen = None
+                    pc = s.pc
+                    s.restart()
+                    s.pc = pc
+                if value & (1 << (8 + sm.index)):		#CLKDIV_RESTART
+                    sm.frac = 0
+                    s.frac = 0
+            self.ctrl = value & 0xf
+        elif off == PIO_FDEBUG:
+            self.fdebug &= ~value
+        elif PIO_TXF0 <= off < PIO_TXF0 + 16:
+            self.sm[(off - PIO_TXF0) >> 2].tx_put(value)
+        elif off == PIO_IRQ:
+            self.irq &= ~value
+        elif off == PIO_IRQ_FORCE:
+            self.irq |= value & 0xff
+            self.chip.irq_pending = True
+        elif PIO_INSTR_MEM0 <= off < PIO_INSTR_MEM0 + 128:
+            self.instr_mem[(off - PIO_INSTR_MEM0) >> 2] = value & 0xffff
+            self.sim.used[(off - PIO_INSTR_MEM0) >> 2] = True
+        elif PIO_SM0_CLKDIV <= off < PIO_SM0_CLKDIV + 4 * PIO_SM_SIZE:
+            sm, reg = divmod(off - PIO_SM0_CLKDIV, PIO_SM_SIZE)
+            self.sm[sm].write_reg(reg >> 2, value)
+
+    #the enabled SMs: a model ticks, the others run their programs (a PIOSim cycle, incl. the devices)
+    def step(self):
+        if self.ctrl == 0:
+            return
+        irq = self.irq
+        prog = False
+        for sm, s in zip(self.sm, self.sim.sm):
+            s.enabled = False
+            if self.ctrl & (1 << sm.index):
+                if sm.model is None:
+                    s.enabled = prog = True
+                    continue
+                sm.frac += 256
+                if sm.frac >= sm.div:
+                    sm.frac -= sm.div
+                    sm.tick()
+        if prog:
+            self.sim.step()
+            if self.irq & ~irq:
+                self.chip.irq_pending = True
+
+#
+# DMA: 16 channels, TREQ paced, one bus transfer per system clock cycle
+#
+DMA_EN = 1 << 0
+DMA_RING_SEL = 1 << 12
+DMA_INCR_READ = 1 << 4
+DMA_INCR_READ_REV = 1 << 5
+DMA_INCR_WRITE = 1 << 6
+DMA_INCR_WRITE_REV = 1 << 7
+DMA_IRQ_QUIET = 1 << 23
+DMA_BSWAP = 1 << 24
+DMA_BUSY = 1 << 26
+
+DMA_INTR = 0x400
+DMA_INTE0 = 0x404
+DMA_INTS0 = 0x40c
+DMA_CHAN_ABORT = 0x464
+DMA_N_CHANNELS = 0x468
+
+#TRANS_COUNT MODE, bits 31:28
+DMA_MODE_NORMAL = 0x0
+DMA_MODE_TRIGGER_SELF = 0x1
+DMA_MODE_ENDLESS = 0xf
+
+TREQ_FORCE = 0x3f
+DMA_ABORT_CYCLES = 4				#an abort flushes the in-flight transfers
+
+#per channel register offsets / 4: the four alias sets, every 4th one triggers
+CH_REGS = ("read_addr", "write_addr", "trans_count", "ctrl",
+           "ctrl", "read_addr", "write_addr", "trans_count",
+           "ctrl", "trans_count", "read_addr", "write_addr",
+           "ctrl", "write_addr", "trans_count", "read_addr")
+
+def bswap(value, size):
+    if size == 4:
+        return int.from_bytes(value.to_bytes(4, "little"), "big")
+    if size == 2:
+        return ((value & 0xff) << 8) | (value >> 8)
+    return value
+
+class DMAChannel:
+
+    def __init__(self, index):
+        self.index = index
+        self.read_addr = 0
+        self.write_addr = 0
+        self.trans_count = 0		#the reload value
+        self.count = 0			#the running count
+        self.ctrl = 0
+        self.transfers = 0		#statistics: bus transfers done
+
+    def get(self, name):
+        if name == "trans_count":
+            return (self.trans_count & 0xf0000000) | self.count
+        return getattr(self, name)
+
+    def set(self, name, value):
+        if name == "ctrl":
+            value = (self.ctrl & DMA_BUSY) | (value & 0x03ffffff)
+        setattr(self, name, value)
+
+class DMAEmu:
+    atomic = True
+
+    def __init__(self, chip):
+        self.chip = chip
+        self.ch = [DMAChannel(i) for i in range(16)]
+        self.active = []
+        self.intr = 0
+        self.inte0 = 0				#INTE0: enabled by rp2.DMA.irq()
+        self.claimed = [None] * 16		#the rp2.DMA objects
+        self.aborting = {}			#channel: cycle its abort is done
+
+    def read(self, off, size):
+        if off < 0x400:
+            c = self.ch[off >> 6]
+            return c.get(CH_REGS[(off & 0x3f) >> 2])
+        if off == DMA_INTR:
+            return self.intr
+        if off == DMA_INTE0:
+            return self.inte0
+        if off == DMA_INTS0:
+            return self.intr & self.inte0
+        if off == DMA_N_CHANNELS:
+            return 16
+        if off == DMA_CHAN_ABORT:
+            mask = 0
+            for i, t in list(self.aborting.items()):
+                if t > self.chip.cycle:
+                    mask |= 1 << i
+                else:
+                    del self.aborting[i]
+            return mask
+        return 0
+
+    def write(self, off, value, size):
+        if off < 0x400:
+            c = self.ch[off >> 6]
+            reg = (off & 0x3f) >> 2
+            c.set(CH_REGS[reg], value)
+            if (reg & 3) == 3 and value:		#a trigger register, zero is a null trigger
+                self.trigger(c)
+        elif off == DMA_INTR or off == DMA_INTS0:
+            self.intr &= ~value
+        elif off == DMA_INTE0:
+            self.inte0 = value & 0xffff
+            self.chip.irq_pending = True
+        elif off == DMA_CHAN_ABORT:
+            for c in self.ch:
+                if value & (1 << c.index):
+                    self.abort(c)
+
+    def trigger(self, c):
+        if not (c.ctrl & DMA_EN):
+            return
+        c.count = c.trans_count & 0x0fffffff
+        if c.count == 0 and (c.trans_count >> 28) != DMA_MODE_ENDLESS:
+            return
+        c.ctrl |= DMA_BUSY
+        if c not in self.active:
+            self.active.append(c)
+
+    def treq_ready(self, treq):
+        if treq < 24:				#PIO0/1/2 TX 0-3, RX 4-7 for each block
+            sm = self.chip.pio[treq >> 3].sm[treq & 3]
+            if treq & 4:
+                return len(sm.rx) > 0
+            return len(sm.tx) < sm.tx_depth()
+        if 28 <= treq < 32:			#UART0 TX, RX, UART1 TX, RX
+            return self.chip.uart[(treq - 28) >> 1].dreq(treq & 1)
+        return treq == TREQ_FORCE		#other peripherals are not modelled (yet)
+
+    def step(self):
+        for c in self.active:
+            if (c.ctrl & DMA_EN) and self.treq_ready((c.ctrl >> 17) & 0x3f):
+                self.active.remove(c)
+                self.active.append(c)		#round robin
+                self.transfer(c)
+                return
+
+    def transfer(self, c):
+        mem = self.chip.mem
+        ctrl = c.ctrl
+        size = 1 << ((ctrl >> 2) & 3)
+        value = mem.read(c.read_addr, size)
+        if ctrl & DMA_BSWAP:
+            value = bswap(value, size)
+        mem.write(c.write_addr, value, size)
+        ring = (1 << ((ctrl >> 8) & 0xf)) - 1		#RING_SIZE: wrap the low address bits
+        if ctrl & DMA_INCR_READ:
+            addr = c.read_addr + (-size if ctrl & DMA_INCR_READ_REV else size)
+            if ring and not (ctrl & DMA_RING_SEL):
+                addr = (c.read_addr & ~ring) | (addr & ring)
+            c.read_addr = addr & 0xffffffff
+        if ctrl & DMA_INCR_WRITE:
+            addr = c.write_addr + (-size if ctrl & DMA_INCR_WRITE_REV else size)
+            if ring and (ctrl & DMA_RING_SEL):
+                addr = (c.write_addr & ~ring) | (addr & ring)
+            c.write_addr = addr & 0xffffffff
+        c.transfers += 1
+        if (c.trans_count >> 28) == DMA_MODE_ENDLESS:
+            return
+        c.count -= 1
+        if c.count == 0:
+            self.complete(c)
+
+    def complete(self, c):
+        c.ctrl &= ~DMA_BUSY
+        self.active.remove(c)
+        if not (c.ctrl & DMA_IRQ_QUIET):
+            self.intr |= 1 << c.index
+            self.chip.irq_pending = True
+        chain = (c.ctrl >> 13) & 0xf
+        if (c.trans_count >> 28) == DMA_MODE_TRIGGER_SELF:
+            self.trigger(c)
+        if chain != c.index:
+            self.trigger(self.ch[chain])
+
+    #the transfers in flight are flushed: CHAN_ABORT reads 1 for some cycles, TRANS_COUNT keeps the rest
+    def abort(self, c):
+        c.ctrl &= ~DMA_BUSY
+        if c in self.active:
+            self.active.remove(c)
+            self.aborting[c.index] = self.chip.cycle + DMA_ABORT_CYCLES
+
+#
+# UART0/1 (PL011), just what the DMA needs: UARTDR, UARTFR, UARTDMACR and the RX DREQ
+# the bytes a remote sends arrive at their baud rate (feed()), 10 bits each, into the 32 byte RX FIFO
+#
+UART_BASES = (0x40070000, 0x40078000)
+UART_DR = 0x000
+UART_FR = 0x018
+UART_DMACR = 0x048
+UART_FR_RXFE = 1 << 4
+UART_FR_TXFE = 1 << 7
+
+class UARTEmu:
+    atomic = True
+
+    def __init__(self, chip, index):
+        self.chip = chip
+        self.index = index
+        self.base = UART_BASES[index]
+        self.rx = deque()
+        self.tx = []				#the bytes written (sent at once)
+        self.dmacr = 0
+        self.pending = deque()			#(cycle, byte) still on the wire
+        self.overrun = 0			#bytes lost: the RX FIFO was full
+
+    #a remote sends data at baud: the bytes arrive one by one from now on
+    def feed(self, data, baud=115200):
+        t = max(self.chip.cycle, self.pending[-1][0] if self.pending else 0)
+        bit = SYS_CLK / baud
+        for i, b in enumerate(data):
+            self.pending.append((t + int((i + 1) * 10 * bit), b))
+
+    def step(self):
+        p = self.pending
+        while p and p[0][0] <= self.chip.cycle:
+            b = p.popleft()[1]
+            if len(self.rx) < 32:
+                self.rx.append(b)
+            else:
+                self.overrun += 1
+
+    def read(self, off, size):
+        if off == UART_DR:
+            return self.rx.popleft() if self.rx else 0
+        if off == UART_FR:
+            return (0 if self.rx else UART_FR_RXFE) | UART_FR_TXFE
+        if off == UART_DMACR:
+            return self.dmacr
+        return 0
+
+    def write(self, off, value, size):
+        if off == UART_DR:
+            self.tx.append(value & 0xff)
+        elif off == UART_DMACR:
+            self.dmacr = value & 7
+
+    #DREQ: RX (odd) while a byte is in the RX FIFO and RXDMAE is on, TX (even) with TXDMAE
+    def dreq(self, rx):
+        if rx:
+            return (self.dmacr & 1) and len(self.rx) > 0
+        return (self.dmacr >> 1) & 1
+
+#
+# the chip: memory map, PIO blocks, DMA, UARTs and the system clock
+#
+class Chip:
+
+    def __init__(self):
+        self.mem = Memory()
+        self.cycle = 0
+        self.irq_pending = False
+        self.in_irq = False
+        self.pio = [PIOBlock(self, i) for i in range(3)]
+        self.dma = DMAEmu(self)
+        for p in self.pio:
+            self.mem.map(p.base, 0x4000, p)	#incl. the XOR/SET/CLR aliases
+        self.mem.map(DMA_BASE, 0x4000, self.dma)
+        self.uart = [UARTEmu(self, i) for i in range(2)]
+        for u in self.uart:
+            self.mem.map(u.base, 0x4000, u)
+
+    def sm(self, sm_id):
+        return self.pio[sm_id >> 2].sm[sm_id & 3]
+
+    def step(self):
+        self.cycle += 1
+        if self.dma.active:
+            self.dma.step()
+        for p in self.pio:
+            p.step()
+        for u in self.uart:
+            if u.pending:
+                u.step()
+        if self.irq_pending and not self.in_irq:
+            self.interrupt()
+
+    #run the handlers of the pending (enabled) IRQs, as the MicroPython ISRs do:
+    #PIO: clear the raised IRQ flags, call handler(PIO); DMA: clear INTS0, call handler(DMA) per channel
+    def interrupt(self):
+        self.irq_pending = False
+        self.in_irq = True
+        try:
+            for p in self.pio:
+                ints = ((p.irq & 0xf) << 8) & p.inte0
+                if ints and p.handler is not None:
+                    p.irq &= ~(ints >> 8)
+                    p.isr._flags = ints
+                    p.handler(PIO(p.index))
+            ints = self.dma.intr & self.dma.inte0
+            if ints:
+                self.dma.intr &= ~ints
+                for d in self.dma.claimed:
+                    if d is not None and d._handler is not None and (ints >> d.channel) & 1:
+                        d._handler(d)
+        finally:
+            self.in_irq = False
+
+    def run(self, cycles):
+        for _ in range(cycles):
+            self.step()
+
+    def run_until(self, cond, limit=CYCLE_LIMIT):
+        n = 0
+        while not cond():
+            self.step()
+            n += 1
+            if n > limit:
+                raise EmuError("deadlock: still waiting after %d cycles" % n)
+
+chip = None
+
+#
+# viper emulation: pointers into the emulated memory, uint() also maps buffers
+#
+class ptr32:
+    SIZE = 4
+
+    def __init__(self, target):
+        if isinstance(target, ptr32):
+            self.addr = target.addr
+        elif isinstance(target, int):
+            self.addr = target & 0xffffffff
+        else:
+            self.addr = chip.mem.map_buffer(target)
+
+    def __getitem__(self, i):
+        chip.run(CPU_ACCESS_CYCLES)
+        return chip.mem.read(self.addr + i * self.SIZE, self.SIZE)
+
+    def __setitem__(self, i, value):
+        chip.mem.write(self.addr + i * self.SIZE, value, self.SIZE)
+        chip.run(CPU_ACCESS_CYCLES)
+
+    def __int__(self):
+        return self.addr
+
+class ptr16(ptr32):
+    SIZE = 2
+
+class ptr8(ptr32):
+    SIZE = 1
+
+def uint(value):
+    if isinstance(value, ptr32):
+        return value.addr
+    if isinstance(value, int):
+        return value & 0xffffffff
+    return chip.mem.map_buffer(value)	#on the chip: a viper ptr argument is the buffer address
+
+def const(value):
+    return value
+
+#
+# 'micropython' module
+#
+def _identity(f):
+    return f
+
+#viper: arguments annotated ptr32/ptr16/ptr8 become pointers, results are 32bit machine words
+def _viper(f):
+    ann = getattr(f, "__annotations__", {})
+    names = f.__code__.co_varnames[:f.__code__.co_argcount]
+    ptrs = [(i, ann[n]) for i, n in enumerate(names) if ann.get(n) in (ptr32, ptr16, ptr8)]
+    ret = ann.get("return")
+    def viper_func(*args):
+        if ptrs:
+            args = list(args)
+            for i, ptr in ptrs:
+                args[i] = ptr(args[i])
+        r = f(*args)
+        if ret is int and isinstance(r, int):
+            r &= 0xffffffff
+            if r & 0x80000000:
+                r -= 1 << 32
+        elif ret is uint and isinstance(r, int):
+            r &= 0xffffffff
+        return r
+    viper_func.__name__ = f.__name__
+    return viper_func
+
+def _asm_thumb(f):
+    def no_thumb(*args):
+        raise EmuError("asm_thumb '%s' cannot run on the host" % f.__name__)
+    return no_thumb
+
+#
+# 'rp2' module
+#
+class PIO:
+    IN_LOW = 0
+    IN_HIGH = 1
+    OUT_LOW = 2
+    OUT_HIGH = 3
+    SHIFT_LEFT = 0
+    SHIFT_RIGHT = 1
+    JOIN_NONE = 0
+    JOIN_TX = 1
+    JOIN_RX = 2
+    IRQ_SM0 = 0x100
+    IRQ_SM1 = 0x200
+    IRQ_SM2 = 0x400
+    IRQ_SM3 = 0x800
+
+    def __init__(self, id):
+        self.id = id
+
+    def irq(self, handler=None, trigger=0xf00, hard=False):
+        p = chip.pio[self.id]
+        if handler is not None or trigger != 0xf00:
+            p.handler = handler
+            p.inte0 = trigger if handler is not None else 0
+            p.isr._trigger = p.inte0
+            chip.irq_pending = True
+        return p.isr
+
+    def state_machine(self, id, *args, **kw):
+        return StateMachine(self.id * 4 + id, *args, **kw)
+
+    #into the instruction memory of the block, from the top; remove_program() without a program: all of them
+    def add_program(self, prog):
+        prog[1 + self.id] = chip.pio[self.id].sim.add_program(prog)
+
+    def remove_program(self, prog=None):
+        sim = chip.pio[self.id].sim
+        if prog is not None:
+            sim.remove_program(prog)
+            prog[1 + self.id] = -1
+        else:
+            sim.used[:] = [False] * 32
+            sim.loaded.clear()
+
+#the irq object: flags() are the IRQ sources which made the handler run
+class IRQ:
+
+    def __init__(self):
+        self._flags = 0
+        self._trigger = 0
+
+    def flags(self):
+        return self._flags
+
+    def trigger(self):
+        return self._trigger
+
+#rp2.DMA: claims the lowest free channel, irq() enables its interrupt (INTE0)
+class DMA:
+
+    def __init__(self):
+        dma = chip.dma
+        if None not in dma.claimed:
+            raise EmuError("DMA: no free channel")
+        self.channel = dma.claimed.index(None)
+        dma.claimed[self.channel] = self
+        self._handler = None
+        self._irq = IRQ()
+
+    def irq(self, handler=None, hard=False):
+        dma = chip.dma
+        self._handler = handler
+        if handler is None:
+            dma.inte0 &= ~(1 << self.channel)
+        else:
+            dma.inte0 |= 1 << self.channel
+            chip.irq_pending = True
+        return self._irq
+
+    def active(self, value=None):
+        c = chip.dma.ch[self.channel]
+        if value is not None:
+            if value:
+                chip.dma.trigger(c)
+            else:
+                chip.dma.abort(c)
+        return 1 if c.ctrl & DMA_BUSY else 0
+
+    def close(self):
+        self.irq(None)
+        chip.dma.claimed[self.channel] = None
+
+#the programs are assembled by rp_piosim.py, the PIOSim of the block runs them
+def asm_pio(**kw):
+    return rp_piosim.asm_pio(**kw)
+
+def _npins(init):
+    if init is None:
+        return 0
+    if isinstance(init, int):
+        return 1
+    return len(init)
+
+def _pin_id(pin):
+    if pin is None:
+        return 0
+    return getattr(pin, "id", pin)
+
+class StateMachine:
+
+    def __init__(self, id, prog=None, freq=-1, **kw):
+        self.id = id
+        self.sm = chip.sm(id)
+        self.nfifo = 0				#words the CPU moved through the FIFOs (put(), get()), not the DMA
+        if prog is not None:
+            self.init(prog, freq, **kw)
+
+    def init(self, prog, freq=-1, *, in_base=None, out_base=None, set_base=None, jmp_pin=None,
+             sideset_base=None, in_shiftdir=None, out_shiftdir=None, push_thresh=None, pull_thresh=None):
+        pio = self.id >> 2
+        sim = chip.pio[pio].sim
+        off = prog[1 + pio]
+        if id(prog) not in sim.loaded and not sim.loaded_at(prog, off):
+            off = None				#not (or no longer) in the instruction memory: load it
+        self.offset = prog[1 + pio] = sim.add_program(prog, off)
+        self.active(0)
+        sm = self.sm
+        sm.reset()
+        sim.sm[sm.index].offset = self.offset
+        if freq > 0:
+            div = (SYS_CLK * 256) // freq
+            sm.write_reg(SM_CLKDIV, (div >> 8) << 16 | (div & 0xff) << 8)
+        wrap = ((prog[4] >> 7) & 0x3ff) + (self.offset << 5 | self.offset)	#wrap_top, wrap_bottom relocated
+        sm.write_reg(SM_EXECCTRL, (prog[4] & ~(0x3ff << 7)) | (wrap & 0x3ff) << 7 | (_pin_id(jmp_pin) << 24))
+        shiftctrl = prog[5]
+        if in_shiftdir is not None:
+            shiftctrl = (shiftctrl & ~(1 << 18)) | (in_shiftdir << 18)
+        if out_shiftdir is not None:
+            shiftctrl = (shiftctrl & ~(1 << 19)) | (out_shiftdir << 19)
+        if push_thresh is not None:
+            shiftctrl = (shiftctrl & ~(0x1f << 20)) | ((push_thresh & 0x1f) << 20)
+        if pull_thresh is not None:
+            shiftctrl = (shiftctrl & ~(0x1f << 25)) | ((pull_thresh & 0x1f) << 25)
+        sm.write_reg(SM_SHIFTCTRL, shiftctrl)
+        nside = _npins(prog[8])
+        if nside:
+            nside += (prog[4] >> 30) & 1		#optional side-set: the enable bit counts
+        sm.write_reg(SM_PINCTRL, (nside << 29 | _npins(prog[7]) << 26 | _npins(prog[6]) << 20 |
+                                  _pin_id(in_base) << 15 | _pin_id(sideset_base) << 10 |
+                                  _pin_id(set_base) << 5 | _pin_id(out_base)))
+        sm.write_reg(SM_INSTR, self.offset)	#jmp to the start of the program
+        sim.pin_init(prog, _pin_id(out_base), _pin_id(set_base), _pin_id(sideset_base))
+
+    def active(self, value=None):
+        pio = self.sm.pio
+        if value is not None:
+            if value:
+                pio.ctrl |= 1 << self.sm.index
+            else:
+                pio.ctrl &= ~(1 << self.sm.index)
+        return (pio.ctrl >> self.sm.index) & 1
+
+    def restart(self):
+        self.sm.pio.write(PIO_CTRL, self.sm.pio.ctrl | (1 << (4 + self.sm.index)), 4)
+
+    def exec(self, instr):
+        if isinstance(instr, str):
+            sm = self.sm
+            instr = rp_piosim.asm_pio_encode(instr, sm.pinctrl >> 29, (sm.execctrl >> 30) & 1)
+        self.sm.exec(instr)
+
+    def put(self, value, shift=0):
+        sm = self.sm
+        if isinstance(value, int):
+            value = (value,)
+        for v in value:
+            chip.run_until(lambda: len(sm.tx) < sm.tx_depth())
+            sm.tx_put((v << shift) & 0xffffffff)
+            self.nfifo += 1
+            chip.run(CPU_ACCESS_CYCLES)
+
+    def get(self, buf=None, shift=0):
+        sm = self.sm
+        if buf is None:
+            chip.run_until(lambda: len(sm.rx) > 0)
+            self.nfifo += 1
+            return sm.rx_get() >> shift
+        for i in range(len(buf)):
+            chip.run_until(lambda: len(sm.rx) > 0)
+            buf[i] = sm.rx_get() >> shift
+            self.nfifo += 1
+        return None
+
+    def rx_fifo(self):
+        return len(self.sm.rx)
+
+    def tx_fifo(self):
+        return len(self.sm.tx)
+
+#
+# 'machine' module
+#
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, *, value=None, alt=-1):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        self._value = 0 if value is None else value
+
+    def init(self, mode=-1, pull=-1, *, value=None, alt=-1):
+        self.mode = mode
+        self.pull = pull
+        if value is not None:
+            self._value = value
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = 1 if v else 0
+
+    __call__ = value
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    high = on
+    low = off
+
+class _Mem:
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, addr):
+        return chip.mem.read(addr, self.size)
+
+    def __setitem__(self, addr, value):
+        chip.mem.write(addr, value, self.size)
+
+#machine.SPI (the SPI peripheral, 8bit): a byte takes its bits at the baud rate and a CPU access (the FIFOs)
+#the device on the bus answers with the inverted MOSI bytes, log: the bytes written
+class SPI:
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, id, baudrate=1000000, **kw):
+        self.id = id
+        self.log = []
+        self.init(baudrate, **kw)
+
+    def init(self, baudrate=1000000, *, polarity=0, phase=0, bits=8, firstbit=0, sck=None, mosi=None, miso=None):
+        self.baudrate = min(baudrate, SYS_CLK // 2)
+        self.polarity = polarity
+        self.phase = phase
+
+    def _xfer(self, wbuf, rbuf, n):
+        chip.run(n * (8 * SYS_CLK // self.baudrate + CPU_ACCESS_CYCLES))
+        for i in range(n):
+            w = wbuf[i] if wbuf is not None else 0
+            self.log.append(w)
+            if rbuf is not None:
+                rbuf[i] = w ^ 0xff
+
+    def write(self, buf):
+        self._xfer(buf, None, len(buf))
+
+    def readinto(self, buf, write=0x00):
+        self._xfer(bytes([write]) * len(buf), buf, len(buf))
+
+    def read(self, nbytes, write=0x00):
+        buf = bytearray(nbytes)
+        self.readinto(buf, write)
+        return bytes(buf)
+
+    def write_readinto(self, wbuf, rbuf):
+        if isinstance(wbuf, str):
+            wbuf = wbuf.encode()
+        self._xfer(wbuf, rbuf, len(wbuf))
+
+    def deinit(self):
+        pass
+
+#
+# 'uctypes' module: addresses in the emulated memory
+#
+def addressof(obj):
+    return chip.mem.map_buffer(obj)
+
+def bytearray_at(addr, size):
+    base, end, dev = chip.mem.find(addr)
+    if not isinstance(dev, Ram):
+        raise EmuError("bytearray_at: no RAM at 0x%08x" % addr)
+    return dev.mv[addr - base:addr - base + size]
+
+#
+# MicroPython 'time' functions: the emulated clock
+#
+def ticks_us():
+    return chip.cycle * 1000000 // SYS_CLK
+
+def ticks_ms():
+    return chip.cycle * 1000 // SYS_CLK
+
+def ticks_cpu():
+    return chip.cycle
+
+def ticks_diff(t1, t0):
+    return t1 - t0
+
+def ticks_add(t, delta):
+    return t + delta
+
+def sleep_us(us):
+    chip.run(us * SYS_CLK // 1000000)
+
+def sleep_ms(ms):
+    sleep_us(ms * 1000)
+
+#
+# 'asyncio' module: a stand-in event loop on the emulated clock
+# a task runs until it awaits a _Park (a condition); every task switch costs CPU_ACCESS_CYCLES,
+# with no task ready the chip runs until a condition becomes true (IRQ handler, sleep deadline)
+#
+class _Park:
+
+    def __init__(self, cond=None):
+        self.cond = cond			#None: ready again at once (sleep_ms(0))
+
+    def ready(self):
+        return self.cond is None or self.cond()
+
+    def __await__(self):
+        yield self
+
+class Task:
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.park = None
+        self.done = False
+        self.result = None
+
+    def __await__(self):
+        if not self.done:
+            yield _Park(lambda: self.done)
+        return self.result
+
+class ThreadSafeFlag:
+
+    def __init__(self):
+        self.state = False
+
+    def set(self):
+        self.state = True
+
+    def clear(self):
+        self.state = False
+
+    async def wait(self):
+        await _Park(lambda: self.state)
+        self.state = False
+
+_tasks = []
+
+def create_task(coro):
+    t = Task(coro)
+    _tasks.append(t)
+    return t
+
+async def sleep_ms_async(ms):
+    if ms <= 0:
+        await _Park()
+        return
+    until = chip.cycle + ms * SYS_CLK // 1000
+    await _Park(lambda: chip.cycle >= until)
+
+async def sleep_async(s):
+    await sleep_ms_async(int(s * 1000))
+
+async def gather(*aws):
+    tasks = [a if isinstance(a, Task) else create_task(a) for a in aws]
+    return [(await t) for t in tasks]
+
+def run(coro):
+    del _tasks[:]
+    main = create_task(coro)
+    start = chip.cycle
+    while not main.done:
+        if chip.cycle - start > CYCLE_LIMIT:
+            raise EmuError("asyncio.run: not done after %d cycles" % CYCLE_LIMIT)
+        ready = [t for t in _tasks if t.park is None or t.park.ready()]
+        if not ready:
+            chip.run_until(lambda: any(t.park.ready() for t in _tasks))
+            continue
+        for t in ready:
+            chip.run(CPU_ACCESS_CYCLES)
+            try:
+                t.park = t.coro.send(None)
+            except StopIteration as e:
+                t.done = True
+                t.result = e.value
+                _tasks.remove(t)
+    del _tasks[:]
+    return main.result
+
+#
+# install the emulation: builtins and modules, a fresh chip
+#
+def reset():
+    global chip
+    chip = Chip()
+    return chip
+
+def install():
+    reset()
+    mp = types.ModuleType("micropython")
+    mp.viper = _viper
+    mp.native = _identity
+    mp.asm_thumb = _asm_thumb
+    mp.const = const
+    rp2 = types.ModuleType("rp2")
+    rp2.PIO = PIO
+    rp2.StateMachine = StateMachine
+    rp2.asm_pio = asm_pio
+    rp2.DMA = DMA
+    machine = types.ModuleType("machine")
+    machine.Pin = Pin
+    machine.SPI = SPI
+    machine.freq = lambda *args: SYS_CLK
+    machine.mem32 = _Mem(4)
+    machine.mem16 = _Mem(2)
+    machine.mem8 = _Mem(1)
+    uctypes = types.ModuleType("uctypes")
+    uctypes.addressof = addressof
+    uctypes.bytearray_at = bytearray_at
+    aio = types.ModuleType("asyncio")
+    aio.ThreadSafeFlag = ThreadSafeFlag
+    aio.Task = Task
+    aio.create_task = create_task
+    aio.sleep_ms = sleep_ms_async
+    aio.sleep = sleep_async
+    aio.gather = gather
+    aio.run = run
+    sys.modules["asyncio"] = aio
+    sys.modules["uasyncio"] = aio
+    sys.modules["micropython"] = mp
+    sys.modules["uctypes"] = uctypes
+    sys.modules["rp2"] = rp2
+    sys.modules["machine"] = machine
+    builtins.micropython = mp
+    builtins.const = const
+    builtins.ptr32 = ptr32
+    builtins.ptr16 = ptr16
+    builtins.ptr8 = ptr8
+    builtins.uint = uint
+    for f in (ticks_us, ticks_ms, ticks_cpu, ticks_diff, ticks_add, sleep_us, sleep_ms):
+        setattr(time, f.__name__, f)
+    return chip
+
+#attach a model (generator function) to a state machine: SM number 0..11
+def attach(sm_id, model):
+    sm = chip.sm(sm_id)
+    sm.model = model
+    sm.gen = None
+    sm.log = []
+    sm.events = []
+    return sm
+
+#the PIOSim of the block of a SM (0..11): the rp_piosim devices on its pins, the traces of its pins
+def pio_sim(sm_id):
+    return chip.sm(sm_id).pio.sim
+
+#-------------------------------------------------
+# self-check: a check per driver, each on a fresh chip; the programs run cycle accurate with the
+# rp_piosim devices on the pins, models only where the FIFO timing is all that matters (the LED strips)
+
+US = 1000000 / SYS_CLK				#us per cycle
+
+#ws2812 (Pico2Plus_RP2350_LED.py): autopull of 24 bits, 10 SM cycles per bit, the GRB word left aligned
+def ws2812_model(sm):
+    while True:
+        w = yield from sm.pull()
+        yield from sm.wait(24 * 10 - 1)
+        sm.log.append(w >> 8)
+
+#ws2812_parallel: autopull of 32 bits, a plane (byte) per bit time of 10 SM cycles
+def ws2812_parallel_model(sm):
+    while True:
+        w = yield from sm.pull()
+        yield from sm.wait(4 * 10 - 1)
+        sm.log.append(w)
+
+#the words of a QspiDevice: ADDR + i
+def _qspi_words(addr, n, first=0):
+    return [(addr + i) & 0xffffffff for i in range(first, first + n)]
+
+#RP2350_PIO_QSPI.py: DMA write and read against a QSPI memory, the byte order, PIO2, the continuous READ, async
+def check_qspi():
+    import RP2350_PIO_QSPI as qspi
+    import rp_util
+    reset()
+    F = 25000000
+    dev = qspi.QSPI(qspi.SM_NO, F)
+    dev.command(0x55, 0x654321)
+    dev.command(0xAA, 0x12345F)
+    mem = rp_piosim.QspiDevice(0, 3)
+    pio_sim(qspi.SM_NO).devices.append(mem)
+
+    NWORD = 64
+    A = 0x87654321
+    wbuf = array("I", [0x01020304 * (i + 1) & 0xffffffff for i in range(NWORD)])
+    rbuf = array("I", [0] * NWORD)
+    t0 = chip.cycle
+    dev.write(0x01234567, wbuf)
+    t1 = chip.cycle
+    assert mem.frames == [(0x55, 0x01234567, 0x654321, list(wbuf), 0)], "write: the frame differs"
+    assert chip.pio[qspi.SM_NO >> 2].irq == 0, "write: the IRQ flag of dataWrite left set"
+    dev.read(A, rbuf)
+    t2 = chip.cycle
+    assert mem.frames[1] == (0xAA, A, 0x12345F, [], NWORD), "read: the frame differs"
+    assert list(rbuf) == _qspi_words(A, NWORD), "read: buffer differs"
+    print("QSPI DMA write: %d words in %.1f us" % (NWORD, (t1 - t0) * US))
+    print("QSPI DMA read:  %d words in %.1f us" % (NWORD, (t2 - t1) * US))
+
+    #byte order: the viper bswap32() against the Python reference, and the DMA swapping in flight
+    words = [0x12345678, 0x00000000, 0xffffffff, 0x80000001, 0xdeadbeef, 0x01020304]
+    buf = array("I", words)
+    rp_util.bswap32(buf, len(buf))
+    assert list(buf) == [rp_util.bswap32_word(w) for w in words], "bswap32: wrong result"
+    assert [rp_util.bswap32_word(w) for w in buf] == words, "bswap32_word: not its own inverse"
+    mv = memoryview(buf)[2:]
+    rp_util.bswap32(mv, len(mv))
+    assert list(buf[2:]) == words[2:], "bswap32: memoryview slice"
+    bbuf = bytearray(range(4 * 8))
+    dev.write(0, bbuf, swap=True)
+    assert mem.frames[-1][3] == [int.from_bytes(bbuf[i:i + 4], "big") for i in range(0, len(bbuf), 4)], \
+        "write: DMA byte swap"
+    #a memoryview: its bytes (or items) count, not len(); the DMA stays inside it
+    raw = bytearray(4 * 12)
+    dev.read(A, memoryview(raw)[8:40])
+    assert raw[:8] == bytes(8) and raw[40:] == bytes(8) and \
+        [int.from_bytes(raw[i:i + 4], "little") for i in range(8, 40, 4)] == _qspi_words(A, 8), \
+        "read: memoryview of a bytearray"
+    dev.write(0, memoryview(wbuf)[4:8])
+    assert mem.frames[-1][3] == list(wbuf[4:8]), "write: memoryview of an array('I')"
+    try:
+        dev.read(0, memoryview(raw)[:8], 3)
+        assert False, "read: 3 words into 2"
+    except AssertionError as e:
+        assert "buffer holds 2" in str(e), "read: nword beyond the buffer"
+
+    #PIO2: the same transactions on SM 8..10, the TREQs from the SM table
+    for sm in range(12):
+        i = sm * rp_util.SMD_SIZE
+        assert rp_util.SM_DESC[i + rp_util.SMD_TREQ_TX] == 8 * (sm >> 2) + (sm & 3), "SM_DESC: TREQ"
+    dev2 = qspi.QSPI(8, F, dma_tx=2, dma_rx=3)
+    mem2 = rp_piosim.QspiDevice(0, 3)
+    pio_sim(8).devices.append(mem2)
+    dev2.write(0x01234567, wbuf)
+    dev2.read(A, rbuf)
+    assert mem2.frames[0][3] == list(wbuf) and list(rbuf) == _qspi_words(A, NWORD), "PIO2 transactions"
+
+    #continuous READ: the ring buffer and the ping-pong halves get more data than they hold
+    def words(mv):
+        return [int.from_bytes(mv[i:i + 4], "little") for i in range(0, len(mv), 4)]
+    ring = dev.read_stream(A, 256)
+    got = []
+    while len(got) < 300:
+        mv = ring.readable()
+        got += words(mv)
+        ring.consume(len(mv))
+    dev.stop_stream()
+    assert got == _qspi_words(A, len(got)), "ring: gap, wrong order or not from the first word"
+    #stop_stream(): dataRead restarted (out of its 4G words loop), nCS/DIR high, RX FIFO drained
+    rd_sm = chip.sm(qspi.SM_NO + 2)
+    assert rd_sm.instr & 0xe0ff == 0xe08f and not rd_sm.rx and not rp_util.dma_busy(dev.dma_rx), "stop_stream"
+    assert dev.stream is None, "stop_stream: consumer left"
+    dev.read(A, rbuf)
+    assert mem.frames[-2][:2] == (0xAA, A) and mem.frames[-1] == (0xAA, A, 0x12345F, [], NWORD) and \
+        list(rbuf) == _qspi_words(A, NWORD), "read after stop_stream"
+    pp = dev2.read_stream(A, 128, pingpong=True)
+    got = []
+    while len(got) < 300:
+        h = pp.ready()
+        if h is not None:
+            got += words(h)
+    dev2.stop_stream()
+    assert got == _qspi_words(A, len(got)) and pp.overrun == 0, "ping-pong: gap, wrong order or not from the first word"
+    dev2.read(A, rbuf)
+    assert list(rbuf) == _qspi_words(A, NWORD), "read after stop_stream (ping-pong)"
+
+    #async: the transactions complete by the PIO/DMA IRQs, the other task gets the core meanwhile
+    import asyncio
+    import rp_async
+    adev = qspi.AsyncQSPI(0, F)
+    mem0 = rp_piosim.QspiDevice(0, 3)
+    pio_sim(0).devices.append(mem0)
+    def pre_model(sm):				#a SM answering after 32 clocks, as the MDIO/BSTI pre()
+        while True:
+            yield from sm.pull()
+            yield from sm.wait(32 * 8)
+            yield from sm.push(0)
+    attach(3, pre_model)
+    sm3 = StateMachine(3)
+    sm3.active(1)
+    other = [0]
+    async def host_link():
+        while True:
+            other[0] += 1
+            await asyncio.sleep_ms(0)
+    async def transactions():
+        n = [other[0]]
+        await adev.write(0x01234567, wbuf)
+        n.append(other[0])
+        await adev.read(A, rbuf, swap=True)
+        n.append(other[0])
+        sm3.put(0)
+        await rp_async.sm_get(sm3)
+        n.append(other[0])
+        return n
+    async def amain():
+        asyncio.create_task(host_link())
+        return await transactions()
+    n = asyncio.run(amain())
+    assert mem0.frames[0][3] == list(wbuf), "async write: data on the bus differs"
+    assert list(rbuf) == [rp_util.bswap32_word(w) for w in _qspi_words(A, NWORD)], "async read: buffer differs"
+    assert n[1] - n[0] > NWORD and n[2] - n[1] > NWORD and n[3] > n[2], "async: the other task did not run"
+    assert chip.dma.claimed[adev.dma_rx] is adev.rx_irq.dma and chip.pio[0].irq == 0, "async: IRQ flags left"
+
+#RP2350_PIO_SPI.py on PIO2 SM 11 against a SPI slave answering the inverted MOSI frames: widths, modes, nCS,
+#half-duplex, mode and width switches
+def check_spi():
+    import RP2350_PIO_SPI as pspi
+    reset()
+    SM, MOSI, MISO, SCLK, CS = 11, 3, 4, 2, 5
+    F = 15000000
+    sim = pio_sim(SM)
+    #a new driver: the programs of the one before removed
+    def new(**kw):
+        PIO(SM >> 2).remove_program()
+        return pspi.PIOSPI(SM, MOSI, MISO, SCLK, freq=F, dma_tx=6, dma_rx=7, **kw)
+    #a slave in the mode of the driver, once the SM is on its pull() (SCLK idles at CPOL): it answers the
+    #frames inverted, then the inverted dummy frames of readinto(..., 0x5a)
+    def slave(cpha, cpol, bits, frames, ndummy=0):
+        chip.run(8)
+        mask = (1 << bits) - 1
+        dev = rp_piosim.SpiSlave(sim, SCLK, MOSI, MISO, cpol, cpha, bits,
+                                 [v ^ mask for v in frames] + [0xa5a5a5a5 & mask] * ndummy)
+        sim.devices[:] = [dev]
+        return dev
+
+    #buffers by DMA; bytearray: 8/16/32bit frames, the bytes in buffer order on the wire
+    wbuf = bytearray(range(1, 65))
+    inv = bytearray(b ^ 0xff for b in wbuf)
+    for bits in (8, 16, 32):
+        spi = new(bits=bits, cs=0)
+        n = bits >> 3
+        frames = [int.from_bytes(wbuf[i:i + n], "big") for i in range(0, len(wbuf), n)]
+        dev = slave(0, 0, bits, frames, len(frames))
+        rbuf = bytearray(len(wbuf))
+        t0 = chip.cycle
+        spi.write_readinto(wbuf, rbuf)
+        t1 = chip.cycle
+        assert rbuf == inv, "PIO SPI %dbit: write_readinto" % bits
+        assert dev.words() == frames, "PIO SPI %dbit: MOSI" % bits
+        spi.readinto(rbuf, 0x5a)
+        assert rbuf == bytearray([0xa5] * len(rbuf)), "PIO SPI %dbit: readinto" % bits
+        print("PIO SPI %dbit: %d bytes in %.1f us" % (bits, len(wbuf), (t1 - t0) * US))
+    #any width 4..32 and mode: one frame per item, right aligned
+    for bits, cpha, cpol, typ in ((4, 0, 1, "B"), (12, 1, 0, "H"), (24, 1, 1, "I"), (24, 0, 0, "I")):
+        mask = (1 << bits) - 1
+        spi = new(cpha=cpha, cpol=cpol, bits=bits)
+        wa = array(typ, [(0x9e3779b9 * (i + 1) >> 7) & mask for i in range(16)])
+        ra = array(typ, [0] * 16)
+        dev = slave(cpha, cpol, bits, wa)
+        spi.write_readinto(wa, ra)
+        assert dev.words() == list(wa) and list(ra) == [w ^ mask for w in wa], "PIO SPI %dbit mode %d" % (bits, 2 * cpol + cpha)
+    #memoryviews of arrays: a frame per item, no byte swap (the item size, not the type memoryview)
+    for bits, typ in ((16, "H"), (32, "I")):
+        mask = (1 << bits) - 1
+        spi = new(bits=bits)
+        wa = array(typ, [(0x9e3779b9 * (i + 1)) & mask for i in range(12)])
+        ra = array(typ, [0] * 14)
+        assert pspi.spi_nframe(memoryview(wa)[2:], bits) == 10 and pspi.spi_swap(memoryview(wa), bits) == 0, \
+            "PIO SPI %dbit: memoryview of an array" % bits
+        dev = slave(0, 0, bits, wa[2:])
+        spi.write_readinto(memoryview(wa)[2:], memoryview(ra)[2:])
+        assert dev.words() == list(wa[2:]) and list(ra) == [0, 0] + [w ^ mask for w in wa[2:]] + [0, 0], \
+            "PIO SPI %dbit: memoryview of an array" % bits
+    assert sorted(pspi._spi_prog) == [(0, 0, 0), (0, 0, 1), (0, 1, 0), (1, 0, 0), (1, 1, 0)], "PIO SPI: a program per mode, any width"
+    #nCS by the PIO: the frame count first, nCS low for exactly the transaction, back to back
+    spi = new(bits=16, cs=CS)
+    wa = array("H", range(0x100, 0x120))
+    ra = array("H", [0] * len(wa))
+    dev = slave(0, 0, 16, list(wa) + list(wa[:3]))
+    sim.trace(SCLK, CS)
+    spi.write_readinto(wa, ra)
+    spi.write_readinto(wa, ra, 3)
+    chip.run(1000)				#nCS high after the last edge
+    rise = sim.edges(SCLK, 1)
+    nframe = [len([c for c in rise if lo < c < hi]) // 16 for lo, hi in zip(sim.edges(CS, 0), sim.edges(CS, 1))]
+    assert nframe == [len(wa), 3] and dev.words() == list(wa) + list(wa[:3]), "PIO SPI: nCS by the PIO %s" % nframe
+    assert ra[:3] == array("H", [w ^ 0xffff for w in wa[:3]]), "PIO SPI: nCS by the PIO, read"
+    #half-duplex: TX-only pushes nothing, RX-only sends the dummy frame from one word
+    for cs in (None, CS):
+        spi = new(cs=cs)
+        dev = slave(0, 0, 8, list(wbuf), len(wbuf))
+        t0 = chip.cycle
+        spi.write(wbuf)
+        t1 = chip.cycle
+        assert dev.words() == list(wbuf) and not chip.sm(SM).rx, "PIO SPI: TX-only"
+        rbuf = bytearray(len(wbuf))
+        spi.readinto(rbuf, 0x5a)
+        assert dev.words()[len(wbuf):] == [0x5a] * len(rbuf) and rbuf == bytearray([0xa5] * len(rbuf)), "PIO SPI: RX-only"
+        dev = slave(0, 0, 8, list(wbuf[:4]) + list(wbuf))
+        spi.write(wbuf, 4)
+        spi.write_readinto(wbuf, rbuf)
+        assert rbuf == inv and dev.words() == list(wbuf[:4]) + list(wbuf), "PIO SPI: full duplex again"
+    print("PIO SPI TX-only: %d bytes in %.1f us" % (len(wbuf), (t1 - t0) * US))
+    #mode switches on one SM: rp2.StateMachine() once per mode, then its saved registers
+    spi = new(bits=8)
+    for rnd in range(3):
+        for cpha, cpol, bits, typ in ((0, 0, 8, "B"), (1, 1, 16, "H"), (1, 0, 12, "H")):
+            spi.mode(cpha, cpol, bits)
+            mask = (1 << bits) - 1
+            sm = chip.sm(SM)
+            assert (sm.shiftctrl >> 20) & 0x3ff == bits * 0x21 and list(sm.tx) in ([], [pspi.spi_width(bits, cpol)]) \
+                and not sm.rx, "PIO SPI mode: registers"
+            wa = array(typ, [(0x5bd1e995 * (i + rnd + 1) >> 9) & mask for i in range(8)])
+            ra = array(typ, [0] * 8)
+            dev = slave(cpha, cpol, bits, wa)
+            spi.write_readinto(wa, ra)
+            assert list(ra) == [w ^ mask for w in wa] and dev.words() == list(wa), \
+                "PIO SPI mode %d %dbit: round %d" % (2 * cpol + cpha, bits, rnd)
+    assert sorted(spi._modes.modes) == [(0, 0), (1, 0), (1, 1)], "PIO SPI: a saved mode each"
+    #one mode, the widths switched: the same program, no new one loaded
+    nprog = len(pspi._spi_prog)
+    used = sum(sim.used)
+    for bits, typ in ((8, "B"), (24, "I"), (5, "B"), (32, "I"), (16, "H")):
+        spi.mode(1, 0, bits)
+        mask = (1 << bits) - 1
+        wa = array(typ, [(0x6c078965 * (i + bits)) & mask for i in range(6)])
+        ra = array(typ, [0] * 6)
+        dev = slave(1, 0, bits, wa)
+        spi.write_readinto(wa, ra)
+        assert list(ra) == [w ^ mask for w in wa] and dev.words() == list(wa), "PIO SPI width %d" % bits
+    assert len(pspi._spi_prog) == nprog and len(spi._modes.modes) == 3 and sum(sim.used) == used, \
+        "PIO SPI widths: a program per mode"
+
+#RP2350_PIO_MDIO.py against a PHY with 16 addresses: a batch by DMA, preamble suppression, clause 45;
+#clk + frame SM on PIO0 (MDC 2, MDIO 3, DIR 4), the single SM on PIO1
+def check_mdio():
+    import RP2350_PIO_MDIO as mdio_mod
+    reset()
+    regs = {(phy, 1): 0x7849 + phy for phy in range(16)}
+    md = mdio_mod.MDIO(0, dma_tx=8, dma_rx=9)
+    sim = pio_sim(0)
+    sim.drive(3, 1)				#the pull-up
+    phy = rp_piosim.MgmtPhy(2, 3, 3, regs)
+    sim.devices.append(phy)
+    md.preamble(5, False)
+    ops = [(phy_, 0, mdio_mod.MDIO_WR, 0x1000 | phy_) for phy_ in range(4)] + \
+          [(phy_, 1, mdio_mod.MDIO_RD, 0) for phy_ in range(16)] + [(7, 4, mdio_mod.MDIO_WR, 0x01e1)]
+    out = array("H", [0] * 16)
+    want = [(op, phy_, reg, value if op == mdio_mod.MDIO_WR else regs[(phy_, reg)]) for phy_, reg, op, value in ops]
+    t0 = chip.cycle
+    md.run(ops, out)
+    t1 = chip.cycle
+    t_batch = t1 - t0
+    assert list(out) == [0x7849 + phy_ for phy_ in range(16)], "MDIO batch: reads"
+    assert [f[:4] for f in phy.frames] == want, "MDIO batch: frames"
+    assert [f[1] for f in phy.frames if f[4] < 32] == [5], "MDIO: preamble suppression"
+    assert regs[(7, 4)] == 0x01e1 and md.read(3, 0) == 0x1003, "MDIO: write, read"
+    poll = md.batch([(phy_, 1, mdio_mod.MDIO_RD, 0) for phy_ in range(16)])
+    t2 = chip.cycle
+    md.run(poll, out)
+    t3 = chip.cycle
+    for phy_ in range(16):
+        md.read(phy_, 1)
+    t4 = chip.cycle
+    got = md.run(poll)
+    assert isinstance(got, array) and got.typecode == "H" and list(got) == list(out), "MDIO: run() allocates out"
+    try:
+        md.run(poll, array("H", [0] * 15))
+        raise RuntimeError("MDIO: out shorter than the reads")
+    except AssertionError:
+        pass
+    assert list(md.run([(3, 0, mdio_mod.MDIO_RD, 0)])) == [0x1003], "MDIO: run() of a list, allocated out"
+    print("MDIO: %d ops batched in %.1f us, poll 16 PHYs: batch %.1f us, single reads %.1f us" %
+          (len(ops), (t1 - t0) * US, (t3 - t2) * US, (t4 - t3) * US))
+
+    #clause 45: a MMD register block as one post-read-increment burst vs. ADDRESS + READ pairs
+    for a in range(32):
+        regs[(2, 1, 0x0100 + a)] = 0xa500 + a
+    md.write45(2, 7, 0x0010, 0x1234)
+    assert regs[(2, 7, 0x0010)] == 0x1234 and md.read45(2, 7, 0x0010) == 0x1234, "MDIO45: write, read"
+    blk = array("H", [0] * 32)
+    n0 = len(phy.frames)
+    t0 = chip.cycle
+    md.read45_block(2, 1, 0x0100, blk)
+    t1 = chip.cycle
+    assert list(blk) == [0xa500 + a for a in range(32)], "MDIO45: burst"
+    assert [f[0] for f in phy.frames[n0:]] == [mdio_mod.MDIO45_ADDR] + [mdio_mod.MDIO45_RD_INC] * 32, "MDIO45: burst frames"
+    pairs = []
+    for a in range(32):
+        pairs += [(2, 1, mdio_mod.MDIO45_ADDR, 0x0100 + a), (2, 1, mdio_mod.MDIO45_RD, 0)]
+    blk2 = array("H", [0] * 32)
+    t2 = chip.cycle
+    md.run(pairs, blk2)
+    t3 = chip.cycle
+    assert blk2 == blk, "MDIO45: address + read pairs"
+    print("MDIO45: 32 registers, burst %.1f us (%d frames), address + read pairs %.1f us (%d frames)" %
+          ((t1 - t0) * US, 33, (t3 - t2) * US, len(pairs)))
+
+    #one SM (MDC by side-set, 4 SM cycles per bit): the same frames as with the clk SM
+    md1 = mdio_mod.MDIO(4, freq=20000000, dma_tx=12, dma_rx=13, single=True)
+    sim1 = pio_sim(4)
+    sim1.drive(3, 1)
+    phy1 = rp_piosim.MgmtPhy(2, 3, 3, regs)
+    sim1.devices.append(phy1)
+    md1.preamble(5, False)
+    out1 = array("H", [0] * 16)
+    t0 = chip.cycle
+    md1.run(ops, out1)
+    t1 = chip.cycle
+    assert out1 == out and [f[:4] for f in phy1.frames] == want, "MDIO single SM: batch"
+    assert [f[1] for f in phy1.frames if f[4] < 32] == [5], "MDIO single SM: preamble suppression"
+    blk1 = array("H", [0] * 32)
+    md1.read45_block(2, 1, 0x0100, blk1)
+    assert blk1 == blk, "MDIO single SM: clause 45 burst"
+    print("MDIO single SM: %d ops batched in %.1f us (clk SM + frame SM: %.1f us)" % (len(ops), (t1 - t0) * US, t_batch * US))
+
+#RP2350_PIO_BSTI.py against a PHY: single read/write, a scan of 64 registers by DMA, only the changed ones
+#reported; clk, dataWrite, dataRead, pre on PIO1 (MCLK 2, MDOUT 3, DIR 4, MDIN 5), the single SM on PIO0
+def check_bsti():
+    import RP2350_PIO_BSTI as bsti_mod
+    reset()
+    bregs = {(phy, reg): 0x1000 * reg + phy for phy in range(32) for reg in (1, 2)}
+    bs = bsti_mod.BSTI(4, dma_tx=10, dma_rx=11)
+    sim = pio_sim(4)
+    sim.drive(5, 1)
+    phy = rp_piosim.MgmtPhy(2, 3, 5, bregs, (bsti_mod.BSTI_RD,))
+    sim.devices.append(phy)
+    bs.write(0x14, 0x11, 0xC082)
+    assert bregs[(0x14, 0x11)] == 0xC082 and bs.read(0x14, 0x11) == 0xC082, "BSTI: write, read"
+    assert [f[:4] for f in phy.frames] == [(bsti_mod.BSTI_WR, 0x14, 0x11, 0xC082), (bsti_mod.BSTI_RD, 0x14, 0x11, 0xC082)], \
+        "BSTI: frames %s" % phy.frames
+    mon = bsti_mod.BSTIScan(bs, [(phy_, reg) for reg in (1, 2) for phy_ in range(32)])
+    n0 = bs.sm2.nfifo
+    t0 = chip.cycle
+    assert list(mon.scan()) == list(range(64)), "BSTI scan: the first scan reports all"
+    t1 = chip.cycle
+    nscan = bs.sm2.nfifo - n0
+    assert list(mon.value) == [bregs[r] for r in mon.regs], "BSTI scan: values"
+    assert len(mon.scan()) == 0, "BSTI scan: no change"
+    bregs[(3, 1)] = 0x7809
+    bregs[(30, 2)] = 0
+    assert list(mon.scan()) == [3, 62] and mon.value[3] == 0x7809 and mon.value[62] == 0, "BSTI scan: changes"
+    n0 = bs.sm2.nfifo
+    t2 = chip.cycle
+    for phy_, reg in mon.regs:
+        bs.read(phy_, reg)
+    t3 = chip.cycle
+    nread = bs.sm2.nfifo - n0
+    #the bus time is the same (the read cycles), the CPU moves no word of a scan: one DMA burst
+    n = len(mon.regs)
+    assert nscan == 0 and nread == 2 * n, "BSTI scan: FIFO words by the CPU"
+    assert [f[:4] for f in phy.frames[-n:]] == [f[:4] for f in phy.frames[-2 * n:-n]], "BSTI scan: read cycles"
+    print("BSTI: scan of %d registers %.1f us, %d FIFO words by the CPU; single reads %.1f us, %d FIFO words by the CPU" %
+          (n, (t1 - t0) * US, nscan, (t3 - t2) * US, nread))
+
+    #one SM (MCLK by side-set, 4 SM cycles per bit): the same frames
+    bs1 = bsti_mod.BSTI(0, freq=10000000, dma_tx=14, dma_rx=15, single=True)
+    sim1 = pio_sim(0)
+    sim1.drive(5, 1)
+    phy1 = rp_piosim.MgmtPhy(2, 3, 5, bregs, (bsti_mod.BSTI_RD,))
+    sim1.devices.append(phy1)
+    bs1.write(0x14, 0x11, 0xC083)
+    assert bregs[(0x14, 0x11)] == 0xC083 and bs1.read(0x14, 0x11) == 0xC083, "BSTI single SM: write, read"
+    assert [f[0] for f in phy1.frames] == [bsti_mod.BSTI_WR, bsti_mod.BSTI_RD], "BSTI single SM: frames"
+    mon1 = bsti_mod.BSTIScan(bs1, mon.regs)
+    t0 = chip.cycle
+    assert len(mon1.scan()) == 64 and mon1.value == mon.value, "BSTI single SM: scan"
+    t1 = chip.cycle
+    print("BSTI single SM: scan of %d registers %.1f us" % (len(mon1.regs), (t1 - t0) * US))
+
+#rp_regcache.py: a bring-up touching the same registers again and again, with and without the cache,
+#on MDIO (PIO0) and BSTI (PIO1, clause 22 only)
+def check_regcache():
+    import RP2350_PIO_MDIO as mdio_mod
+    import RP2350_PIO_BSTI as bsti_mod
+    from rp_regcache import RegCache
+    reset()
+    regs = {(9, 0): 0x3100, (9, 4): 0x0001, (9, 1, 0x0000): 0x0000}
+    md = mdio_mod.MDIO(0, dma_tx=8, dma_rx=9)
+    pio_sim(0).drive(3, 1)
+    phy = rp_piosim.MgmtPhy(2, 3, 3, regs)
+    pio_sim(0).devices.append(phy)
+    bregs = {(0x14, 0x11): 0}
+    bs = bsti_mod.BSTI(4, dma_tx=10, dma_rx=11)
+    pio_sim(4).drive(5, 1)
+    bphy = rp_piosim.MgmtPhy(2, 3, 5, bregs, (bsti_mod.BSTI_RD,))
+    pio_sim(4).devices.append(bphy)
+    def bring_up(pc):
+        for _ in range(10):
+            pc.modify(0, 0x1000, 0x0100)		#BMCR: AN off, full duplex
+            pc.modify(4, 0, 0x01e0)			#ANAR
+            pc.write(9, 0x0200)
+            pc.modify((1, 0x0000), 0, 0x2000)	#clause 45: PMA/PMD control
+            pc.read(1)				#BMSR: not cached
+    pc = RegCache(md, 9, static=(0, 4, 9, (1, 0x0000)), volatile={0: 0x8200})
+    bring_up(pc)
+    cached = len(phy.frames)
+    assert regs[(9, 0)] == 0x2100 and regs[(9, 4)] == 0x01e1 and regs[(9, 1, 0)] == 0x2000, "RegCache: values"
+    assert pc.read(0) == 0x2100 and pc.nbus == 4 + 3 + 10, "RegCache: bus accesses"
+    pc.write(0, pc.read(0) | 0x8000)		#reset: self-clearing, always written
+    pc.write(0, pc.read(0) | 0x8000)
+    assert [f[3] for f in phy.frames[-2:]] == [0xa100, 0xa100], "RegCache: self-clearing bit"
+    regs[(9, 0)] = 0x3100
+    assert pc.read(0) == 0x2100, "RegCache: static"
+    pc.invalidate()
+    assert pc.read(0) == 0x3100, "RegCache: invalidate"
+    del phy.frames[:]
+    bring_up(RegCache(md, 9))
+    print("RegCache: bring-up %d frames, without the cache %d frames" % (cached, len(phy.frames)))
+    #on BSTI (clause 22 only): the same cache, a clause 45 register rejected
+    bc = RegCache(bs, 0x14, static=(0x11,), volatile={0x11: 0x8000})
+    bc.write(0x11, 0xC084)
+    bc.modify(0x11, 0, 0x0004)
+    bc.modify(0x11, 0x4000, 0)
+    assert [f[3] for f in bphy.frames if f[0] == bsti_mod.BSTI_WR] == [0xC084, 0x0084] and bc.nbus == 2 and bc.nhit == 3, \
+        "RegCache BSTI: bus accesses"
+    assert bregs[(0x14, 0x11)] == 0x0084 and bc.read(0x11) == 0x0084, "RegCache BSTI: values"
+    for f in (lambda: RegCache(bs, 0x14, static=((1, 0x0000),)), lambda: bc.read((1, 0x0000)),
+              lambda: bc.write((1, 0x0000), 0)):
+        try:
+            f()
+            raise RuntimeError("RegCache BSTI: clause 45 register accepted")
+        except AssertionError:
+            pass
+
+#rp_util.py DMA helpers against the DMA of the chip: control words, TREQ pacing, transfer count, abort, chaining, UART
+def check_dma():
+    import rp_util
+    reset()
+    def field(ctrl, lo, n):
+        return (ctrl >> lo) & ((1 << n) - 1)
+    @asm_pio(pull_thresh=8, push_thresh=16)
+    def sizes():
+        pull()
+        push()
+    @asm_pio()
+    def words():
+        pull()
+    sm8 = StateMachine(8, sizes)
+    buf = array("I", range(64))
+    put = rp_util.sm_dma_put(0 | rp_util.DMA_BSWAP, 8, buf, 0)
+    get = rp_util.sm_dma_get(1 | rp_util.DMA_IRQ | rp_util.DMA_FIXED, 8, buf, 0)
+    assert (field(put, 17, 6), field(put, 2, 2), field(put, 4, 1), field(put, 6, 1), field(put, 13, 4),
+            field(put, 23, 1), field(put, 24, 1), field(put, 8, 5)) == (16, 0, 1, 0, 0, 1, 1, 0), "sm_dma_put: CTRL"
+    assert (field(get, 17, 6), field(get, 2, 2), field(get, 4, 1), field(get, 6, 1), field(get, 13, 4),
+            field(get, 23, 1), field(get, 24, 1), field(get, 8, 5)) == (20, 1, 0, 0, 1, 0, 0, 0), "sm_dma_get: CTRL"
+    ring = rp_util.dma_buffer(256)
+    rc = rp_util.sm_dma_ring(0, 8, ring, 256)
+    rp_util.dma_abort(0)
+    assert (field(rc, 8, 4), field(rc, 12, 1), field(rc, 2, 2), field(rc, 6, 1)) == (8, 1, 1, 1), "sm_dma_ring: CTRL"
+    uc = rp_util.uart_dma_read(2, 1, buf, 0)
+    assert (field(uc, 17, 6), field(uc, 2, 2), chip.mem.read(UART_BASES[1] + UART_DMACR) & 1) == (31, 0, 1), \
+        "uart_dma_read: CTRL"
+
+    K = 20						#SM cycles per word: the DMA has to wait for the TX FIFO
+    def slow_model(sm):
+        while True:
+            w = yield from sm.pull()
+            sm.log.append(w)
+            yield from sm.wait(K - 1)
+    sm = attach(8, slow_model)
+    sm8.init(words)
+    sm8.active(1)
+    t0 = chip.cycle
+    rp_util.sm_dma_put(0, 8, buf, 64)
+    chip.run_until(lambda: len(sm.log) == 10)
+    left = rp_util.dma_transfer_count(0)
+    assert rp_util.dma_busy(0) and abs(left - (64 - len(sm.log) - len(sm.tx))) <= 1, "DMA: paced by the TX FIFO"
+    chip.run_until(lambda: not rp_util.dma_busy(0))
+    t1 = chip.cycle
+    t_pace = t1 - t0
+    assert t_pace >= (64 - 5) * K and rp_util.dma_transfer_count(0) == 0, "DMA: TREQ pacing"
+    chip.run_until(lambda: len(sm.log) == 64)
+    assert sm.log == list(buf), "DMA: the words"
+    #abort half way: the channel stops, TRANS_COUNT tells the words not moved
+    sm.log.clear()
+    rp_util.sm_dma_put(0, 8, buf, 64)
+    chip.run_until(lambda: len(sm.log) == 20)
+    rp_util.dma_abort(0)
+    left = rp_util.dma_transfer_count(0)
+    chip.run(10 * K)
+    assert not rp_util.dma_busy(0) and rp_util.dma_transfer_count(0) == left and 0 < left < 44, "DMA: abort"
+    chip.run(10 * K)
+    assert sm.log == list(buf[:64 - left]), "DMA: abort, the words moved"
+    #chaining: channel 0 (memory to memory, unpaced) triggers channel 1 when done
+    src = array("I", range(100, 356))
+    dst = array("I", [0] * 512)
+    m = chip.mem
+    ch0, ch1 = DMA_BASE, DMA_BASE + 0x40
+    m.write(ch1 + 0x00, addressof(src))
+    m.write(ch1 + 0x04, addressof(dst) + 1024)
+    m.write(ch1 + 0x08, 256)
+    m.write(ch1 + 0x10, TREQ_FORCE << 17 | 1 << 13 | DMA_INCR_WRITE | DMA_INCR_READ | 2 << 2 | DMA_EN)	#CTRL alias: no trigger
+    m.write(ch0 + 0x00, addressof(src))
+    m.write(ch0 + 0x04, addressof(dst))
+    m.write(ch0 + 0x08, 256)
+    t0 = chip.cycle
+    m.write(ch0 + 0x0c, TREQ_FORCE << 17 | 1 << 13 | DMA_INCR_WRITE | DMA_INCR_READ | 2 << 2 | DMA_EN)
+    chip.run_until(lambda: not chip.dma.ch[0].ctrl & DMA_BUSY and not chip.dma.ch[1].ctrl & DMA_BUSY)
+    t1 = chip.cycle
+    assert list(dst) == list(src) * 2 and t1 - t0 == 512, "DMA: chain, %d cycles" % (t1 - t0)
+    #UART1: 64 bytes at 1 MBaud, the RX DREQ paces the DMA, the FIFO never overruns
+    data = bytes(range(0x20, 0x60))
+    rbuf = bytearray(64)
+    chip.uart[1].feed(data, 1000000)
+    t0 = chip.cycle
+    rp_util.uart_dma_read(2, 1, rbuf, 64)
+    chip.run_until(lambda: not rp_util.dma_busy(2))
+    t1 = chip.cycle
+    assert rbuf == data and chip.uart[1].overrun == 0 and not chip.uart[1].rx, "UART DMA: data"
+    print("DMA: %d words paced by a SM (%d cycles per word) in %.1f us, chained copy of 2x 256 words in %.1f us, "
+          "UART 64 bytes at 1 MBaud in %.1f us" % (64, K, t_pace * US, 512 * US, (t1 - t0) * US))
+
+#rp_pioload.py: the plan, the instruction memories, the budget; drivers on the planned SMs load nothing
+def check_pioload():
+    import rp_pioload
+    import RP2350_PIO_QSPI as qspi
+    import RP2350_PIO_SPI as pspi
+    import RP2350_PIO_MDIO as mdio_mod
+    import RP2350_PIO_BSTI as bsti_mod
+    import Pico2Plus_RP2350_LED as led
+    reset()
+    spi_cs, spi_plain = pspi.spi_prog(0, 0, 1), pspi.spi_prog(0, 0)
+    par4, par8 = led.ws2812_parallel(4), led.ws2812_parallel(8)	#the same words, other pin counts
+    groups = [("qspi", [qspi.pio, qspi.dataWrite, qspi.dataRead]),
+              ("spi", [spi_cs, spi_plain]),
+              ("mdio", [mdio_mod.clk, mdio_mod.mdio_frame]),
+              ("leds", [par4, par8])]
+    plan = rp_pioload.pio_plan(groups).load()
+    for b in plan.blocks:
+        for prog, off in b.progs:
+            assert prog[1 + b.index] == off, "pioload: offset"
+            assert chip.pio[b.index].instr_mem[off:off + len(prog[0])] == \
+                [rp_pioload.pio_reloc(w, off) for w in prog[0]], "pioload: instruction memory"
+    spi_b = plan.blocks[plan.sm("spi") >> 2]
+    led_b = plan.blocks[plan.sm("leds") >> 2]
+    assert [g[4] for g in led_b.groups if g[0] == "leds"] == [len(par8[0])], "pioload: shared"
+    assert par4[1 + led_b.index] == par8[1 + led_b.index], "pioload: shared offset"
+    used = sum(b.used() for b in plan.blocks)
+    assert used == sum(len(p[0]) for g in groups for p in g[1]) - len(par8[0]), "pioload: used"
+    try:
+        rp_pioload.pio_plan(groups + [("bsti", [bsti_mod.clk, bsti_mod.dataWrite, bsti_mod.dataRead, bsti_mod.pre])])
+        assert False, "pioload: over budget"
+    except ValueError as e:
+        assert "PIO budget: spi" in str(e) and "PIO0" in str(e), "pioload: budget report"
+    #both SPI drivers on the planned SMs, their programs at the planned offsets: nCS on the first SM, none on the other
+    sm = plan.sm("spi")
+    sim = pio_sim(sm)
+    used = list(sim.used)
+    spi0 = pspi.PIOSPI(sm, 3, 4, 2, freq=15000000, cs=5, dma_tx=0, dma_rx=1)
+    spi1 = pspi.PIOSPI(sm + 1, 7, 8, 6, freq=15000000, dma_tx=2, dma_rx=3)
+    assert sim.used == used and spi_cs[1 + spi_b.index] == spi_b.progs[0][1], "pioload: the drivers loaded instructions"
+    chip.run(8)
+    dev0 = rp_piosim.SpiSlave(sim, 2, 3, 4, 0, 0, 8, [0xa5, 0x3c])
+    dev1 = rp_piosim.SpiSlave(sim, 6, 7, 8, 0, 0, 8, [0x69, 0xc3])
+    sim.devices += [dev0, dev1]
+    rx0, rx1 = bytearray(2), bytearray(2)
+    spi0.write_readinto(bytearray([0x5a, 0xc3]), rx0)
+    spi1.write_readinto(bytearray([0x96, 0x3c]), rx1)
+    assert list(rx0) == [0xa5, 0x3c] and list(rx1) == [0x69, 0xc3] and dev0.words() == [0x5a, 0xc3] and \
+        dev1.words() == [0x96, 0x3c], "pioload: shared SPI programs %s %s" % (list(rx0), list(rx1))
+    print(plan.report())
+
+#Pico2Plus_RP2350_LED.py: the LUT pass into a DMA buffer while the last frame still shifts out, 8 strands from one SM
+def check_ws2812():
+    import Pico2Plus_RP2350_LED as led
+    reset()
+    NLED = 100
+    led_sm = attach(7, ws2812_model)
+    strip = led.WS2812(7, 6, NLED, brightness=0.5, gamma=2.2)
+    lut = led.ws2812_lut(0.5, 2.2)
+    assert lut[0] == 0 and lut[255] == 128 and lut[128] < 32, "WS2812: LUT"
+    for i in range(NLED):
+        strip.set(i, (i, 255 - i, 2 * i))
+    t0 = chip.cycle
+    strip.show()					#nothing to wait for: the LUT pass and the DMA start
+    t1 = chip.cycle
+    strip.fill((255, 0, 64))
+    strip.show()					#renders, then waits for the first frame
+    t2 = chip.cycle
+    assert led_sm.log == [lut[255 - i] << 16 | lut[i] << 8 | lut[2 * i] for i in range(NLED)], "WS2812: frame 1"
+    strip.wait()
+    t3 = chip.cycle
+    assert led_sm.log[NLED:] == [lut[0] << 16 | lut[255] << 8 | lut[64]] * NLED, "WS2812: frame 2"
+    print("WS2812: %d LEDs, show() returns after %.1f us, a frame %.1f us (%.0f fps)"
+          % (NLED, (t1 - t0) * US, (t3 - t2) * US, 1e6 / ((t3 - t2) * US)))
+    #8 strands from one SM: the planes by the bit transpose, back into the strands
+    NSTRAND, NLED = 8, 20
+    led_sm = attach(7, ws2812_parallel_model)
+    strip = led.WS2812Parallel(7, 8, NSTRAND, NLED, brightness=0.5)
+    lut = led.ws2812_lut(0.5)
+    for i in range(NSTRAND * NLED):
+        strip.fb[i] = (0x9e3779b9 * (i + 1) >> 5) & 0xffffff
+    t0 = chip.cycle
+    strip.show()
+    t1 = chip.cycle
+    strip.wait()
+    t2 = chip.cycle
+    planes = b"".join(w.to_bytes(4, "little") for w in led_sm.log)
+    assert len(planes) == 24 * NLED, "WS2812 parallel: planes %d" % len(planes)
+    for s in range(NSTRAND):
+        got = [sum(((planes[24 * i + b] >> s) & 1) << (23 - b) for b in range(24)) for i in range(NLED)]
+        want = [lut[c >> 16] << 16 | lut[(c >> 8) & 0xff] << 8 | lut[c & 0xff] for c in strip.fb[s * NLED:(s + 1) * NLED]]
+        assert got == want, "WS2812 parallel: strand %d" % s
+    print("WS2812 parallel: %d strands of %d LEDs, transpose %.1f us, a frame %.1f us (one strand after the other: %.1f us)"
+          % (NSTRAND, NLED, (t1 - t0) * US, (t2 - t1) * US, NSTRAND * (30 * NLED + led.LATCH_US)))
+
+#rp_ledfx.py: the kernels against plain Python, the frame rate, dropped frames
+def check_ledfx():
+    import rp_ledfx
+    import Pico2Plus_RP2350_LED as led
+    reset()
+    pal = rp_ledfx.palette(led.wheel)
+    assert pal[0] == rp_ledfx.grb((255, 0, 0)) and pal[85] == rp_ledfx.grb((0, 255, 0)), "ledfx: palette"
+    fb = array("I", range(1000, 1037))
+    ref = list(fb)
+    for k in (1, 5, 36, 0):
+        rp_ledfx.fx_rotate(fb, 37, k)
+        ref = ref[-k:] + ref[:-k] if k else ref
+        assert list(fb) == ref, "ledfx: rotate by %d" % k
+    rp_ledfx.Rainbow(pal).render(fb, 37, 7)
+    assert list(fb) == [pal[(i * 256 // 37 + 7) & 255] for i in range(37)], "ledfx: rainbow"
+    NLED = 10						#a frame of 380 us: 1000 fps
+    led_sm = attach(7, ws2812_model)
+    strip = led.WS2812(7, 6, NLED, brightness=1.0)
+    sched = rp_ledfx.FrameScheduler(strip, 1000)
+    t0 = chip.cycle
+    dropped = sched.run(rp_ledfx.Rotate(rp_ledfx.Chase(led.RED)), 20)
+    strip.wait()
+    t1 = chip.cycle
+    assert dropped == 0 and len(led_sm.log) == 20 * NLED, "ledfx: 1000 fps"
+    assert 0 <= (t1 - t0) * US - (19 * 1000 + 30 * NLED + led.LATCH_US) < 150, "ledfx: 1000 fps, %.1f us" % ((t1 - t0) * US)
+    assert led_sm.log[-NLED:] == [0] * 9 + [rp_ledfx.grb(led.RED)], "ledfx: rotate, the last frame"
+    class Slow:					#render takes 2.5 frame periods
+        def render(self, fb, n, k):
+            self.k.append(k)
+            time.sleep_us(2500)
+    slow = Slow()
+    slow.k = []
+    dropped = sched.run(slow, 12)
+    strip.wait()
+    assert dropped >= 6 and slow.k[-1] < 12 and len(slow.k) + dropped == 12 and slow.k == sorted(set(slow.k)), \
+        "ledfx: dropped frames %d %s" % (dropped, slow.k)
+    print("ledfx: %d frames at 1000 fps in %.1f ms, a render of 2.5 periods: %d of 12 frames dropped"
+          % (20, (t1 - t0) * US / 1000, dropped))
+
+#RP2350_ReadMem.py: block reads, dump with CRC, search, compare against a snapshot
+def check_readmem():
+    import io
+    import binascii
+    import RP2350_ReadMem as rm
+    import RP2350_PIO_SPI as pspi
+    reset()
+    region = array("I", [(0x9e3779b9 * i) & 0xffffffff for i in range(600)])
+    base = addressof(region)
+    assert list(rm.read_block(base + 8, array("I", [0] * 5))) == list(region[2:7]), "ReadMem: read_block"
+    try:
+        rm.read_block(base, array("I", [0] * 5), 6)
+        raise RuntimeError("ReadMem: read_block past the buffer")
+    except AssertionError:
+        pass
+    assert list(rm.read_block(base, array("I", [0] * 5), 3))[:3] == list(region[:3]), "ReadMem: read_block nword"
+    assert bytes(rm.read_block(base, bytearray(16))) == bytes(region)[:16], "ReadMem: read_block of a bytearray, in words"
+    try:
+        rm.read_block(base, addressof(region))
+        raise RuntimeError("ReadMem: read_block into an address without nword")
+    except AssertionError:
+        pass
+    txt = io.StringIO()
+    crc = rm.dump(base, 600, out=txt)
+    lines = txt.getvalue().splitlines()
+    assert crc == binascii.crc32(bytes(region)) and lines[-1] == "crc32 %08x" % crc and len(lines) == 150 + 1, "ReadMem: dump"
+    assert lines[1] == "%08x: %s" % (base + 16, binascii.hexlify(bytes(region)[16:32], " ").decode()), "ReadMem: dump line"
+    raw = io.BytesIO()
+    rm.dump(base, 600, binary=True, out=raw)
+    assert raw.getvalue() == bytes(region) + b"\ncrc32 %08x\n" % crc, "ReadMem: binary dump"
+    region[300] = region[513] = 0xcafe0042
+    assert rm.search(base, 600, 0xcafe0000, 0xffff0000) == [base + 4 * 300, base + 4 * 513], "ReadMem: search"
+    idx = rm._idx
+    assert rm.search(base, 600, 0xcafe0042) == [base + 4 * 300, base + 4 * 513] and rm._idx is idx, "ReadMem: idx allocated once"
+    snap = rm.snapshot(base, 600)
+    region[7] ^= 1
+    region[599] = 0
+    assert rm.compare(base, snap) == [(base + 28, snap[7], region[7]), (base + 4 * 599, snap[599], 0)], "ReadMem: compare"
+    #a peripheral block: the SM registers of PIO0 change with the next init
+    pio_snap = rm.snapshot(PIO_BASES[0] + PIO_SM0_CLKDIV, 24)
+    StateMachine(0, pspi.spi_prog(1, 1), freq=1000000, push_thresh=12, pull_thresh=12)
+    changed = rm.compare(PIO_BASES[0] + PIO_SM0_CLKDIV, pio_snap)
+    assert changed and all(PIO_BASES[0] + PIO_SM0_CLKDIV <= a < PIO_BASES[0] + PIO_SM0_CLKDIV + 24 for a, o, n in changed), \
+        "ReadMem: PIO0 SM0 registers"
+    print("ReadMem: dump of %d words in chunks of %d, crc32 %08x; PIO0 SM0: %d registers changed by an init"
+          % (600, rm.CHUNK, crc, len(changed)))
+
+#rp_regmap.py: named register maps, snapshots into preallocated buffers, the changed fields only
+def check_regmap():
+    import rp_regmap
+    import rp_util
+    import RP2350_PIO_SPI as pspi
+    reset()
+    StateMachine(0, pspi.spi_prog(1, 1), freq=1000000, push_thresh=12, pull_thresh=12)
+    pmap = rp_regmap.pio_map(0)
+    pa = pmap.snapshot()
+    pb = pmap.buffer()
+    StateMachine(0, pspi.spi_prog(0, 0), freq=2000000, push_thresh=8, pull_thresh=8)
+    assert pmap.snapshot(pb) is pb, "regmap: snapshot into the buffer"
+    pdiff = pmap.diff(pa, pb)
+    assert ("SM0_SHIFTCTRL", "PULL_THRESH", 12, 8) in pdiff and ("SM0_CLKDIV", "INT", 150, 75) in pdiff, "regmap: PIO0 %r" % pdiff
+    assert all(r.startswith("SM0_") and o != n for r, f, o, n in pdiff), "regmap: PIO0 unchanged fields"
+    assert pmap.diff(pb, pmap.snapshot()) == [], "regmap: PIO0 no change"
+    dmap = rp_regmap.dma_map(4)
+    da = dmap.snapshot()
+    words = array("I", [1, 2, 3])
+    rp_util.sm_dma_put(3, 0, words, 3)
+    ddiff = dmap.diff(da, dmap.snapshot())
+    dnew = dict(((r, f), n) for r, f, o, n in ddiff)
+    assert dnew[("CH3_CTRL", "CHAIN_TO")] == 3 and dnew[("CH3_READ_ADDR", "")] == addressof(words) + 3, "regmap: DMA %r" % ddiff
+    assert all(r.startswith("CH3_") for r, f, o, n in ddiff), "regmap: DMA other channels"
+    umap = rp_regmap.uart_map(1)
+    ua = umap.snapshot()
+    rp_util.uart_dma_read(5, 1, array("I", [0] * 4), 8)
+    assert umap.diff(ua, umap.snapshot()) == [("UARTDMACR", "RXDMAE", 0, 1)], "regmap: UART1"
+    print("regmap: PIO0 %d registers in %d reads, an SM init: %d fields changed; DMA: %d fields; UART1: DMACR.RXDMAE"
+          % (len(pmap.regs), len(pmap.runs), len(pdiff), len(ddiff)))
+
+if __name__ == "__main__":
+    install()
+    check_qspi()
+    check_spi()
+    check_mdio()
+    check_bsti()
+    check_regcache()
+    check_dma()
+    check_pioload()
+    check_ws2812()
+    check_ledfx()
+    check_readmem()
+    check_regmap()
+    print("OK")
@@ -0,0 +1,162 @@
+#-------------------------------------------------
+# rp_ledfx.py:
+#
+# LED effects rendered straight into the framebuffer of a strip (Pico2Plus_RP2350_LED.WS2812: fb, n, show()):
+# - palettes: 256 GRB words computed once, e.g. palette(wheel): no wheel() call, no tuple per pixel and frame
+# - viper kernels on the array('I') framebuffer: fx_fill(), fx_palette() (a palette stretched over the
+#   strip, 8.8 fixed point), fx_rotate() (in place)
+# - effects: render(fb, n, k) draws frame k, k counts frames at a fixed rate (not the calls): an effect
+#   keeps its speed when frames are dropped
+# - FrameScheduler: frames at a fixed rate, poll() from the main loop (returns at once when no frame is
+#   due: the rest of the firmware keeps running), frames missed by a whole period are dropped and counted
+# At 60 fps a WS2812 strip of up to about 500 LEDs (30 us each) shifts out within a frame period.
+#-------------------------------------------------
+
+import time
+from array import array
+
+#the GRB word of a (r, g, b) color, as WS2812.set()
+def grb(color):
+    return (color[1] << 16) | (color[0] << 8) | color[2]
+
+#256 GRB words: fn(pos) -> (r, g, b) for pos 0..255
+def palette(fn):
+    return array('I', [grb(fn(pos)) for pos in range(256)])
+
+#a palette from the colors, in equal steps, back to the first one
+def palette_gradient(colors):
+    pal = array('I', [0] * 256)
+    n = len(colors)
+    for pos in range(256):
+        seg = pos * n
+        i = seg >> 8
+        f = seg & 0xff
+        a = colors[i]
+        b = colors[(i + 1) % n]
+        pal[pos] = grb([a[c] + ((b[c] - a[c]) * f >> 8) for c in range(3)])
+    return pal
+
+@micropython.viper
+def fx_fill(fb: ptr32, start: int, end: int, c: int):
+    for i in range(start, end):
+        fb[i] = c
+
+#fb[i] = pal[phase + i * step / 256]: step 0x10000 // n is the whole palette over the strip
+@micropython.viper
+def fx_palette(fb: ptr32, n: int, pal: ptr32, phase: int, step: int):
+    acc = phase << 8
+    for i in range(n):
+        fb[i] = pal[(acc >> 8) & 0xff]
+        acc += step
+
+#by k (0 <= k < n) towards the end of the strip, in place: reverse all, then the first k and the rest
+@micropython.viper
+def fx_rotate(fb: ptr32, n: int, k: int):
+    r = 0
+    while r < 3:
+        lo = 0
+        hi = n - 1
+        if r == 1:
+            hi = k - 1
+        elif r == 2:
+            lo = k
+        while lo < hi:
+            t = fb[lo]
+            fb[lo] = fb[hi]
+            fb[hi] = t
+            lo += 1
+            hi -= 1
+        r += 1
+
+class Fill:
+
+    def __init__(self, color):
+        self.c = grb(color)
+
+    def render(self, fb, n, k):
+        fx_fill(fb, 0, n, self.c)
+
+#the palette over the strip (spread: palette entries over the strip), moving by speed entries per frame
+class Rainbow:
+
+    def __init__(self, pal, speed=1, spread=256):
+        self.pal = pal
+        self.speed = speed
+        self.spread = spread
+
+    def render(self, fb, n, k):
+        fx_palette(fb, n, self.pal, k * self.speed, (self.spread << 8) // n)
+
+#one more LED of the color per frame, over what the strip shows
+class Chase:
+
+    def __init__(self, color):
+        self.c = grb(color)
+
+    def render(self, fb, n, k):
+        fx_fill(fb, 0, min(k + 1, n), self.c)
+
+#an effect drawn once (at the first frame), then rotated by speed LEDs per frame
+class Rotate:
+
+    def __init__(self, effect, speed=1):
+        self.effect = effect
+        self.speed = speed
+        self.k = -1
+
+    def render(self, fb, n, k):
+        if self.k < 0 or k < self.k:
+            self.effect.render(fb, n, 0)
+            self.k = 0
+        fx_rotate(fb, n, ((k - self.k) * self.speed) % n)
+        self.k = k
+
+class FrameScheduler:
+
+    def __init__(self, strip, fps=60):
+        self.strip = strip
+        self.period = int(1000000 / fps)		#us
+        self.effect = None
+        self.frame = 0				#the frame to render next
+        self.end = -1				#run(): the number of frames, -1: endless
+        self.dropped = 0
+        self.next = time.ticks_us()		#when it is due
+
+    def start(self, effect):
+        self.effect = effect
+        self.frame = 0
+        self.dropped = 0
+        self.next = time.ticks_us()
+
+    #a frame when it is due: True, late by whole periods: these frames are dropped
+    def poll(self):
+        late = time.ticks_diff(time.ticks_us(), self.next)
+        if late < 0:
+            return False
+        if late >= self.period:
+            miss = late // self.period
+            if 0 <= self.end <= self.frame + miss:
+                miss = self.end - self.frame		#the last frames dropped: done
+                self.dropped += miss
+                self.frame += miss
+                return False
+            self.dropped += miss
+            self.frame += miss
+            self.next = time.ticks_add(self.next, miss * self.period)
+        self.effect.render(self.strip.fb, self.strip.n, self.frame)
+        self.strip.show()
+        self.frame += 1
+        self.next = time.ticks_add(self.next, self.period)
+        return True
+
+    #nframes of effect, sleeps between the frames, returns the number of dropped frames
+    def run(self, effect, nframes):
+        self.start(effect)
+        self.end = nframes
+        while self.frame < nframes:
+            if not self.poll():
+                wait = time.ticks_diff(self.next, time.ticks_us())
+                if wait > 0:
+                    time.sleep_us(wait)
+        self.end = -1
+        return self.dropped
@@ -0,0 +1,178 @@
+#-------------------------------------------------
+# rp_pioload.py:
+#
+# instruction memory planner and loader for PIO0/1/2 (32 instructions and 4 SMs each):
+# - pio_plan(groups): places a set of drivers over the three blocks before anything is loaded.
+#   A group is (name, programs) or (name, programs, number of SMs): its programs run on consecutive
+#   SMs of one block (e.g. QSPI: pio, dataWrite, dataRead on 3 SMs). Nothing fits: ValueError with
+#   the budget of each block (fail early, not with the 5th StateMachine() of the app).
+# - identical instructions are shared: a program goes where its (relocated) instructions match the
+#   ones there already, e.g. WS2812 strips of 4 and 8 parallel strands: the programs differ only in
+#   the pin count (a SM register), two strips take the instructions of one.
+#   Safe, as a SM decodes a word with its own side-set config and each program assembled this word.
+# - PIOPlan.load(): writes the instruction memories and sets the offsets in the programs (as
+#   rp2.PIO.add_program() does), so rp2.StateMachine() takes them as loaded
+# - PIOPlan.sm(name): the first SM of a group, e.g. QSPI(plan.sm("qspi"))
+# - PIOPlan.report(): the utilization per block (print it)
+# ATT: MicroPython does not know about these instructions: do not use rp2.PIO.add_program() (or a
+# StateMachine() with a program which is not in the plan) on a block of the plan
+#-------------------------------------------------
+
+from machine import mem32
+
+PIO_BASES = (0x50200000, 0x50300000, 0x50400000)
+PIO_INSTR_MEM0 = const(0x048)
+N_INSTR = const(32)
+N_SM = const(4)
+
+#a JMP (opcode 000) is relative to its program: the target moves with the offset
+def pio_reloc(instr, offset):
+    if instr >> 13 == 0:
+        return (instr & 0xffe0) | ((instr + offset) & 0x1f)
+    return instr
+
+#the offset of a program in mem (list of 32: instruction or None): the most instructions shared,
+#then the highest (as add_program()), returns (offset, shared), offset -1: no room
+def pio_fit(mem, prog):
+    ins = prog[0]
+    n = len(ins)
+    best = -1
+    shared = -1
+    for off in range(N_INSTR - n, -1, -1):
+        k = 0
+        for i in range(n):
+            m = mem[off + i]
+            if m is None:
+                continue
+            if m != pio_reloc(ins[i], off):
+                k = -1
+                break
+            k += 1
+        if k > shared:
+            best = off
+            shared = k
+    return best, max(shared, 0)
+
+class PIOBlockPlan:
+
+    def __init__(self, index):
+        self.index = index
+        self.mem = [None] * N_INSTR
+        self.nsm = 0					#SMs taken
+        self.at = {}					#id(program): offset
+        self.progs = []					#(program, offset)
+        self.groups = []				#(name, first SM of the block, number of SMs, instructions, shared)
+
+    def used(self):
+        return N_INSTR - self.mem.count(None)
+
+    #place the programs of a group into a copy of the memory: (mem, [(program, offset)], shared) or None
+    def fit(self, progs, nsm):
+        if self.nsm + nsm > N_SM:
+            return None
+        mem = list(self.mem)
+        at = {}
+        place = []
+        shared = 0
+        for prog in sorted(progs, key=lambda p: -len(p[0])):
+            if id(prog) in self.at or id(prog) in at:
+                continue				#already here (another group, twice in the list)
+            off, k = pio_fit(mem, prog)
+            if off < 0:
+                return None
+            for i, instr in enumerate(prog[0]):
+                mem[off + i] = pio_reloc(instr, off)
+            at[id(prog)] = off
+            place.append((prog, off))
+            shared += k
+        return mem, place, shared
+
+    def take(self, name, nsm, fit):
+        mem, place, shared = fit
+        n = sum(len(p[0]) for p, off in place)
+        self.groups.append((name, self.nsm, nsm, n, shared))
+        self.nsm += nsm
+        self.mem = mem
+        for prog, off in place:
+            self.at[id(prog)] = off
+            self.progs.append((prog, off))
+
+    def report(self):
+        s = "PIO%d: %2d/%d instructions, %d/%d SMs" % (self.index, self.used(), N_INSTR, self.nsm, N_SM)
+        for name, sm, nsm, n, shared in self.groups:
+            s += "\n  %s: SM %d..%d, %d instructions" % (name, 4 * self.index + sm, 4 * self.index + sm + nsm - 1, n)
+            if shared:
+                s += " (%d shared)" % shared
+        return s
+
+class PIOPlan:
+
+    def __init__(self, blocks=(0, 1, 2)):
+        self.blocks = [PIOBlockPlan(i) for i in blocks]
+        self.first = {}					#group name: first SM (0..11)
+
+    #a group into the block where it shares the most, then leaves the least room (best fit)
+    def add(self, name, progs, nsm=None):
+        if nsm is None:
+            nsm = len(progs)
+        best = None
+        for b in self.blocks:
+            f = b.fit(progs, nsm)
+            if f is None:
+                continue
+            key = (f[2], N_INSTR - f[0].count(None))
+            if best is None or key > best[0]:
+                best = (key, b, f)
+        if best is None:
+            n = sum(len(p[0]) for p in progs)
+            raise ValueError("PIO budget: %s (%d instructions, %d SMs) does not fit\n%s" % (name, n, nsm, self.report()))
+        b = best[1]
+        self.first[name] = 4 * b.index + b.nsm
+        b.take(name, nsm, best[2])
+
+    def sm(self, name):
+        return self.first[name]
+
+    def report(self):
+        used = sum(b.used() for b in self.blocks)
+        return "\n".join(b.report() for b in self.blocks) + "\ntotal: %d/%d instructions" % (used, N_INSTR * len(self.blocks))
+
+    #into the instruction memories, the offsets into the programs
+    def load(self):
+        for b in self.blocks:
+            base = PIO_BASES[b.index] + PIO_INSTR_MEM0
+            for addr in range(N_INSTR):
+                instr = b.mem[addr]
+                if instr is not None:
+                    mem32[base + 4 * addr] = instr
+            for prog, off in b.progs:
+                prog[1 + b.index] = off
+        return self
+
+#the largest groups first: groups is a list of (name, programs) or (name, programs, number of SMs)
+def pio_plan(groups, blocks=(0, 1, 2)):
+    plan = PIOPlan(blocks)
+    for g in sorted(groups, key=lambda g: -sum(len(p[0]) for p in g[1])):
+        plan.add(*g)
+    return plan
+
+if __name__ == "__main__":
+    import RP2350_PIO_QSPI as qspi
+    import RP2350_PIO_SPI as spi
+    import RP2350_PIO_MDIO as mdio
+    import Pico2Plus_RP2350_LED as led
+
+    #QSPI, MDIO, two SPI devices (mode 0, with and without nCS by the PIO) and two LED strips of
+    #4 and 8 parallel strands (the instructions shared)
+    plan = pio_plan([("qspi", [qspi.pio, qspi.dataWrite, qspi.dataRead]),
+                     ("spi", [spi.spi_prog(0, 0, 1), spi.spi_prog(0, 0)]),
+                     ("mdio", [mdio.clk, mdio.mdio_frame]),
+                     ("leds", [led.ws2812_parallel(4), led.ws2812_parallel(8)])])
+    print(plan.report())
+    plan.load()
+    q = qspi.QSPI(plan.sm("qspi"), qspi.FREQ)
+    m = mdio.MDIO(plan.sm("mdio"), mdio.FREQ)
+    s0 = spi.PIOSPI(plan.sm("spi"), 3, 4, 2, cs=5)
+    s1 = spi.PIOSPI(plan.sm("spi") + 1, 3, 4, 2)		#nCS by the caller
+    l0 = led.WS2812Parallel(plan.sm("leds"), 10, 4, 60)
+    l1 = led.WS2812Parallel(plan.sm("leds") + 1, 14, 8, 60, dma=5)
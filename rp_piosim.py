@@ -0,0 +1,1353 @@
+#-------------------------------------------------
+# rp_piosim.py:
+#
+# host-side (CPython) assembler and cycle accurate simulator for our @rp2.asm_pio programs,
+# to see the timing of a PIO program without a board and a scope (and to check it in CI):
+# - asm_pio(): runs the body of the program like MicroPython does (2 passes, labels, side-set,
+#   delays, wrap), the result is the same program list as on the board:
+#   [instructions, offset PIO0/1/2, EXECCTRL, SHIFTCTRL, out_init, set_init, sideset_init]
+#   rp_emu.py uses it for rp2.asm_pio and StateMachine.exec(str) (asm_pio_encode())
+# - PIOSim: one PIO block: 32 instructions, 4 SMs, each with its clock divider, FIFOs (joined),
+#   ISR/OSR with autopush/autopull and thresholds, side-set (opt, pindirs), delays, wrap, EXEC,
+#   the IRQ flags (irq, wait irq, rel), and the GPIOs: per-pin traces, VCD output
+# - a "device" is a function called every cycle, after the SMs: it sees the pins and drives
+#   the inputs (sim.drive()), e.g. a SPI loop back or a PHY on MDIO
+#
+# Time runs in system clock cycles. The pins an instruction writes (incl. side-set) change in the
+# cycle it executes, an instruction reads the pins as they were at the end of the cycle before
+# (no input synchronizer delay). Autopull refills the OSR in the background as soon as the shift
+# count has reached the threshold and the TX FIFO has data.
+#
+# usage:
+#   import rp_emu; rp_emu.install()	#rp2, machine for the driver modules: asm_pio is the one here
+#   import RP2350_PIO_SPI as spi
+#   sim = PIOSim()
+#   sim.sm_init(0, spi.spi_program(0, 0), sideset_base=2, out_base=3, in_base=4, push_thresh=8, pull_thresh=8)
+#   sim.trace(2, 3)
+#   sim.feed(0, [spi.spi_width(8, 0), 0xA5, 0x5A]); sim.run(100)	#the width first
+#   sim.edges(2, 1)			#cycles of the rising SCLK edges
+# or run it as a script: measures the programs of the drivers (cycles per bit, gaps, throughput)
+# and fails when one has changed (EXPECT below)
+#-------------------------------------------------
+
+import builtins
+import types
+from array import array
+from collections import deque
+
+SYS_CLK = 150000000
+M32 = 0xffffffff
+
+class PIOASMError(Exception):
+    pass
+
+class PIOSimError(Exception):
+    pass
+
+#
+# the assembler: the same encoding as MicroPython's rp2.PIOASMEmit
+#
+def _npins(init):
+    if init is None:
+        return 0
+    if isinstance(init, int):
+        return 1
+    return len(init)
+
+class _Emit:
+
+    def __init__(self, *, out_init=None, set_init=None, sideset_init=None, side_pindir=False,
+                 in_shiftdir=0, out_shiftdir=0, autopush=False, autopull=False,
+                 push_thresh=32, pull_thresh=32, fifo_join=0):
+        self.labels = {}
+        execctrl = side_pindir << 29
+        shiftctrl = (fifo_join << 30 | (pull_thresh & 0x1f) << 25 | (push_thresh & 0x1f) << 20 |
+                     out_shiftdir << 19 | in_shiftdir << 18 | autopull << 17 | autopush << 16)
+        self.prog = [array("H"), -1, -1, -1, execctrl, shiftctrl, out_init, set_init, sideset_init]
+        self.wrap_used = False
+        self.sideset_count = _npins(sideset_init)	#incl. the enable bit when side-set is optional
+        self.sideset_opt = False
+        self.delay_max = 31
+        self.pass_ = 0
+        self.num_instr = 0
+        self.num_sideset = 0
+
+    def start_pass(self, pass_):
+        if pass_ == 1:
+            if not self.wrap_used and self.num_instr:
+                self.wrap()
+            self.delay_max = 31
+            if self.sideset_count:
+                self.sideset_opt = self.num_sideset != self.num_instr
+                if self.sideset_opt:
+                    self.prog[4] |= 1 << 30			#SIDE_EN
+                    self.sideset_count += 1
+                self.delay_max >>= self.sideset_count
+        self.pass_ = pass_
+        self.num_instr = 0
+        self.num_sideset = 0
+
+    def __getitem__(self, key):
+        return self.delay(key)
+
+    def delay(self, delay):
+        if self.pass_ > 0:
+            if delay > self.delay_max:
+                raise PIOASMError("delay too large")
+            self.prog[0][-1] |= delay << 8
+        return self
+
+    def side(self, value):
+        self.num_sideset += 1
+        if self.pass_ > 0:
+            if self.sideset_count == 0:
+                raise PIOASMError("no sideset")
+            elif value >= (1 << (self.sideset_count - self.sideset_opt)):
+                raise PIOASMError("sideset too large")
+            self.prog[0][-1] |= self.sideset_opt << 12 | value << (13 - self.sideset_count)
+        return self
+
+    def wrap_target(self):
+        self.prog[4] |= self.num_instr << 7
+
+    def wrap(self):
+        if not self.num_instr:
+            raise PIOASMError("wrap before the first instruction")
+        self.prog[4] |= (self.num_instr - 1) << 12
+        self.wrap_used = True
+
+    def label(self, label):
+        if self.pass_ == 0:
+            if label in self.labels:
+                raise PIOASMError("duplicate label {}".format(label))
+            self.labels[label] = self.num_instr
+
+    def word(self, instr, label=None):
+        if self.pass_ == 1:
+            if label is None:
+                label = 0
+            else:
+                if label not in self.labels:
+                    raise PIOASMError("unknown label {}".format(label))
+                label = self.labels[label]
+            self.prog[0].append(instr | label)
+        self.num_instr += 1
+        return self
+
+    def nop(self):
+        return self.word(0xA042)				#mov(y, y)
+
+    def jmp(self, cond, label=None):
+        if label is None:
+            label = cond
+            cond = 0					#always
+        return self.word(0x0000 | cond << 5, label)
+
+    def wait(self, polarity, src, index):
+        if src == 6:
+            src = 1					#"pin"
+        elif src != 0:
+            src = 2					#"irq"
+        return self.word(0x2000 | polarity << 7 | src << 5 | index)
+
+    def in_(self, src, data):
+        if not 0 < data <= 32:
+            raise PIOASMError("invalid bit count {}".format(data))
+        return self.word(0x4000 | src << 5 | data & 0x1f)
+
+    def out(self, dest, data):
+        if dest == 8:
+            dest = 7					#exec
+        if not 0 < data <= 32:
+            raise PIOASMError("invalid bit count {}".format(data))
+        return self.word(0x6000 | dest << 5 | data & 0x1f)
+
+    def push(self, value=0, value2=0):
+        value |= value2
+        if not value & 1:
+            value |= 0x20					#blocking by default
+        return self.word(0x8000 | (value & 0x60))
+
+    def pull(self, value=0, value2=0):
+        value |= value2
+        if not value & 1:
+            value |= 0x20
+        return self.word(0x8080 | (value & 0x60))
+
+    def mov(self, dest, src):
+        if dest == 8:
+            dest = 4					#exec
+        return self.word(0xA000 | dest << 5 | src)
+
+    def irq(self, mod, index=None):
+        if index is None:
+            index = mod
+            mod = 0					#no modifiers
+        return self.word(0xC000 | (mod & 0x60) | index)
+
+    def set(self, dest, data):
+        return self.word(0xE000 | dest << 5 | data)
+
+_pio_funcs = {
+    #source constants for wait
+    "gpio": 0,
+    #source/dest constants for in_, out, mov, set
+    "pins": 0,
+    "x": 1,
+    "y": 2,
+    "null": 3,
+    "pindirs": 4,
+    "pc": 5,
+    "status": 5,
+    "isr": 6,
+    "osr": 7,
+    "exec": 8,
+    #operation functions for mov's src
+    "invert": lambda x: x | 0x08,
+    "reverse": lambda x: x | 0x10,
+    #jmp condition constants
+    "not_x": 1,
+    "x_dec": 2,
+    "not_y": 3,
+    "y_dec": 4,
+    "x_not_y": 5,
+    "pin": 6,
+    "not_osre": 7,
+    #irq, push, pull modifiers
+    "noblock": 0x01,
+    "block": 0x20,
+    "clear": 0x40,
+    "iffull": 0x40,
+    "ifempty": 0x40,
+    "rel": lambda x: x | 0x10,
+}
+
+_EMIT_FUNCS = ("wrap_target", "wrap", "label", "word", "nop", "jmp", "wait", "in_", "out",
+               "push", "pull", "mov", "irq", "set")
+
+def _globals(emit):
+    gl = dict(_pio_funcs)
+    for name in _EMIT_FUNCS:
+        gl[name] = getattr(emit, name)
+    gl["__builtins__"] = builtins
+    return gl
+
+#the body runs with the PIO functions as its globals, its closure (e.g. the arguments of a
+#program factory as spi_program()) is kept
+def assemble(f, **kw):
+    emit = _Emit(**kw)
+    g = types.FunctionType(f.__code__, _globals(emit), f.__name__, f.__defaults__, f.__closure__)
+    emit.start_pass(0)
+    g()
+    emit.start_pass(1)
+    g()
+    return emit.prog
+
+def asm_pio(**kw):
+    def dec(f):
+        return assemble(f, **kw)
+    return dec
+
+#one instruction from a string, as StateMachine.exec(str) does it
+#sideset_count: the SM's side-set bits (PINCTRL, incl. the enable bit), sideset_opt: EXECCTRL SIDE_EN
+def asm_pio_encode(instr, sideset_count, sideset_opt=False):
+    emit = _Emit()
+    emit.sideset_count = sideset_count
+    emit.sideset_opt = sideset_opt != 0
+    emit.delay_max = 31 >> sideset_count
+    emit.pass_ = 1
+    exec(instr, _globals(emit))
+    if len(emit.prog[0]) != 1:
+        raise PIOASMError("expected one instruction: '%s'" % instr)
+    return emit.prog[0][0]
+
+#
+# the simulator
+#
+_decoded = {}
+
+#instruction: (opcode, field 7:5, bits 4:0, bit 7, bits 6:5, delay/side-set 12:8)
+def _decode(instr):
+    d = _decoded.get(instr)
+    if d is None:
+        d = (instr >> 13, (instr >> 5) & 7, instr & 0x1f, (instr >> 7) & 1, (instr >> 5) & 3, (instr >> 8) & 0x1f)
+        _decoded[instr] = d
+    return d
+
+def _reverse32(v):
+    r = 0
+    for _ in range(32):
+        r = (r << 1) | (v & 1)
+        v >>= 1
+    return r
+
+class SimSM:
+
+    def __init__(self, block, index):
+        self.block = block
+        self.index = index
+        self.enabled = False
+        self.div = 256					#clock divider: INT.FRAC * 256
+        self.frac = 0
+        self.tx = deque()
+        self.rx = deque()
+        self.cycles = 0					#SM clock cycles
+        self.stalls = 0					#of them stalled
+        self.prog = None
+        self.offset = 0
+        self.wrap_top = 31
+        self.wrap_bottom = 0
+        self.side_count = 0
+        self.side_en = 0
+        self.side_pindir = 0
+        self.out_base = self.out_count = 0
+        self.set_base = self.set_count = 0
+        self.side_base = 0
+        self.in_base = 0
+        self.jmp_pin = 0
+        self.shiftctrl = 0x000c0000
+        self.restart()
+
+    def restart(self):
+        self.pc = self.offset
+        self.x = 0
+        self.y = 0
+        self.isr = 0
+        self.isr_count = 0
+        self.osr = 0
+        self.osr_count = 32				#empty: autopull refills it
+        self.delay = 0
+        self.exec_instr = None
+        self.irq_waiting = False
+
+    def config(self, shiftctrl):
+        self.shiftctrl = shiftctrl
+        self.autopush = (shiftctrl >> 16) & 1
+        self.autopull = (shiftctrl >> 17) & 1
+        self.in_right = (shiftctrl >> 18) & 1
+        self.out_right = (shiftctrl >> 19) & 1
+        self.push_thresh = ((shiftctrl >> 20) & 0x1f) or 32
+        self.pull_thresh = ((shiftctrl >> 25) & 0x1f) or 32
+        self.join_tx = (shiftctrl >> 30) & 1
+        self.join_rx = (shiftctrl >> 31) & 1
+        self.tx_depth = 0 if self.join_rx else (8 if self.join_tx else 4)
+        self.rx_depth = 0 if self.join_tx else (8 if self.join_rx else 4)
+        self.tx.clear()
+        self.rx.clear()
+
+    #wait/irq index with the RP2350 index modes: this PIO (also for prev/next here), rel
+    def _irq_flag(self, index):
+        n = index & 7
+        if (index >> 3) & 3 == 2:
+            n = (n & 4) | ((n + self.index) & 3)
+        return n
+
+    def _side(self, ds):
+        sc = self.side_count
+        if self.side_en:
+            if not ds & 0x10:
+                return
+            v = (ds >> (5 - sc)) & ((1 << (sc - 1)) - 1)
+            n = sc - 1
+        else:
+            v = ds >> (5 - sc)
+            n = sc
+        if self.side_pindir:
+            self.block.write_dirs(self.side_base, n, v)
+        else:
+            self.block.write_pins(self.side_base, n, v)
+
+    def _in_pins(self):
+        lv = self.block.levels
+        b = self.in_base
+        return ((lv >> b) | (lv << (32 - b))) & M32
+
+    def _push_isr(self):
+        self.rx.append(self.isr)
+        self.isr = 0
+        self.isr_count = 0
+
+    #one SM clock cycle
+    def step(self):
+        self.cycles += 1
+        b = self.block
+        if self.autopull and self.osr_count >= self.pull_thresh and self.tx:
+            self.osr = self.tx.popleft()
+            self.osr_count = 0
+        if self.delay:
+            self.delay -= 1
+            return
+        ex = self.exec_instr is not None
+        instr = self.exec_instr if ex else b.mem[self.pc]
+        op, f1, f2, f7, f65, ds = _decode(instr)
+        sc = self.side_count
+        if sc:
+            self._side(ds)
+        jmp = -1
+        stall = False
+
+        if op == 0:					#JMP
+            if f1 == 0:
+                c = True
+            elif f1 == 1:
+                c = self.x == 0
+            elif f1 == 2:
+                c = self.x != 0
+                self.x = (self.x - 1) & M32
+            elif f1 == 3:
+                c = self.y == 0
+            elif f1 == 4:
+                c = self.y != 0
+                self.y = (self.y - 1) & M32
+            elif f1 == 5:
+                c = self.x != self.y
+            elif f1 == 6:
+                c = (b.levels >> self.jmp_pin) & 1
+            else:
+                c = self.osr_count < self.pull_thresh
+            if c:
+                jmp = f2
+
+        elif op == 1:					#WAIT
+            src = (instr >> 5) & 3
+            if src == 0:
+                lv = (b.levels >> f2) & 1
+            elif src == 1:
+                lv = (b.levels >> ((self.in_base + f2) & 31)) & 1
+            elif src == 2:
+                n = self._irq_flag(f2)
+                lv = (b.irq >> n) & 1
+                if lv and f7:
+                    b.irq &= ~(1 << n)
+            else:					#jmp pin (RP2350)
+                lv = (b.levels >> ((self.jmp_pin + f2) & 31)) & 1
+            stall = lv != f7
+
+        elif op == 2:					#IN
+            n = f2 or 32
+            if self.autopush and self.isr_count + n >= self.push_thresh and len(self.rx) >= self.rx_depth:
+                b.fdebug |= 1 << self.index		#RXSTALL
+                stall = True
+            else:
+                if f1 == 0:
+                    v = self._in_pins()
+                elif f1 == 1:
+                    v = self.x
+                elif f1 == 2:
+                    v = self.y
+                elif f1 == 6:
+                    v = self.isr
+                elif f1 == 7:
+                    v = self.osr
+                else:
+                    v = 0
+                if n == 32:
+                    self.isr = v & M32
+                else:
+                    v &= (1 << n) - 1
+                    if self.in_right:
+                        self.isr = (self.isr >> n) | (v << (32 - n))
+                    else:
+                        self.isr = ((self.isr << n) | v) & M32
+                self.isr_count = min(32, self.isr_count + n)
+                if self.autopush and self.isr_count >= self.push_thresh:
+                    self._push_isr()
+
+        elif op == 3:					#OUT
+            n = f2 or 32
+            if self.autopull and self.osr_count >= self.pull_thresh:
+                if self.tx:
+                    self.osr = self.tx.popleft()
+                    self.osr_count = 0
+                else:
+                    b.fdebug |= 1 << (24 + self.index)	#TXSTALL
+                    stall = True
+            if not stall:
+                if n == 32:
+                    v = self.osr
+                    self.osr = 0
+                elif self.out_right:
+                    v = self.osr & ((1 << n) - 1)
+                    self.osr >>= n
+                else:
+                    v = self.osr >> (32 - n)
+                    self.osr = (self.osr << n) & M32
+                self.osr_count = min(32, self.osr_count + n)
+                if f1 == 0:
+                    b.write_pins(self.out_base, self.out_count, v)
+                elif f1 == 1:
+                    self.x = v
+                elif f1 == 2:
+                    self.y = v
+                elif f1 == 4:
+                    b.write_dirs(self.out_base, self.out_count, v)
+                elif f1 == 5:
+                    jmp = v & 0x1f
+                elif f1 == 6:
+                    self.isr = v
+                    self.isr_count = n
+                elif f1 == 7:
+                    self.exec_instr = v & 0xffff
+
+        elif op == 4:					#PUSH / PULL
+            if_, blk = (f65 >> 1) & 1, f65 & 1
+            if not f7:					#PUSH
+                if if_ and self.isr_count < self.push_thresh:
+                    pass
+                elif len(self.rx) >= self.rx_depth:
+                    b.fdebug |= 1 << self.index		#RXSTALL
+                    if blk:
+                        stall = True
+                    else:
+                        self.isr = 0
+                        self.isr_count = 0
+                else:
+                    self._push_isr()
+            else:					#PULL
+                if (if_ or self.autopull) and self.osr_count < self.pull_thresh:
+                    pass
+                elif self.tx:
+                    self.osr = self.tx.popleft()
+                    self.osr_count = 0
+                else:
+                    b.fdebug |= 1 << (24 + self.index)	#TXSTALL
+                    if blk:
+                        stall = True
+                    else:
+                        self.osr = self.x
+                        self.osr_count = 0
+
+        elif op == 5:					#MOV
+            src = f2 & 7
+            if src == 0:
+                v = self._in_pins()
+            elif src == 1:
+                v = self.x
+            elif src == 2:
+                v = self.y
+            elif src == 5:				#STATUS: TX level < N (STATUS_SEL 0)
+                v = M32 if len(self.tx) < (b.execctrl_status_n(self)) else 0
+            elif src == 6:
+                v = self.isr
+            elif src == 7:
+                v = self.osr
+            else:
+                v = 0
+            mop = (f2 >> 3) & 3
+            if mop == 1:
+                v = ~v & M32
+            elif mop == 2:
+                v = _reverse32(v)
+            if f1 == 0:
+                b.write_pins(self.out_base, self.out_count, v)
+            elif f1 == 1:
+                self.x = v
+            elif f1 == 2:
+                self.y = v
+            elif f1 == 3:				#pindirs (RP2350)
+                b.write_dirs(self.out_base, self.out_count, v)
+            elif f1 == 4:
+                self.exec_instr = v & 0xffff
+            elif f1 == 5:
+                jmp = v & 0x1f
+            elif f1 == 6:
+                self.isr = v
+                self.isr_count = 0
+            else:
+                self.osr = v
+                self.osr_count = 0
+
+        elif op == 6:					#IRQ
+            bit = 1 << self._irq_flag(f2)
+            clr, wait = (f65 >> 1) & 1, f65 & 1
+            if clr:
+                b.irq &= ~bit
+            elif self.irq_waiting:
+                if b.irq & bit:
+                    stall = True
+                else:
+                    self.irq_waiting = False
+            else:
+                b.irq |= bit
+                b.irq_log.append((b.cycle, bit.bit_length() - 1, self.index))
+                if wait:
+                    self.irq_waiting = True
+                    stall = True
+
+        else:						#SET
+            if f1 == 0:
+                b.write_pins(self.set_base, self.set_count, f2)
+            elif f1 == 1:
+                self.x = f2
+            elif f1 == 2:
+                self.y = f2
+            elif f1 == 4:
+                b.write_dirs(self.set_base, self.set_count, f2)
+
+        if stall:
+            self.stalls += 1
+            return
+        if ex and self.exec_instr == instr:
+            self.exec_instr = None
+        if jmp >= 0:
+            self.pc = jmp
+        elif not ex:
+            self.pc = self.wrap_bottom if self.pc == self.wrap_top else (self.pc + 1) & 0x1f
+        self.delay = ds & ((1 << (5 - sc)) - 1)
+
+class PIOSim:
+
+    def __init__(self, sys_clk=SYS_CLK):
+        self.sys_clk = sys_clk
+        self.cycle = 0
+        self.mem = [0] * 32
+        self.used = [False] * 32
+        self.loaded = {}				#id(prog): offset
+        self.sm = [SimSM(self, i) for i in range(4)]
+        self.irq = 0					#the IRQ flags 0..7
+        self.irq_log = []				#(cycle, flag, SM) a SM has set a flag
+        self.fdebug = 0
+        self.out = 0					#GPIO 0..31: output level, output enable, external level
+        self.oe = 0
+        self.ext = 0
+        self.levels = 0
+        self.devices = []
+        self._traced = 0
+        self.traces = {}				#pin: [(cycle, level), ...], the initial level and each change
+        self.status_n = [0, 0, 0, 0]
+
+    def execctrl_status_n(self, sm):
+        return self.status_n[sm.index]
+
+    #--- instruction memory, as rp2.PIO.add_program(): from the top, the jmps relocated ---
+    #offset: at this address (as rp_pioload.py places it), the words used there already must match
+    def add_program(self, prog, offset=None):
+        off = self.loaded.get(id(prog))
+        if off is not None:
+            return off
+        instrs = prog[0]
+        n = len(instrs)
+        if offset is not None:
+            off = offset
+        else:
+            for off in range(32 - n, -1, -1):
+                if not any(self.used[off:off + n]):
+                    break
+            else:
+                raise PIOSimError("program of %d instructions: %d of 32 used" % (n, sum(self.used)))
+        for i, instr in enumerate(instrs):
+            if instr >> 13 == 0:
+                instr = (instr & ~0x1f) | ((instr + off) & 0x1f)
+            if self.used[off + i] and self.mem[off + i] != instr:
+                raise PIOSimError("program at %d: address %d used" % (off, off + i))
+            self.mem[off + i] = instr
+            self.used[off + i] = True
+        self.loaded[id(prog)] = off
+        return off
+
+    #the instructions of prog at offset already, e.g. written by rp_pioload.py
+    def loaded_at(self, prog, offset):
+        n = len(prog[0])
+        if offset < 0 or offset + n > 32 or not all(self.used[offset:offset + n]):
+            return False
+        for i, instr in enumerate(prog[0]):
+            if instr >> 13 == 0:
+                instr = (instr & ~0x1f) | ((instr + offset) & 0x1f)
+            if self.mem[offset + i] != instr:
+                return False
+        return True
+
+    #as rp2.PIO.remove_program(): its instructions free again
+    def remove_program(self, prog):
+        off = self.loaded.pop(id(prog), None)
+        if off is not None:
+            for i in range(len(prog[0])):
+                self.used[off + i] = False
+
+    #--- a SM, as rp2.StateMachine(): pins are GPIO numbers (or objects with .id) ---
+    def sm_init(self, index, prog, freq=-1, *, in_base=None, out_base=None, set_base=None, jmp_pin=None,
+                sideset_base=None, in_shiftdir=None, out_shiftdir=None, push_thresh=None, pull_thresh=None,
+                active=True):
+        sm = self.sm[index]
+        off = self.add_program(prog)
+        sm.enabled = False
+        sm.prog = prog
+        sm.offset = off
+        if freq > 0:
+            sm.div = max(256, (self.sys_clk * 256) // freq)
+        else:
+            sm.div = 256
+        sm.frac = 0
+        execctrl = prog[4]
+        sm.wrap_top = off + ((execctrl >> 12) & 0x1f)
+        sm.wrap_bottom = off + ((execctrl >> 7) & 0x1f)
+        sm.side_pindir = (execctrl >> 29) & 1
+        nside = _npins(prog[8])
+        sm.side_en = (execctrl >> 30) & 1 if nside else 0
+        sm.side_count = nside + sm.side_en
+        shiftctrl = prog[5]
+        if in_shiftdir is not None:
+            shiftctrl = (shiftctrl & ~(1 << 18)) | (in_shiftdir << 18)
+        if out_shiftdir is not None:
+            shiftctrl = (shiftctrl & ~(1 << 19)) | (out_shiftdir << 19)
+        if push_thresh is not None:
+            shiftctrl = (shiftctrl & ~(0x1f << 20)) | ((push_thresh & 0x1f) << 20)
+        if pull_thresh is not None:
+            shiftctrl = (shiftctrl & ~(0x1f << 25)) | ((pull_thresh & 0x1f) << 25)
+        sm.config(shiftctrl)
+        pin = lambda p: 0 if p is None else getattr(p, "id", p)
+        sm.out_base, sm.out_count = pin(out_base), _npins(prog[6])
+        sm.set_base, sm.set_count = pin(set_base), _npins(prog[7])
+        sm.side_base = pin(sideset_base)
+        sm.in_base = pin(in_base)
+        sm.jmp_pin = pin(jmp_pin)
+        self.pin_init(prog, sm.out_base, sm.set_base, sm.side_base)
+        sm.restart()
+        sm.enabled = active
+        return sm
+
+    #the pin inits of the program: direction and level
+    def pin_init(self, prog, out_base, set_base, side_base):
+        for base, init in ((out_base, prog[6]), (set_base, prog[7]), (side_base, prog[8])):
+            if init is None:
+                continue
+            for i, mode in enumerate((init,) if isinstance(init, int) else init):
+                bit = 1 << ((base + i) & 31)
+                if mode >= 2:				#OUT_LOW, OUT_HIGH
+                    self.oe |= bit
+                    self.out = (self.out | bit) if mode == 3 else (self.out & ~bit)
+                else:
+                    self.oe &= ~bit
+        self._update()
+
+    def active(self, index, on=1):
+        self.sm[index].enabled = bool(on)
+
+    def restart(self, index):
+        self.sm[index].restart()
+
+    #an instruction (int or str) into SMx_INSTR: executed with the next SM cycle
+    def exec(self, index, instr):
+        sm = self.sm[index]
+        if isinstance(instr, str):
+            instr = asm_pio_encode(instr, sm.side_count, sm.side_en)
+        sm.exec_instr = instr
+        if not sm.enabled:
+            sm.step()
+
+    #--- FIFOs from the CPU side ---
+    def put(self, index, value):
+        sm = self.sm[index]
+        if len(sm.tx) >= sm.tx_depth:
+            self.fdebug |= 1 << (16 + index)		#TXOVER
+            return False
+        sm.tx.append(value & M32)
+        return True
+
+    def get(self, index):
+        sm = self.sm[index]
+        return sm.rx.popleft() if sm.rx else None
+
+    #a DMA paced by the DREQ: one word per cycle into the TX FIFO while there is room
+    def feed(self, index, words):
+        it = iter(words)
+        sm = self.sm[index]
+        def dev(sim):
+            if len(sm.tx) < sm.tx_depth:
+                for w in it:
+                    sm.tx.append(w & M32)
+                    return
+                self.devices.remove(dev)
+        self.devices.append(dev)
+
+    #a DMA draining the RX FIFO into a list, one word per cycle
+    def drain(self, index, out):
+        sm = self.sm[index]
+        def dev(sim):
+            if sm.rx:
+                out.append(sm.rx.popleft())
+        self.devices.append(dev)
+        return out
+
+    #--- GPIOs ---
+    def write_pins(self, base, count, value):
+        for i in range(count):
+            bit = 1 << ((base + i) & 31)
+            if (value >> i) & 1:
+                self.out |= bit
+            else:
+                self.out &= ~bit
+
+    def write_dirs(self, base, count, value):
+        for i in range(count):
+            bit = 1 << ((base + i) & 31)
+            if (value >> i) & 1:
+                self.oe |= bit
+            else:
+                self.oe &= ~bit
+
+    #the level a device drives on a pin (seen when the PIO does not drive it)
+    def drive(self, pin, level):
+        if level:
+            self.ext |= 1 << pin
+        else:
+            self.ext &= ~(1 << pin)
+
+    def level(self, pin):
+        return (self.levels >> pin) & 1
+
+    def _update(self):
+        self.levels = (self.out & self.oe) | (self.ext & ~self.oe & M32)
+
+    def trace(self, *pins):
+        self._update()
+        for p in pins:
+            self._traced |= 1 << p
+            self.traces[p] = [(self.cycle, self.level(p))]
+
+    #cycles of the changes of a pin to level (both levels: level = None)
+    def edges(self, pin, level=None):
+        return [c for c, v in self.traces[pin][1:] if level is None or v == level]
+
+    #the traced pins as a VCD file (e.g. for GTKWave), names: {pin: name}
+    def vcd(self, path, names=None):
+        names = names or {}
+        pins = sorted(self.traces)
+        ids = {p: chr(33 + i) for i, p in enumerate(pins)}
+        ev = sorted((c, p, v) for p in pins for c, v in self.traces[p])
+        with open(path, "w") as f:
+            f.write("$timescale %dps $end\n$scope module pio $end\n" % (10 ** 12 // self.sys_clk))
+            for p in pins:
+                f.write("$var wire 1 %s %s $end\n" % (ids[p], names.get(p, "gpio%d" % p)))
+            f.write("$upscope $end\n$enddefinitions $end\n")
+            t = -1
+            for c, p, v in ev:
+                if c != t:
+                    f.write("#%d\n" % c)
+                    t = c
+                f.write("%d%s\n" % (v, ids[p]))
+
+    #--- time ---
+    def step(self):
+        self.cycle += 1
+        self._update()
+        for sm in self.sm:
+            if sm.enabled:
+                sm.frac += 256
+                if sm.frac >= sm.div:
+                    sm.frac -= sm.div
+                    sm.step()
+        self._update()
+        for dev in list(self.devices):
+            dev(self)
+        self._update()
+        if self._traced:
+            for p, tr in self.traces.items():
+                v = (self.levels >> p) & 1
+                if v != tr[-1][1]:
+                    tr.append((self.cycle, v))
+
+    def run(self, cycles):
+        for _ in range(cycles):
+            self.step()
+
+    def run_until(self, cond, limit=1000000):
+        n = 0
+        while not cond():
+            self.step()
+            n += 1
+            if n > limit:
+                raise PIOSimError("still waiting after %d cycles" % limit)
+        return n
+
+    #the SM waits on an empty TX FIFO (pull, or out with autopull), with nothing in flight
+    def idle(self, index):
+        sm = self.sm[index]
+        if sm.tx or sm.delay:
+            return False
+        instr = sm.exec_instr if sm.exec_instr is not None else self.mem[sm.pc]
+        if instr >> 13 == 4 and instr & 0x80:			#pull
+            return True
+        return instr >> 13 == 3 and sm.autopull and sm.osr_count >= sm.pull_thresh
+
+#
+# measuring the programs of the drivers
+#
+
+#the values on a group of pins, sampled at the edges (cycles) of a clock pin
+def sample(sim, clk_edges, pins):
+    out = []
+    for c in clk_edges:
+        v = 0
+        for i, p in enumerate(pins):
+            v |= _level_at(sim, p, c) << i
+        out.append(v)
+    return out
+
+def _level_at(sim, pin, cycle):
+    lv = 0
+    for c, v in sim.traces[pin]:
+        if c > cycle:
+            break
+        lv = v
+    return lv
+
+#the intervals between the edges
+def periods(edges):
+    return [b - a for a, b in zip(edges, edges[1:])]
+
+#a PHY on a management bus (MDIO or BSTI): samples the master on the rising MDC edges,
+#answers a read (read_ops: START + OP) on pin_in: TA 0, 16 bits, changing after the rising edges
+#the registers: clause 22 regs[(phy, reg)], clause 45 (START 00) regs[(prtad, devad, addr)] with an
+#address register per (prtad, devad): set by ADDRESS, counted up by POST-READ-INCREMENT-ADDRESS
+class MgmtPhy:
+
+    def __init__(self, mdc, pin_out, pin_in, regs, read_ops=(0b0110, 0b0011, 0b0010)):
+        self.mdc = mdc
+        self.pin_out = pin_out
+        self.pin_in = pin_in
+        self.regs = regs
+        self.read_ops = read_ops
+        self.addr = {}
+        self.last = 0
+        self.bits = []
+        self.answer = None
+        self.frames = []				#(op, phy, reg, value, preamble bits)
+        self.times = []				#[cycle of the START edge, of the last edge] per frame
+        self.ones = 0
+
+    #a frame on the register file: value None reads
+    def access(self, op, phy, reg, value=None):
+        if op >> 2:
+            key = (phy, reg)
+        elif op == 0b0000:
+            self.addr[(phy, reg)] = value
+            return value
+        else:
+            a = self.addr.get((phy, reg), 0)
+            key = (phy, reg, a)
+            if op == 0b0010:
+                self.addr[(phy, reg)] = (a + 1) & 0xffff
+        if value is None:
+            return self.regs.get(key, 0xffff)
+        self.regs[key] = value
+        return value
+
+    def __call__(self, sim):
+        clk = sim.level(self.mdc)
+        rise = clk and not self.last
+        self.last = clk
+        if not rise:
+            return
+        if self.answer is not None:
+            if self.answer:
+                sim.drive(self.pin_in, self.answer.pop(0))
+            else:
+                sim.drive(self.pin_in, 1)		#released: pull-up
+                self.answer = None
+                self.times[-1][1] = sim.cycle
+            return
+        b = sim.level(self.pin_out)
+        if not self.bits:
+            if b:
+                self.ones += 1				#preamble, idle
+                return
+            self.t0 = sim.cycle
+        self.bits.append(b)
+        if len(self.bits) == 14:
+            f = 0
+            for x in self.bits:
+                f = (f << 1) | x
+            op, phy, reg = f >> 10, (f >> 5) & 0x1f, f & 0x1f
+            if op in self.read_ops:
+                v = self.access(op, phy, reg)
+                #the edge of TA1 puts TA2 (0), then D15..D0 after the next 16 edges
+                self.answer = [0] + [(v >> (15 - i)) & 1 for i in range(16)]
+                self.frames.append((op, phy, reg, v, self.ones))
+                self.times.append([self.t0, None])
+                self.bits = []
+                self.ones = 0
+        elif len(self.bits) == 32:
+            f = 0
+            for x in self.bits:
+                f = (f << 1) | x
+            op, phy, reg, v = f >> 28, (f >> 23) & 0x1f, (f >> 18) & 0x1f, f & 0xffff
+            self.access(op, phy, reg, v)
+            self.frames.append((op, phy, reg, v, self.ones))
+            self.times.append([self.t0, sim.cycle])
+            self.bits = []
+            self.ones = 0
+
+#a SPI slave in mode (cpol, cpha), MSB first: shifts the frames of miso out on its shift edge (CPHA 0:
+#the trailing edge, the first bit before the first edge, CPHA 1: the leading edge), samples MOSI on the
+#other edge: a master sampling MISO on the wrong edge reads the bits shifted by one
+class SpiSlave:
+
+    def __init__(self, sim, sclk, mosi, miso, cpol, cpha, bits, miso_words):
+        self.sclk, self.mosi, self.miso = sclk, mosi, miso
+        self.cpol, self.cpha, self.nbits = cpol, cpha, bits
+        self.tx = [(w >> (bits - 1 - i)) & 1 for w in miso_words for i in range(bits)]
+        self.rx = []					#MOSI, a bit per sampling edge
+        self.last = cpol
+        if not cpha:
+            self._shift(sim)
+
+    def _shift(self, sim):
+        sim.drive(self.miso, self.tx.pop(0) if self.tx else 0)
+
+    def __call__(self, sim):
+        clk = sim.level(self.sclk)
+        if clk == self.last:
+            return
+        self.last = clk
+        if (clk != self.cpol) == bool(self.cpha):	#leading edge with CPHA 1, trailing with CPHA 0
+            self._shift(sim)
+        else:
+            self.rx.append(sim.level(self.mosi))
+
+    #the frames sampled from MOSI
+    def words(self):
+        n = self.nbits
+        return [sum(b << (n - 1 - i) for i, b in enumerate(self.rx[k:k + n])) for k in range(0, len(self.rx) - n + 1, n)]
+
+#values of bits each into a word, the first one the most significant
+def _fold(values, bits=4):
+    w = 0
+    for v in values:
+        w = (w << bits) | v
+    return w
+
+#a QSPI memory on the pins of RP2350_PIO_QSPI.py (SCLK, nCS, DIR = sclk + 0..2, DIO0..3 = dio0 + 0..3):
+#nCS low and DIR high (the master drives): a nibble at each falling SCLK edge, CMD (8, a bit on DIO0), ADDR (8),
+#ALT (6), then the data of a write; DIR low (a read): the words answer(addr, i) after the falling edges,
+#MSB nibble first. frames: (CMD, ADDR, ALT, [words written], words read) per nCS low phase
+class QspiDevice:
+
+    def __init__(self, sclk, dio0, answer=None):
+        self.sclk, self.ncs, self.dir = sclk, sclk + 1, sclk + 2
+        self.dio0 = dio0
+        self.answer = answer or (lambda addr, i: (addr + i) & M32)
+        self.sel = False
+        self.frames = []
+
+    def __call__(self, sim):
+        clk = sim.level(self.sclk)
+        if sim.level(self.ncs):
+            if self.sel:
+                self._end()
+            return
+        if not self.sel:
+            self.sel = True
+            self.nib = []
+            self.out = []				#the nibbles of the word on the lanes
+            self.nread = 0
+            self.last = clk
+        fall = self.last and not clk
+        self.last = clk
+        if not fall:
+            return
+        if sim.level(self.dir):
+            self.nib.append(sum(sim.level(self.dio0 + i) << i for i in range(4)))
+            return
+        if not self.out:
+            w = self.answer(_fold(self.nib[8:16]), self.nread)
+            self.nread += 1
+            self.out = [(w >> (28 - 4 * i)) & 0xf for i in range(8)]
+        n = self.out.pop(0)
+        for i in range(4):
+            sim.drive(self.dio0 + i, (n >> i) & 1)
+
+    #nCS high: the nibble of the turn around (DIR still high) and a word begun on the last edge do not count
+    def _end(self):
+        nib = self.nib
+        data = [_fold(nib[k:k + 8]) for k in range(22, len(nib) - 7, 8)]
+        self.frames.append((_fold([n & 1 for n in nib[:8]], 1), _fold(nib[8:16]), _fold(nib[16:22]), data,
+                            self.nread - (1 if self.out else 0)))
+        self.sel = False
+
+#expected timing, in SM cycles (all SMs at SYS_CLK): a change is a regression (or update it here)
+EXPECT = {
+    "qspi_prefix": (2, 22),			#cycles per nibble, SCLK pulses
+    "qspi_write": (2, 3),			#cycles per nibble, extra cycles between two words (the gap)
+    "qspi_read": (2, 3),
+    "spi": (4, 4),				#cycles per bit, gap between frames (any width)
+    "spi_cs": (7, 1, 5),			#CPHA 0, 8bit: nCS low before the first edge, high after the last, gap
+    "mdio_1sm": (4, 8),				#single SM: cycles per MDC period, extra between two frames
+    "bsti_1sm": (4, 7),
+    "mdio_2sm": (6, 6),				#clk + mdio_frame: MDC runs on, one idle period between two frames
+    "bsti_4sm": (8, 8),				#clk + dataWrite + dataRead + pre: one idle period besides the preamble
+    "ws2812": (10, 2, 7),			#cycles per bit, T0H, T1H
+    "ws2812_par": (10, 3, 6),			#parallel strands: the same on each pin, all rising together
+}
+
+def _qspi_sim(qspi):
+    sim = PIOSim()
+    sim.trace(0, 1, 3, 4, 5, 6)
+    return sim
+
+#verbose: print the results (rp_bench.py just takes them)
+def check_qspi(qspi, nword=4, verbose=True):
+    res = {}
+    #prefix: CMD (single lane), ADDR, ALT (24bit)
+    sim = _qspi_sim(qspi)
+    sim.sm_init(0, qspi.pio, sideset_base=0, out_base=3)
+    sim.feed(0, [qspi.qspi_spread(0x55), 0x12345678, 0xabcdef00])
+    sim.run_until(lambda: sim.idle(0) and len(sim.edges(0, 1)) == 22)
+    rise = sim.edges(0, 1)
+    res["qspi_prefix"] = (min(periods(rise)), len(rise))
+    #write: NUM-1, then the words
+    sim = _qspi_sim(qspi)
+    sim.sm_init(1, qspi.dataWrite, sideset_base=0, out_base=3)
+    words = [0x12345678 * (i + 1) & M32 for i in range(nword)]
+    sim.feed(1, [nword - 1] + words)
+    sim.run_until(lambda: sim.edges(1, 1) and sim.idle(1))
+    rise = sim.edges(0, 1)
+    assert len(rise) == 8 * nword, "QSPI write: %d SCLK pulses" % len(rise)
+    nib = sample(sim, sim.edges(0, 0), (3, 4, 5, 6))	#data is stable at the falling edge
+    got = [sum(n << (28 - 4 * i) for i, n in enumerate(nib[8 * w:8 * w + 8])) for w in range(nword)]
+    assert got == words, "QSPI write: data %s" % [hex(w) for w in got]
+    p = periods(rise)
+    res["qspi_write"] = (p[0], p[7] - p[0])
+    t = sim.edges(1, 1)[-1] - sim.edges(1, 0)[0]
+    if verbose:
+        print("QSPI dataWrite: %d cycles per nibble, +%d cycles between the words (jmp y--, set x, pull:"
+              " SCLK stays low), %d words in %d cycles: %.1f Mbit/s at %d MHz" %
+              (p[0], p[7] - p[0], nword, t, 32 * nword * sim.sys_clk / t / 1e6, sim.sys_clk // 1000000))
+    #read: NUM-1, the device drives a constant nibble
+    sim = _qspi_sim(qspi)
+    sim.sm_init(2, qspi.dataRead, sideset_base=0, in_base=3, set_base=3)
+    for i, p in enumerate((3, 4, 5, 6)):
+        sim.drive(p, (0xa >> i) & 1)
+    rx = sim.drain(2, [])
+    sim.put(2, nword - 1)
+    sim.run_until(lambda: len(rx) == nword and sim.idle(2))
+    assert rx == [0xaaaaaaaa] * nword, "QSPI read: data %s" % [hex(w) for w in rx]
+    p = periods(sim.edges(0, 1)[2:])			#after the 2 turn around pulses
+    res["qspi_read"] = (p[0], p[7] - p[0])
+    return res
+
+def check_spi(spi, verbose=True):
+    res = {}
+    for bits in (8, 12, 32):
+        for cpha in (0, 1):
+            for cpol in (0, 1):
+                w = spi.spi_width(bits, cpol)
+                assert w == asm_pio_encode("mov(y, y) .side(%d)" % cpol if bits == 32 else
+                                           "out(null, %d) .side(%d)" % (32 - bits, cpol), 1), "SPI width word %dbit" % bits
+                sim = PIOSim()
+                sim.sm_init(0, spi.spi_program(cpha, cpol), sideset_base=2, out_base=3, in_base=4,
+                            push_thresh=bits, pull_thresh=bits)
+                sim.trace(2, 3)
+                words = [(0xa5c3e1f0 >> (32 - bits)) ^ i for i in range(3)]
+                miso = [(0x3c96d25a >> (32 - bits)) ^ (0x11 * i) for i in range(3)]
+                dev = SpiSlave(sim, 2, 3, 4, cpol, cpha, bits, miso)
+                sim.devices.append(dev)
+                rx = sim.drain(0, [])
+                sim.feed(0, [w] + [v | (0xdead0000 if bits < 16 else 0) for v in words])	#upper bits dropped
+                sim.run_until(lambda: len(rx) == 3 and sim.idle(0))
+                mode = cpha | cpol << 1
+                assert rx == miso, "SPI mode %d %dbit: MISO %s" % (mode, bits, [hex(w) for w in rx])
+                assert dev.words() == words, "SPI mode %d %dbit: MOSI %s" % (mode, bits, [hex(w) for w in dev.words()])
+                lead = sim.edges(2, 1 - cpol)
+                assert len(lead) == 3 * bits, "SPI mode %d %dbit: %d edges" % (cpha | cpol << 1, bits, len(lead))
+                p = periods(lead)
+                res[(bits, cpha, cpol)] = (p[0], p[bits - 1] - p[0])
+    gaps = set(res.values())
+    assert len(gaps) == 1, "SPI: the modes or widths differ %s" % res
+    cpb, gap = gaps.pop()
+    if verbose:
+        print("SPI: %d cycles per bit in all modes and widths, +%d cycles between the frames: "
+              "8bit frames %.1f Mbit/s at %d MHz" % (cpb, gap, 8 * sim.sys_clk / (8 * cpb + gap) / 1e6,
+                                                     sim.sys_clk // 1000000))
+    #nCS by the PIO
+    sim = PIOSim()
+    sim.sm_init(0, spi.spi_program(0, 0, 1), sideset_base=2, out_base=3, in_base=4, set_base=5,
+                push_thresh=8, pull_thresh=8)
+    sim.trace(2, 5)
+    dev = SpiSlave(sim, 2, 3, 4, 0, 0, 8, [0xc6, 0x39, 0x5e])
+    sim.devices.append(dev)
+    sim.feed(0, [spi.spi_width(8, 0), 2, 0x11, 0x22, 0x33])
+    rx = sim.drain(0, [])
+    sim.run_until(lambda: len(rx) == 3 and sim.idle(0))
+    rise = sim.edges(2, 1)
+    cs_low, cs_high = sim.edges(5, 0), sim.edges(5, 1)
+    assert rx == [0xc6, 0x39, 0x5e] and dev.words() == [0x11, 0x22, 0x33], "SPI nCS: data %s" % rx
+    assert len(cs_low) == 1 and len(cs_high) == 1 and len(rise) == 24, "SPI nCS: one frame of 3"
+    p = periods(rise)
+    return {"spi": (cpb, gap), "spi_cs": (rise[0] - cs_low[0], cs_high[0] - sim.edges(2, 0)[-1], p[7] - p[0])}
+
+def check_mgmt(mdio_mod, bsti_mod, verbose=True):
+    res = {}
+    for name, mdio in (("MDIO", True), ("BSTI", False)):
+        sim = PIOSim()
+        pin_in = 3 if mdio else 5
+        sim.sm_init(0, mdio_mod.mgmt_program(mdio), sideset_base=2, out_base=3, in_base=pin_in, set_base=3)
+        sim.trace(2, 3, 4)
+        sim.drive(pin_in, 1)
+        regs = {(0x0d, 1): 0x796d}
+        phy = MgmtPhy(2, 3, pin_in, regs) if mdio else MgmtPhy(2, 3, pin_in, regs, (bsti_mod.BSTI_RD,))
+        sim.devices.append(phy)
+        rd, wr = (mdio_mod.MDIO_RD, mdio_mod.MDIO_WR) if mdio else (bsti_mod.BSTI_RD, bsti_mod.BSTI_WR)
+        cmd = array("I")
+        mdio_mod.mgmt_encode(cmd, (wr << 28) | (0x0d << 23) | (0 << 18) | (2 << 16) | 0x1140, 0, 1)
+        mdio_mod.mgmt_encode(cmd, (rd << 28) | (0x0d << 23) | (1 << 18), 1, 1)
+        mdio_mod.mgmt_encode(cmd, (rd << 28) | (0x0d << 23) | (0 << 18), 1, 0)
+        rx = sim.drain(0, [])
+        sim.feed(0, cmd)
+        sim.run_until(lambda: len(rx) == 2 and sim.idle(0))
+        assert rx == [0x796d, 0x1140], "%s single SM: read %s" % (name, [hex(v) for v in rx])
+        assert [f[:4] for f in phy.frames] == [(wr, 0x0d, 0, 0x1140), (rd, 0x0d, 1, 0x796d), (rd, 0x0d, 0, 0x1140)], \
+            "%s single SM: frames %s" % (name, phy.frames)
+        assert [f[4] for f in phy.frames] == [32, 32, 0], "%s single SM: preamble" % name
+        p = periods(sim.edges(2, 1))
+        gap = phy.times[2][0] - phy.times[1][1] - min(p)	#the read without preamble after a read
+        res[name.lower() + "_1sm"] = (min(p), gap)
+        t = sim.edges(2, 0)[-1]
+        if verbose:
+            print("%s single SM: %d cycles per MDC period, +%d between two frames, write + 2 reads (2 with preamble)"
+                  " in %d cycles: MDC up to %.1f MHz" % (name, min(p), gap, t, sim.sys_clk / min(p) / 1e6))
+    #MDIO with the clk SM and the frame SM: the edges by the IRQs 4/5
+    sim = PIOSim()
+    sim.sm_init(1, mdio_mod.mdio_frame, out_base=3, in_base=3, set_base=3, sideset_base=4, active=False)
+    sim.sm_init(0, mdio_mod.clk, sideset_base=2)
+    sim.active(1)
+    sim.trace(2, 3, 4)
+    sim.drive(3, 1)
+    phy = MgmtPhy(2, 3, 3, {(0x0d, 1): 0x796d})
+    sim.devices.append(phy)
+    cmd = array("I")
+    mdio_mod.mdio_encode(cmd, 0x0d, 0, mdio_mod.MDIO_WR, 0x1140, 1)
+    mdio_mod.mdio_encode(cmd, 0x0d, 4, mdio_mod.MDIO_WR, 0x01e1, 0)
+    mdio_mod.mdio_encode(cmd, 0x0d, 1, mdio_mod.MDIO_RD, 0, 0)
+    rx = sim.drain(1, [])
+    sim.feed(1, cmd)
+    sim.run_until(lambda: len(phy.frames) == 3 and len(rx) == 1 and sim.idle(1))
+    p = periods(sim.edges(2, 1))
+    per = max(set(p), key=p.count)
+    res["mdio_2sm"] = (per, phy.times[1][0] - phy.times[0][1] - per)	#MDC runs on: in whole MDC periods
+    assert [f[:4] for f in phy.frames] == [(mdio_mod.MDIO_WR, 0x0d, 0, 0x1140), (mdio_mod.MDIO_WR, 0x0d, 4, 0x01e1),
+                                           (mdio_mod.MDIO_RD, 0x0d, 1, 0x796d)], "MDIO clk + frame SM: %s" % phy.frames
+    assert rx == [0x796d], "MDIO clk + frame SM: read %s" % [hex(v) for v in rx]
+    #the turn around: MDIO driven for the 14 bits of the read frame, released (DIR low) before the PHY drives
+    #TA2 on the next rising edge, for the 2 TA and the 16 data bits
+    dir_low, dir_high = sim.edges(4, 0), sim.edges(4, 1)
+    rise = sim.edges(2, 1)
+    assert len(dir_low) == 1 and len(dir_high) == 1, "MDIO clk + frame SM: DIR %s %s" % (dir_low, dir_high)
+    assert phy.times[2][0] < dir_low[0] < dir_high[0], "MDIO clk + frame SM: DIR low in the read frame"
+    assert (len([c for c in rise if phy.times[2][0] <= c < dir_low[0]]),
+            len([c for c in rise if dir_low[0] < c <= dir_high[0]])) == (14, 18), "MDIO clk + frame SM: turn around"
+    if verbose:
+        print("MDIO clk + frame SM: %d cycles per MDC period, +%d between two frames" % res["mdio_2sm"])
+    #BSTI with 4 SMs: clk, dataWrite, dataRead, pre (the preamble on IRQ 7, done on IRQ 6)
+    #MCLK 2, MDOUT 3, DIR 4, MDIN 5
+    sim = PIOSim()
+    sim.sm_init(1, bsti_mod.dataWrite, out_base=3, set_base=3, sideset_base=4, active=False)
+    sim.sm_init(2, bsti_mod.dataRead, out_base=3, in_base=5, set_base=3, sideset_base=4, active=False)
+    sim.sm_init(3, bsti_mod.pre, set_base=3, active=False)
+    sim.sm_init(0, bsti_mod.clk, sideset_base=2, active=False)
+    for i in range(4):
+        sim.active(i)
+    sim.trace(2, 3, 4)
+    sim.drive(5, 1)
+    phy = MgmtPhy(2, 3, 5, {(0x14, 1): 0x796d}, (bsti_mod.BSTI_RD,))
+    sim.devices.append(phy)
+    #a write as BSTI.write_word(): the CPU raises IRQ 7, waits for IRQ 6, then the word into dataWrite
+    sim.irq |= 1 << bsti_mod.BSTI_PRE
+    sim.run_until(lambda: sim.irq & (1 << bsti_mod.BSTI_PRE_DONE))
+    sim.irq &= ~(1 << bsti_mod.BSTI_PRE_DONE)
+    sim.put(1, bsti_mod.bsti_word(bsti_mod.BSTI_WR, 0x14, 0x11, 0xc082))
+    sim.run_until(lambda: len(phy.frames) == 1 and sim.idle(1))
+    #two reads as a burst: dataRead asks for each preamble itself
+    rx = sim.drain(2, [])
+    sim.feed(2, [bsti_mod.bsti_word(bsti_mod.BSTI_RD, 0x14, r) for r in (1, 0x11)])
+    sim.run_until(lambda: len(rx) == 2 and sim.idle(2))
+    assert [f[:4] for f in phy.frames] == [(bsti_mod.BSTI_WR, 0x14, 0x11, 0xc082), (bsti_mod.BSTI_RD, 0x14, 1, 0x796d),
+                                           (bsti_mod.BSTI_RD, 0x14, 0x11, 0xc082)], "BSTI 4 SMs: frames %s" % phy.frames
+    assert rx == [0x796d, 0xc082], "BSTI 4 SMs: read %s" % [hex(v) for v in rx]
+    assert all(f[4] >= 32 for f in phy.frames), "BSTI 4 SMs: preamble %s" % [f[4] for f in phy.frames]
+    rise, fall = sim.edges(2, 1), sim.edges(2, 0)
+    p = periods(rise)
+    per = max(set(p), key=p.count)
+    assert set(p) == {per} and set(f - r for r, f in zip(rise, fall)) == {per // 2}, "BSTI 4 SMs: MCLK"
+    #MDOUT changes with the falling edge: never at a rising edge, where the PHY samples
+    assert not set(sim.edges(3)) & set(rise), "BSTI 4 SMs: MDOUT changes at a rising MCLK edge"
+    #the turn around: per read DIR goes low with the rising edge the PHY puts D15 on (after the 14 bits and
+    #TA1), high again after the 16 data bits
+    dir_low = sim.edges(4, 0)
+    dir_high = [min(c for c in sim.edges(4, 1) if c > lo) for lo in dir_low]
+    assert len(dir_low) == 2 and all(lo in rise for lo in dir_low), "BSTI 4 SMs: DIR low %s" % dir_low
+    turn = [(len([c for c in rise if t0 <= c < lo]), len([c for c in rise if lo <= c <= hi]))
+            for (t0, _), lo, hi in zip(phy.times[1:], dir_low, dir_high)]
+    assert turn == [(15, 16)] * 2, "BSTI 4 SMs: turn around %s" % turn
+    #between the reads: the preamble of the next read (32 MCLK periods), the rest is the gap
+    res["bsti_4sm"] = (per, phy.times[2][0] - phy.times[1][1] - 33 * per)
+    if verbose:
+        print("BSTI clk + dataWrite + dataRead + pre: %d cycles per MCLK period, +%d between two reads"
+              " (besides the preamble)" % res["bsti_4sm"])
+    return res
+
+#the high times of a WS2812 data pin and the periods between the rising edges
+def _ws2812_pulses(sim, pin):
+    rise = sim.edges(pin, 1)
+    return rise, [f - r for r, f in zip(rise, sim.edges(pin, 0))]
+
+#ws2812 and ws2812_parallel (Pico2Plus_RP2350_LED.py): the bits decoded from the high times
+def check_ws2812(led, verbose=True):
+    res = {}
+    colors = [0x123456, 0xa5c3e1, 0xff00ff]
+    sim = PIOSim()
+    sim.sm_init(0, led.ws2812, sideset_base=2)
+    sim.trace(2)
+    sim.feed(0, [c << 8 for c in colors])
+    sim.run_until(lambda: len(sim.edges(2, 0)) == 24 * len(colors) and sim.idle(0))
+    rise, high = _ws2812_pulses(sim, 2)
+    t0h, t1h = min(high), max(high)
+    bits = [1 if h > (t0h + t1h) // 2 else 0 for h in high]
+    assert bits == [(c >> b) & 1 for c in colors for b in range(23, -1, -1)], "ws2812: bits"
+    p = periods(rise)
+    res["ws2812"] = (max(set(p), key=p.count), t0h, t1h)
+    #3 strands of 2 LEDs, the planes by ws2812_transpose()
+    nstrand, nled = 3, 2
+    fb = array("I", [0x123456, 0xa5c3e1, 0x00ff80, 0x7f0001, 0x800000, 0x0000ff])
+    planes = array("I", [0] * (6 * nled))
+    led.ws2812_transpose(fb, nstrand, nled, bytearray(range(256)), planes)
+    sim = PIOSim()
+    sim.sm_init(0, led.ws2812_parallel(nstrand), out_base=4)
+    sim.trace(4, 5, 6)
+    sim.feed(0, planes)
+    sim.run_until(lambda: len(sim.edges(4, 0)) == 24 * nled and sim.idle(0))
+    per = set()
+    for s in range(nstrand):
+        rise, high = _ws2812_pulses(sim, 4 + s)
+        assert rise == sim.edges(4, 1), "ws2812 parallel: strand %d rises with strand 0" % s
+        bits = [1 if h > 4 else 0 for h in high]
+        assert bits == [(fb[s * nled + i] >> b) & 1 for i in range(nled) for b in range(23, -1, -1)], \
+            "ws2812 parallel: strand %d" % s
+        p = periods(rise)
+        per.add((max(set(p), key=p.count), min(high), max(high)))
+    assert len(per) == 1, "ws2812 parallel: the strands differ %s" % per
+    res["ws2812_par"] = per.pop()
+    if verbose:
+        print("WS2812: %d cycles per bit, T0H %d, T1H %d; parallel strands: %d cycles per bit, T0H %d, T1H %d"
+              % (res["ws2812"] + res["ws2812_par"]))
+    return res
+
+if __name__ == "__main__":
+    import rp_emu
+    rp_emu.install()
+    import RP2350_PIO_QSPI as qspi
+    import RP2350_PIO_SPI as spi
+    import RP2350_PIO_MDIO as mdio_mod
+    import RP2350_PIO_BSTI as bsti_mod
+    import Pico2Plus_RP2350_LED as led
+
+    res = {}
+    res.update(check_qspi(qspi))
+    res.update(check_spi(spi))
+    res.update(check_mgmt(mdio_mod, bsti_mod))
+    res.update(check_ws2812(led))
+    bad = [(k, res[k], v) for k, v in EXPECT.items() if res[k] != v]
+    for k, got, want in bad:
+        print("timing changed: %s is %s, expected %s" % (k, got, want))
+    assert not bad, "PIO timing regression"
+    print("OK")
@@ -0,0 +1,74 @@
+#-------------------------------------------------
+# rp_regcache.py:
+#
+# write-through register cache of one PHY (device) on a slow management bus:
+# MDIO (RP2350_PIO_MDIO.MDIO), BSTI (RP2350_PIO_BSTI.BSTI) - any bus with read(phy, reg), write(phy, reg, value)
+# - static registers (only we change them, e.g. the control registers): read once, then from the cache
+# - a write of the value a static register has already is skipped, the others go to the bus (write through)
+# - volatile: {reg: mask} of the self-clearing bits (e.g. BMCR reset, restart AN): not kept in the cache,
+#   so writing them always goes to the bus, modify() does not write them back
+# - invalidate(reg): read it again from the bus (e.g. to poll a self-clearing bit),
+#   invalidate(): all, e.g. after a reset of the device
+# - the other registers (status, counters) are not cached: read() and write() go to the bus
+# reg: the clause 22 register number, or (devad, addr) for a clause 45 MMD register (MDIO: read45(), write45()),
+#   a bus without read45() (BSTI) takes clause 22 registers only
+#-------------------------------------------------
+
+class RegCache:
+
+    def __init__(self, bus, phy, static=(), volatile=None):
+        self.bus = bus
+        self.phy = phy
+        self.c45 = hasattr(bus, "read45")	#clause 45 registers on this bus
+        self.static = set(static)
+        self.volatile = volatile or {}
+        for reg in self.static | set(self.volatile):
+            self._check(reg)
+        self.cache = {}				#static reg: value, without the volatile bits
+        self.nbus = 0				#accesses on the bus
+        self.nhit = 0				#accesses saved by the cache
+
+    def _check(self, reg):
+        assert self.c45 or not isinstance(reg, tuple), "RegCache: clause 45 register %r, the bus has no read45()" % (reg,)
+
+    def _keep(self, reg, value):
+        if reg in self.static:
+            self.cache[reg] = value & ~self.volatile.get(reg, 0)
+
+    def read(self, reg):
+        v = self.cache.get(reg)
+        if v is not None:
+            self.nhit += 1
+            return v
+        self._check(reg)
+        self.nbus += 1
+        if isinstance(reg, tuple):
+            v = self.bus.read45(self.phy, reg[0], reg[1])
+        else:
+            v = self.bus.read(self.phy, reg)
+        self._keep(reg, v)
+        return v
+
+    def write(self, reg, value):
+        value &= 0xffff
+        if self.cache.get(reg) == value:
+            self.nhit += 1
+            return
+        self._check(reg)
+        self.nbus += 1
+        if isinstance(reg, tuple):
+            self.bus.write45(self.phy, reg[0], reg[1], value)
+        else:
+            self.bus.write(self.phy, reg, value)
+        self._keep(reg, value)
+
+    #read-modify-write: clear, then set bits, the self-clearing bits are not written back
+    def modify(self, reg, clear, set):
+        v = self.read(reg) & ~(clear | self.volatile.get(reg, 0))
+        self.write(reg, v | set)
+
+    def invalidate(self, reg=None):
+        if reg is None:
+            self.cache.clear()
+        elif reg in self.cache:
+            del self.cache[reg]
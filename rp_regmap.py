@@ -0,0 +1,187 @@
+#-------------------------------------------------
+# rp_regmap.py:
+#
+# named register maps of the PIO, DMA, UART (and SYSINFO) blocks, snapshots and decoded diffs:
+# - a map is text, a register per line: offset [+stride*count] NAME FIELD:lsb[:width] ...
+#   (hex offset, width 1 if omitted, with a count the name has a %d for the index, e.g. SM%d_EXECCTRL),
+#   a register without fields is shown as one word
+# - RegMap.snapshot(buf): the mapped registers only (no FIFO, no data register: reading those pops),
+#   runs of adjacent registers by one read_block() each, into a buffer of buffer() (preallocated)
+# - RegMap.diff(a, b): the changed fields [(register, field, old, new)], report(a, b) the lines of it,
+#   decode(buf): all fields of all registers
+# usage: m = pio_map(0); a = m.snapshot(); ...; b = m.snapshot(); print(m.report(a, b))
+#-------------------------------------------------
+
+import uctypes
+from array import array
+from rp_util import PIO0_BASE, PIO_BLOCK_SIZE, DMA_BASE, UART0_BASE, UART1_BASE
+from RP2350_ReadMem import read_block
+
+PIO_MAP = """
+000 CTRL SM_ENABLE:0:4 SM_RESTART:4:4 CLKDIV_RESTART:8:4
+004 FSTAT RXFULL:0:4 RXEMPTY:8:4 TXFULL:16:4 TXEMPTY:24:4
+008 FDEBUG RXSTALL:0:4 RXUNDER:8:4 TXOVER:16:4 TXSTALL:24:4
+00c FLEVEL TX0:0:4 RX0:4:4 TX1:8:4 RX1:12:4 TX2:16:4 RX2:20:4 TX3:24:4 RX3:28:4
+030 IRQ IRQ:0:8
+038 INPUT_SYNC_BYPASS
+03c DBG_PADOUT
+040 DBG_PADOE
+044 DBG_CFGINFO FIFO_DEPTH:0:6 SM_COUNT:8:4 IMEM_SIZE:16:6 VERSION:28:4
+0c8+18*4 SM%d_CLKDIV FRAC:8:8 INT:16:16
+0cc+18*4 SM%d_EXECCTRL STATUS_N:0:5 STATUS_SEL:5:2 WRAP_BOTTOM:7:5 WRAP_TOP:12:5 OUT_STICKY:17 INLINE_OUT_EN:18 OUT_EN_SEL:19:5 JMP_PIN:24:5 SIDE_PINDIR:29 SIDE_EN:30 EXEC_STALLED:31
+0d0+18*4 SM%d_SHIFTCTRL IN_COUNT:0:5 FJOIN_RX_GET:14 FJOIN_RX_PUT:15 AUTOPUSH:16 AUTOPULL:17 IN_SHIFTDIR:18 OUT_SHIFTDIR:19 PUSH_THRESH:20:5 PULL_THRESH:25:5 FJOIN_TX:30 FJOIN_RX:31
+0d4+18*4 SM%d_ADDR ADDR:0:5
+0d8+18*4 SM%d_INSTR INSTR:0:16
+0dc+18*4 SM%d_PINCTRL OUT_BASE:0:5 SET_BASE:5:5 SIDESET_BASE:10:5 IN_BASE:15:5 OUT_COUNT:20:6 SET_COUNT:26:3 SIDESET_COUNT:29:3
+168 GPIOBASE GPIOBASE:4
+16c INTR RXNEMPTY:0:4 TXNFULL:4:4 SM:8:8
+170 IRQ0_INTE RXNEMPTY:0:4 TXNFULL:4:4 SM:8:8
+"""
+
+DMA_CH_MAP = """
+000+40*%d CH%%d_READ_ADDR
+004+40*%d CH%%d_WRITE_ADDR
+008+40*%d CH%%d_TRANS_COUNT COUNT:0:28 MODE:28:4
+00c+40*%d CH%%d_CTRL EN:0 HIGH_PRIORITY:1 DATA_SIZE:2:2 INCR_READ:4 INCR_READ_REV:5 INCR_WRITE:6 INCR_WRITE_REV:7 RING_SIZE:8:4 RING_SEL:12 CHAIN_TO:13:4 TREQ_SEL:17:6 IRQ_QUIET:23 BSWAP:24 SNIFF_EN:25 BUSY:26 WRITE_ERROR:29 READ_ERROR:30 AHB_ERROR:31
+"""
+
+DMA_MAP = """
+400 INTR INTR:0:16
+404 INTE0 INTE0:0:16
+40c INTS0 INTS0:0:16
+464 CHAN_ABORT CHAN_ABORT:0:16
+"""
+
+#PL011: not UARTDR (reading pops the RX FIFO), not UARTICR (write only)
+UART_MAP = """
+004 UARTRSR FE:0 PE:1 BE:2 OE:3
+018 UARTFR CTS:0 DSR:1 DCD:2 BUSY:3 RXFE:4 TXFF:5 RXFF:6 TXFE:7 RI:8
+020 UARTILPR ILPDVSR:0:8
+024 UARTIBRD BAUD_DIVINT:0:16
+028 UARTFBRD BAUD_DIVFRAC:0:6
+02c UARTLCR_H BRK:0 PEN:1 EPS:2 STP2:3 FEN:4 WLEN:5:2 SPS:7
+030 UARTCR UARTEN:0 SIREN:1 SIRLP:2 LBE:7 TXE:8 RXE:9 DTR:10 RTS:11 RTSEN:14 CTSEN:15
+034 UARTIFLS TXIFLSEL:0:3 RXIFLSEL:3:3
+038 UARTIMSC RXIM:4 TXIM:5 RTIM:6 FEIM:7 PEIM:8 BEIM:9 OEIM:10
+03c UARTRIS RXRIS:4 TXRIS:5 RTRIS:6 FERIS:7 PERIS:8 BERIS:9 OERIS:10
+048 UARTDMACR RXDMAE:0 TXDMAE:1 DMAONERR:2
+"""
+
+SYSINFO_MAP = """
+000 CHIP_ID MANUFACTURER:0:12 PART:12:16 REVISION:28:4
+004 PACKAGE_SEL PACKAGE_SEL:0
+008 PLATFORM FPGA:0 ASIC:1 HDLSIM:2 BATCHSIM:3 GATESIM:4
+014 GITREF_RP2350
+"""
+
+#the text of a map into [(offset, name, ((field, lsb, width), ...))], sorted by offset
+def regmap_parse(text):
+    regs = []
+    for line in text.strip().split("\n"):
+        words = line.split()
+        if not words:
+            continue
+        off = words[0]
+        stride, count = 0, 1
+        if "+" in off:
+            off, rep = off.split("+")
+            stride, count = rep.split("*")
+            stride, count = int(stride, 16), int(count)
+        off = int(off, 16)
+        fields = []
+        for f in words[2:]:
+            f = f.split(":")
+            fields.append((f[0], int(f[1]), int(f[2]) if len(f) > 2 else 1))
+        fields = tuple(fields)
+        for i in range(count):
+            regs.append((off + i * stride, words[1] % i if stride else words[1], fields))
+    regs.sort()
+    return regs
+
+class RegMap:
+
+    def __init__(self, name, base, text):
+        self.name = name
+        self.base = base
+        self.regs = regmap_parse(text)
+        self.runs = []				#(offset, index of the first register, number of registers)
+        for i, (off, _, _) in enumerate(self.regs):
+            if self.runs and self.runs[-1][0] + 4 * self.runs[-1][2] == off:
+                o, k, n = self.runs[-1]
+                self.runs[-1] = (o, k, n + 1)
+            else:
+                self.runs.append((off, i, 1))
+
+    #a buffer for a snapshot
+    def buffer(self):
+        return array('I', [0] * len(self.regs))
+
+    def snapshot(self, buf=None):
+        if buf is None:
+            buf = self.buffer()
+        addr = uctypes.addressof(buf)
+        for off, k, n in self.runs:
+            read_block(self.base + off, addr + 4 * k, n)
+        return buf
+
+    #the changed fields: [(register, field, old, new)], field "" for a register without fields
+    def diff(self, a, b):
+        out = []
+        for i, (off, name, fields) in enumerate(self.regs):
+            x = a[i] ^ b[i]
+            if x == 0:
+                continue
+            if not fields:
+                out.append((name, "", a[i], b[i]))
+            for f, lsb, width in fields:
+                mask = (1 << width) - 1
+                if (x >> lsb) & mask:
+                    out.append((name, f, (a[i] >> lsb) & mask, (b[i] >> lsb) & mask))
+        return out
+
+    def report(self, a, b):
+        lines = []
+        for reg, f, old, new in self.diff(a, b):
+            if f:
+                lines.append("%s.%s.%s: %d -> %d (0x%x -> 0x%x)" % (self.name, reg, f, old, new, old, new))
+            else:
+                lines.append("%s.%s: 0x%08x -> 0x%08x" % (self.name, reg, old, new))
+        return "\n".join(lines)
+
+    #all registers of a snapshot with their fields
+    def decode(self, buf):
+        lines = []
+        for i, (off, name, fields) in enumerate(self.regs):
+            v = buf[i]
+            s = "%s.%s (0x%03x): 0x%08x" % (self.name, name, off, v)
+            if fields:
+                s += " " + " ".join("%s=%d" % (f, (v >> lsb) & ((1 << width) - 1)) for f, lsb, width in fields)
+            lines.append(s)
+        return "\n".join(lines)
+
+def pio_map(n):
+    return RegMap("PIO%d" % n, PIO0_BASE + n * PIO_BLOCK_SIZE, PIO_MAP)
+
+#channels: the first channels mapped (16: all)
+def dma_map(channels=16):
+    return RegMap("DMA", DMA_BASE, (DMA_CH_MAP % ((channels,) * 4)) + DMA_MAP)
+
+def uart_map(n):
+    return RegMap("UART%d" % n, UART1_BASE if n else UART0_BASE, UART_MAP)
+
+def sysinfo_map():
+    return RegMap("SYSINFO", 0x40000000, SYSINFO_MAP)
+
+if __name__ == "__main__":
+    from machine import Pin
+    import rp2
+    from RP2350_PIO_SPI import spi_prog
+    info = sysinfo_map()
+    print(info.decode(info.snapshot()))
+    #what rp2.StateMachine() changes in PIO0: one bulk read before, one after
+    m = pio_map(0)
+    a = m.snapshot()
+    b = m.buffer()
+    sm = rp2.StateMachine(0, spi_prog(1, 0), freq=1000000, sideset_base=Pin(2), out_base=Pin(3), in_base=Pin(4), push_thresh=16, pull_thresh=16)
+    m.snapshot(b)
+    print(m.report(a, b))
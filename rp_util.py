@@ -0,0 +1,696 @@
+#-------------------------------------------------
+# rp_util.py:
+#
+# set set of small functions supporting the use of the PIO
+# we use this in order to free instructions on PIO:
+# example: instead to wait for PIO state machine has completed, e.g. via "push()"
+# and "sm.get()" - we check the FIFO level (or PIO SM status), which saves PIO instructions
+#
+# sm: the state machine number as for rp2.StateMachine(): 0..3 PIO0, 4..7 PIO1, 8..11 PIO2
+# All addresses per SM are precomputed in the table SM_DESC, no if/elif per call.
+#-------------------------------------------------
+
+from array import array
+import time
+import uctypes
+
+PIO0_BASE = const(0x50200000)
+PIO1_BASE = const(0x50300000)
+PIO2_BASE = const(0x50400000)
+PIO_BLOCK_SIZE = const(0x100000)	# distance between the PIO blocks
+REG_ALIAS_SET = const(0x2000)		# atomic set bits alias of a register block
+REG_ALIAS_CLR = const(0x3000)		# atomic clear bits alias of a register block
+
+# register indices into the array of 32 bit registers
+PIO_CTRL = const(0)
+PIO_FSTAT = const(1)
+PIO_FDEBUG = const(2)
+PIO_FLEVEL = const(3)
+PIO_IRQ = const(0xc)  # the IRQ flags 0..7 of the block (write 1 to clear)
+PIO_IRQ_FORCE = const(0xd)  # write 1: raise an IRQ flag 0..7
+SM_REG_BASE = const(0x32)  # start of the SM state tables
+# register offsets into the per-SM state table
+SMx_CLKDIV = const(0)
+SMx_EXECCTRL = const(1)
+SMx_SHIFTCTRL = const(2)
+SMx_ADDR = const(3)
+SMx_INSTR = const(4)
+SMx_PINCTRL = const(5)
+
+SMx_SIZE = const(6)  # SM state table size
+
+SM_FIFO_RXFULL  = const(0x00000001)
+SM_FIFO_RXEMPTY = const(0x00000100)
+SM_FIFO_TXFULL  = const(0x00010000)
+SM_FIFO_TXEMPTY = const(0x01000000)
+
+#
+# PIO register byte address offsets
+#
+PIO_TXF0 = const(0x10)
+PIO_TXF1 = const(0x14)
+PIO_TXF2 = const(0x18)
+PIO_TXF3 = const(0x1c)
+PIO_RXF0 = const(0x20)
+PIO_RXF1 = const(0x24)
+PIO_RXF2 = const(0x28)
+PIO_RXF3 = const(0x2c)
+
+#
+# DMA TREQ (DREQ) numbers of the PIO FIFOs (RP2350): TX = base + SM, RX = base + 4 + SM
+#
+TREQ_PIO0 = const(0)
+TREQ_PIO1 = const(8)
+TREQ_PIO2 = const(16)
+
+#
+# SM descriptor table: SMD_SIZE words per SM, index = sm * SMD_SIZE + field
+#
+SMD_PIO = const(0)	# base address of the PIO block
+SMD_SM = const(1)	# SM number inside the block: 0..3
+SMD_REGS = const(2)	# address of the SM registers (SMx_CLKDIV), index with SMx_...
+SMD_TXF = const(3)	# address of the TX FIFO
+SMD_RXF = const(4)	# address of the RX FIFO
+SMD_PROG = const(5)	# index of the program offset in a rp2 program (list): 1..3 for PIO0..2
+SMD_TREQ_TX = const(6)	# DMA TREQ for the TX FIFO
+SMD_TREQ_RX = const(7)	# DMA TREQ for the RX FIFO
+SMD_SIZE = const(8)
+
+SM_NUM = const(12)
+
+SM_DESC = array('I', [0 for _ in range(SM_NUM * SMD_SIZE)])
+
+def sm_desc_init():
+    for sm in range(SM_NUM):
+        blk = sm >> 2
+        n = sm & 3
+        pio = PIO0_BASE + blk * PIO_BLOCK_SIZE
+        i = sm * SMD_SIZE
+        SM_DESC[i + SMD_PIO] = pio
+        SM_DESC[i + SMD_SM] = n
+        SM_DESC[i + SMD_REGS] = pio + 4 * (SM_REG_BASE + n * SMx_SIZE)
+        SM_DESC[i + SMD_TXF] = pio + PIO_TXF0 + 4 * n
+        SM_DESC[i + SMD_RXF] = pio + PIO_RXF0 + 4 * n
+        SM_DESC[i + SMD_PROG] = 1 + blk
+        SM_DESC[i + SMD_TREQ_TX] = TREQ_PIO0 + 8 * blk + n
+        SM_DESC[i + SMD_TREQ_RX] = TREQ_PIO0 + 8 * blk + 4 + n
+
+sm_desc_init()
+
+@micropython.viper
+def sm_restart(sm: int, program) -> uint:
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    pio = ptr32(d[i + SMD_PIO] + REG_ALIAS_SET)  # set bits only: the other SMs keep running
+    regs = ptr32(d[i + SMD_REGS])
+    initial_pc = uint(program[d[i + SMD_PROG]])
+    pio[PIO_CTRL] = 1 << (d[i + SMD_SM] + 4)  # reset the registers
+    # now execute a jmp instruction to the initial PC
+    # Since the code for the unconditional jump is
+    # 0 + binary address, this is effectively the address
+    # to be written in the INSTR register.
+    regs[SMx_INSTR] = initial_pc  # set the actual PC to the start adress
+    return initial_pc
+
+#
+# SM modes: the registers of a configured SM (rp2.StateMachine(), with its pins, thresholds, clock),
+# saved once and loaded again for a fast switch between programs resident in the instruction memory:
+# a few register writes instead of rp2.StateMachine() (program lookup, config, pins: milliseconds)
+#
+SMM_CLKDIV = const(0)
+SMM_EXECCTRL = const(1)
+SMM_SHIFTCTRL = const(2)
+SMM_PINCTRL = const(3)
+SMM_PC = const(4)	# the initial PC: the offset of the program
+SMM_SIZE = const(5)
+
+FJOIN_RX = const(1 << 31)  # SHIFTCTRL: changing a FIFO join clears both FIFOs
+
+# the mode of sm into mode (array('I', SMM_SIZE)): call it right after rp2.StateMachine(sm, program, ...)
+@micropython.viper
+def sm_mode_save(sm: int, program, mode: ptr32):
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    regs = ptr32(d[i + SMD_REGS])
+    mode[SMM_CLKDIV] = regs[SMx_CLKDIV]
+    mode[SMM_EXECCTRL] = regs[SMx_EXECCTRL]
+    mode[SMM_SHIFTCTRL] = regs[SMx_SHIFTCTRL]
+    mode[SMM_PINCTRL] = regs[SMx_PINCTRL]
+    mode[SMM_PC] = uint(program[d[i + SMD_PROG]])
+
+# stop sm, load a saved mode, clear the FIFOs, restart it at the start of the program: running again
+# The pins keep their directions: the modes of a SM should use the same pins (e.g. SPI CPHA/CPOL)
+@micropython.viper
+def sm_mode_load(sm: int, mode: ptr32):
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    n = d[i + SMD_SM]
+    regs = ptr32(d[i + SMD_REGS])
+    ptr32(d[i + SMD_PIO] + REG_ALIAS_CLR)[PIO_CTRL] = 1 << n  # disable: the other SMs keep running
+    regs[SMx_CLKDIV] = mode[SMM_CLKDIV]
+    regs[SMx_EXECCTRL] = mode[SMM_EXECCTRL]
+    regs[SMx_SHIFTCTRL] = mode[SMM_SHIFTCTRL] ^ FJOIN_RX  # toggle the join twice: empty FIFOs
+    regs[SMx_SHIFTCTRL] = mode[SMM_SHIFTCTRL]
+    regs[SMx_PINCTRL] = mode[SMM_PINCTRL]
+    pio = ptr32(d[i + SMD_PIO] + REG_ALIAS_SET)
+    pio[PIO_CTRL] = 0x110 << n  # SM_RESTART, CLKDIV_RESTART
+    regs[SMx_INSTR] = mode[SMM_PC]  # jmp to the start of the program
+    pio[PIO_CTRL] = 1 << n  # enable
+
+# the saved modes of one SM by key: add() once per mode after rp2.StateMachine(), select() to switch
+class SMModes:
+
+    def __init__(self, sm):
+        self.sm = sm
+        self.modes = {}
+
+    def add(self, key, program):
+        mode = array('I', [0] * SMM_SIZE)
+        sm_mode_save(self.sm, program, mode)
+        self.modes[key] = mode
+
+    # False: not saved yet, configure the SM by rp2.StateMachine() and add() it
+    def select(self, key):
+        mode = self.modes.get(key)
+        if mode is None:
+            return False
+        sm_mode_load(self.sm, mode)
+        return True
+
+@micropython.viper
+def sm_rx_fifo_level(sm: int) -> int:
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    pio = ptr32(d[i + SMD_PIO])
+    return (pio[PIO_FLEVEL] >> (8 * d[i + SMD_SM] + 4)) & 0x0f
+
+@micropython.viper
+def sm_tx_fifo_level(sm: int) -> int:
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    pio = ptr32(d[i + SMD_PIO])
+    return (pio[PIO_FLEVEL] >> (8 * d[i + SMD_SM])) & 0x0f
+
+@micropython.viper
+def sm_fifo_status(sm: int) -> int:
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    pio = ptr32(d[i + SMD_PIO])
+    return (pio[PIO_FSTAT] >> d[i + SMD_SM]) & 0x01010101
+
+@micropython.viper
+def sm_fifo_join(sm: int, action: int):
+    d = ptr32(SM_DESC)
+    regs = ptr32(d[sm * SMD_SIZE + SMD_REGS])
+    shiftctrl = regs[SMx_SHIFTCTRL] & 0x3fffffff  # FJOIN_RX 31, FJOIN_TX 30: keep all other bits
+
+    if action == 0:  # disable join
+        regs[SMx_SHIFTCTRL] = shiftctrl
+    elif action == 1:  # join RX
+        regs[SMx_SHIFTCTRL] = shiftctrl | (1 << 31)
+    elif action == 2:  # join TX
+        regs[SMx_SHIFTCTRL] = shiftctrl | (1 << 30)
+
+#
+# Wait until a SM has completed: the SM has stalled on an empty TX FIFO with a blocking pull()
+# (FDEBUG TXSTALL flag), so it is back at the start of its program and all bits are out.
+# Call it after the SM has got its data: the flag is sticky, we clear it first, a SM still waiting
+# on pull() sets it again immediately.
+#
+@micropython.viper
+def sm_wait_idle(sm: int):
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    pio = ptr32(d[i + SMD_PIO])
+    mask = 1 << (24 + d[i + SMD_SM])	# TXSTALL
+    pio[PIO_FDEBUG] = mask      # write 1 to clear
+    while (pio[PIO_FDEBUG] & mask) == 0:
+        pass
+
+#
+# The same in two steps, for a caller which does not want to spin (e.g. rp_async.sm_idle()):
+# clear TXSTALL, then poll sm_stalled() while doing something else
+#
+@micropython.viper
+def sm_stall_clear(sm: int):
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    pio = ptr32(d[i + SMD_PIO])
+    pio[PIO_FDEBUG] = 1 << (24 + d[i + SMD_SM])
+
+@micropython.viper
+def sm_stalled(sm: int) -> int:
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    pio = ptr32(d[i + SMD_PIO])
+    return (pio[PIO_FDEBUG] >> (24 + d[i + SMD_SM])) & 1
+
+#
+# Autopush on/off (SHIFTCTRL), e.g. a SPI program running TX-only: its in() never pushes
+#
+@micropython.viper
+def sm_autopush(sm: int, on: int):
+    d = ptr32(SM_DESC)
+    regs = ptr32(d[sm * SMD_SIZE + SMD_REGS])
+    if on:
+        regs[SMx_SHIFTCTRL] = regs[SMx_SHIFTCTRL] | (1 << 16)
+    else:
+        regs[SMx_SHIFTCTRL] = regs[SMx_SHIFTCTRL] & ~(1 << 16)
+
+#
+# Push/pull thresholds (SHIFTCTRL, 32 is written as 0), e.g. the frame width of a SPI program
+# at runtime: a program which ends its bit loop on the threshold (jmp(not_osre)) and pushes by it
+#
+@micropython.viper
+def sm_shift_thresh(sm: int, push: int, pull: int):
+    d = ptr32(SM_DESC)
+    regs = ptr32(d[sm * SMD_SIZE + SMD_REGS])
+    regs[SMx_SHIFTCTRL] = (regs[SMx_SHIFTCTRL] & ~(0x3ff << 20)) | ((push & 0x1f) << 20) | ((pull & 0x1f) << 25)
+
+#
+# Clear the IRQ flag a SM program raises with irq(rel(0)): flag = SM number inside the block
+#
+@micropython.viper
+def sm_irq_clear(sm: int):
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    pio = ptr32(d[i + SMD_PIO])
+    pio[PIO_IRQ] = 1 << d[i + SMD_SM]
+
+#
+# Any IRQ flag 0..7 of the PIO block of sm, from the CPU: raise it (as a SM with irq(n)),
+# take it: 1 (and cleared) if it was set (as a SM with wait(1, irq, n), but not blocking)
+#
+@micropython.viper
+def sm_irq_force(sm: int, n: int):
+    d = ptr32(SM_DESC)
+    pio = ptr32(d[sm * SMD_SIZE + SMD_PIO])
+    pio[PIO_IRQ_FORCE] = 1 << n
+
+@micropython.viper
+def sm_irq_take(sm: int, n: int) -> int:
+    d = ptr32(SM_DESC)
+    pio = ptr32(d[sm * SMD_SIZE + SMD_PIO])
+    mask = 1 << n
+    if pio[PIO_IRQ] & mask:
+        pio[PIO_IRQ] = mask
+        return 1
+    return 0
+
+#
+# DMA registers
+#
+DMA_BASE = const(0x50000000)
+# Register indices into the DMA register table
+READ_ADDR = const(0)
+WRITE_ADDR = const(1)
+TRANS_COUNT = const(2)
+CTRL_TRIG = const(3)
+CTRL_ALIAS = const(4)
+TRANS_COUNT_ALIAS = const(9)
+DMA_INTR = const(0x100)  # Address offset / 4: raw interrupt flags, a channel done (write 1 to clear)
+CHAN_ABORT = const(0x119)  # Address offset / 4 (RP2350: 0x464, RP2040 had it at 0x444)
+BUSY = const(1 << 26)
+#
+# Template for assembling the DMA control word
+# ATT: the RP2350 CTRL_TRIG layout differs from RP2040:
+# EN 0, HIGH_PRIORITY 1, DATA_SIZE 3:2, INCR_READ 4, INCR_WRITE 6, RING_SIZE 11:8, RING_SEL 12,
+# CHAIN_TO 16:13 (chain to itself = no chain), TREQ_SEL 22:17, IRQ_QUIET 23, BSWAP 24, BUSY 26
+#
+IRQ_QUIET = const(1)  # do not generate an interrupt
+RING_SEL = const(0)
+RING_SIZE = const(0)  # no wrapping
+HIGH_PRIORITY = const(1)
+EN = const(1)
+DMA_BSWAP = const(0x100)  # OR into the channel number: the DMA swaps the bytes of each word in flight
+DMA_IRQ = const(0x200)  # OR into the channel number: not IRQ_QUIET, the channel raises its IRQ when done
+DMA_FIXED = const(0x400)  # OR into the channel number: the buffer address does not increment (one word as source/sink)
+#
+# DMA transfer size (DATA_SIZE) for the push/pull threshold of a SM (SHIFTCTRL: 0 = 32)
+#
+@micropython.viper
+def dma_data_size(thresh:int) -> int:
+    if thresh > 16 or thresh == 0:
+        return 2  # 32 bit transfer
+    elif thresh > 8:
+        return 1  # 16 bit transfer
+    return 0  # 8 bit transfer
+
+#
+# Read from the State machine using DMA:
+# DMA channel (| DMA_BSWAP | DMA_IRQ | DMA_FIXED), State machine number, buffer, buffer length
+#
+@micropython.viper
+def sm_dma_get(chan:int, sm:int, dst:ptr32, nword:int) -> int:
+
+    BSWAP = (chan >> 8) & 1
+    QUIET = IRQ_QUIET ^ ((chan >> 9) & 1)
+    FIXED = (chan >> 10) & 1
+    chan &= 0xf
+    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    regs = ptr32(d[i + SMD_REGS])
+    TREQ_SEL = d[i + SMD_TREQ_RX]  # range 4-7, 12-15, 20-23
+    DATA_SIZE = int(dma_data_size((regs[SMx_SHIFTCTRL] >> 20) & 0x1f))  # from the push threshold
+
+    INCR_WRITE = 1 - FIXED  # 1 for increment while writing
+    INCR_READ = 0  # 0 for no increment while reading
+    CHAIN_TO = chan  # do not chain
+    DMA_control_word = ((BSWAP << 24) | (QUIET << 23) | (TREQ_SEL << 17) | (CHAIN_TO << 13) | (RING_SEL << 12) |
+                        (RING_SIZE << 8) | (INCR_WRITE << 6) | (INCR_READ << 4) | (DATA_SIZE << 2) |
+                        (HIGH_PRIORITY << 1) | (EN << 0))
+    dma[READ_ADDR] = d[i + SMD_RXF]
+    dma[WRITE_ADDR] = uint(dst)
+    dma[TRANS_COUNT] = nword
+    dma[CTRL_TRIG] = DMA_control_word  # and this starts the transfer
+    return DMA_control_word
+
+#
+# Write to the State machine using DMA:
+# DMA channel (| DMA_BSWAP | DMA_IRQ | DMA_FIXED), State machine number, buffer, buffer length
+#
+@micropython.viper
+def sm_dma_put(chan:int, sm:int, src:ptr32, nword:int) -> int:
+
+    BSWAP = (chan >> 8) & 1
+    QUIET = IRQ_QUIET ^ ((chan >> 9) & 1)
+    FIXED = (chan >> 10) & 1
+    chan &= 0xf
+    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    regs = ptr32(d[i + SMD_REGS])
+    TREQ_SEL = d[i + SMD_TREQ_TX]  # range 0-3, 8-11, 16-19
+    DATA_SIZE = int(dma_data_size((regs[SMx_SHIFTCTRL] >> 25) & 0x1f))  # from the pull threshold
+
+    INCR_WRITE = 0  # 1 for increment while writing
+    INCR_READ = 1 - FIXED  # 0 for no increment while reading
+    CHAIN_TO = chan  # do not chain
+    DMA_control_word = ((BSWAP << 24) | (QUIET << 23) | (TREQ_SEL << 17) | (CHAIN_TO << 13) | (RING_SEL << 12) |
+                        (RING_SIZE << 8) | (INCR_WRITE << 6) | (INCR_READ << 4) | (DATA_SIZE << 2) |
+                        (HIGH_PRIORITY << 1) | (EN << 0))
+    dma[READ_ADDR] = uint(src)
+    dma[WRITE_ADDR] = d[i + SMD_TXF]
+    dma[TRANS_COUNT] = nword
+    dma[CTRL_TRIG] = DMA_control_word  # and this starts the transfer
+    return DMA_control_word
+
+#
+# Continuous reading from a SM, without a gap and without the CPU re-arming the DMA:
+# ring:      one channel, endless (RP2350 TRANS_COUNT MODE = 0xf), the write address wraps
+#            in the ring buffer (RING_SEL = write, RING_SIZE = log2 of the buffer size)
+# ping-pong: two channels chained to each other (chan, chan + 1), each fills its half of buf
+#            and wraps onto its half again (write ring), both set their DMA_INTR flag when done
+# The buffers must be aligned to their size (power of 2, max. 32 KB): use dma_buffer()
+# DMA channel, State machine number, buffer, ring size (ping-pong: size of one half) in bytes
+#
+@micropython.viper
+def sm_dma_ring(chan:int, sm:int, dst:ptr32, nbytes:int) -> int:
+
+    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    regs = ptr32(d[i + SMD_REGS])
+    TREQ_SEL = d[i + SMD_TREQ_RX]
+    DATA_SIZE = int(dma_data_size((regs[SMx_SHIFTCTRL] >> 20) & 0x1f))  # from the push threshold
+    RING_BITS = 0
+    while (1 << RING_BITS) < nbytes:
+        RING_BITS += 1
+    RING_WRITE = 1  # wrap the write address
+    INCR_WRITE = 1  # 1 for increment while writing
+    CHAIN_TO = chan  # do not chain
+    DMA_control_word = ((IRQ_QUIET << 23) | (TREQ_SEL << 17) | (CHAIN_TO << 13) | (RING_WRITE << 12) |
+                        (RING_BITS << 8) | (INCR_WRITE << 6) | (DATA_SIZE << 2) |
+                        (HIGH_PRIORITY << 1) | (EN << 0))
+    dma[READ_ADDR] = d[i + SMD_RXF]
+    dma[WRITE_ADDR] = uint(dst)
+    dma[TRANS_COUNT] = 0xf << 28  # MODE ENDLESS: runs until dma_abort()
+    dma[CTRL_TRIG] = DMA_control_word  # and this starts the transfer
+    return DMA_control_word
+
+@micropython.viper
+def sm_dma_pingpong(chan:int, sm:int, dst:ptr32, nbytes:int) -> int:
+
+    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
+    dma2=ptr32(uint(DMA_BASE) + (chan + 1) * 0x40)
+    d = ptr32(SM_DESC)
+    i = sm * SMD_SIZE
+    regs = ptr32(d[i + SMD_REGS])
+    TREQ_SEL = d[i + SMD_TREQ_RX]
+    DATA_SIZE = int(dma_data_size((regs[SMx_SHIFTCTRL] >> 20) & 0x1f))  # from the push threshold
+    RING_BITS = 0
+    while (1 << RING_BITS) < nbytes:
+        RING_BITS += 1
+    RING_WRITE = 1  # wrap the write address: each channel stays in its half
+    INCR_WRITE = 1  # 1 for increment while writing
+    DMA_control_word = ((TREQ_SEL << 17) | (RING_WRITE << 12) |  # not IRQ_QUIET: DMA_INTR flags the half done
+                        (RING_BITS << 8) | (INCR_WRITE << 6) | (DATA_SIZE << 2) |
+                        (HIGH_PRIORITY << 1) | (EN << 0))
+    dma2[READ_ADDR] = d[i + SMD_RXF]
+    dma2[WRITE_ADDR] = uint(dst) + nbytes
+    dma2[TRANS_COUNT] = nbytes >> DATA_SIZE
+    dma2[CTRL_ALIAS] = DMA_control_word | (chan << 13)  # second half: chain back, no trigger yet
+    dma[READ_ADDR] = d[i + SMD_RXF]
+    dma[WRITE_ADDR] = uint(dst)
+    dma[TRANS_COUNT] = nbytes >> DATA_SIZE
+    dma[CTRL_TRIG] = DMA_control_word | ((chan + 1) << 13)  # first half: chain to the second, start
+    return DMA_control_word
+
+#
+# Size of a DMA buffer: array, bytearray, bytes or a memoryview of any of them.
+# len() counts items, a memoryview has the item size of its object (array('I'): 4 bytes per item)
+#
+def buf_itemsize(buf):
+    if isinstance(buf, (bytearray, bytes)):
+        return 1
+    mv = memoryview(buf)
+    try:
+        return mv.itemsize
+    except AttributeError:  # a port without memoryview.itemsize: the bytes of one item
+        return len(bytes(mv[:1])) if len(mv) else 1
+
+def buf_nbytes(buf):
+    return len(buf) * buf_itemsize(buf)
+
+#
+# Aligned DMA buffer for the ring modes: nbytes (power of 2) aligned to nbytes,
+# a memoryview into a bytearray of the double size
+#
+def dma_buffer(nbytes):
+    raw = bytearray(2 * nbytes)
+    off = -uctypes.addressof(raw) & (nbytes - 1)
+    return memoryview(raw)[off:off + nbytes]
+
+#
+# Consumers for the continuous reading:
+# SMRing.readable() returns the readable region (memoryview), SMRing.consume(n) releases n bytes.
+# SMPingPong.ready() returns the half just filled (memoryview) or None: process it before the
+# other half is full, otherwise it counts an overrun.
+#
+class SMRing:
+
+    def __init__(self, chan, sm, nbytes):
+        assert nbytes & (nbytes - 1) == 0 and 4 <= nbytes <= 32768
+        self.chan = chan
+        self.buf = dma_buffer(nbytes)
+        self.addr = uctypes.addressof(self.buf)
+        self.mask = nbytes - 1
+        self.rd = 0
+        sm_dma_ring(chan, sm, self.buf, nbytes)
+
+    def readable(self):
+        wr = (dma_write_addr(self.chan) - self.addr) & self.mask
+        if wr >= self.rd:
+            return self.buf[self.rd:wr]
+        return self.buf[self.rd:]		# up to the end, the rest with the next call
+
+    def consume(self, n):
+        self.rd = (self.rd + n) & self.mask
+
+    def stop(self):
+        dma_abort(self.chan)
+
+class SMPingPong:
+
+    def __init__(self, chan, sm, nbytes):
+        assert nbytes & (nbytes - 1) == 0 and 4 <= nbytes <= 32768
+        self.chan = chan
+        self.buf = dma_buffer(2 * nbytes)
+        self.half = (self.buf[:nbytes], self.buf[nbytes:])
+        self.next = 0
+        self.overrun = 0
+        dma_intr_clear(3 << chan)
+        sm_dma_pingpong(chan, sm, self.buf, nbytes)
+
+    def ready(self):
+        intr = dma_intr()
+        mask = 1 << (self.chan + self.next)
+        if not (intr & mask):
+            return None
+        dma_intr_clear(mask)
+        if intr & (1 << (self.chan + 1 - self.next)):
+            self.overrun += 1			# the other half is done, too: this one is being overwritten
+        h = self.half[self.next]
+        self.next ^= 1
+        return h
+
+    def stop(self):
+        dma_disable(self.chan)			# no chain trigger anymore
+        dma_disable(self.chan + 1)
+        dma_abort(self.chan)
+        dma_abort(self.chan + 1)
+
+#
+# UART registers (RP2350: UART0/1 moved, the DREQ numbers differ from RP2040 as well)
+#
+UART0_BASE = const(0x40070000)
+UART1_BASE = const(0x40078000)
+DREQ_UART0_RX = const(29)
+DREQ_UART1_RX = const(31)
+UART_DMACR = const(0x12)  # Address offset / 4: bit 0 RXDMAE, the RX DREQ is on
+
+#
+# Read from UART using DMA: the received bytes from the data register (UARTDR), paced by the RX DREQ
+# DMA channel, UART number, buffer, number of bytes
+#
+@micropython.viper
+def uart_dma_read(chan:int, uart_nr:int, data:ptr32, nbytes:int) -> int:
+
+    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
+    if uart_nr == 0:   # UART0
+        uart_dr = uint(UART0_BASE)
+        TREQ_SEL = DREQ_UART0_RX
+    else:  # UART1
+        uart_dr = uint(UART1_BASE)
+        TREQ_SEL = DREQ_UART1_RX
+    DATA_SIZE = 0  # byte transfer
+    INCR_WRITE = 1  # 1 for increment while writing
+    INCR_READ = 0  # 0 for no increment while reading
+    CHAIN_TO = chan  # do not chain
+    DMA_control_word = ((IRQ_QUIET << 23) | (TREQ_SEL << 17) | (CHAIN_TO << 13) | (RING_SEL << 12) |
+                        (RING_SIZE << 8) | (INCR_WRITE << 6) | (INCR_READ << 4) | (DATA_SIZE << 2) |
+                        (HIGH_PRIORITY << 1) | (EN << 0))
+    ptr32(uart_dr + REG_ALIAS_SET)[UART_DMACR] = 1  # RXDMAE, by the atomic SET alias
+    dma[READ_ADDR] = uart_dr
+    dma[WRITE_ADDR] = uint(data)
+    dma[TRANS_COUNT] = nbytes
+    dma[CTRL_TRIG] = DMA_control_word  # and this starts the transfer
+    return DMA_control_word
+#
+# Get the current transfer count
+#
+@micropython.viper
+def dma_transfer_count(chan:uint) -> int:
+    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
+    return dma[TRANS_COUNT]
+#
+# Is the channel still busy? (not yet all words transferred)
+#
+@micropython.viper
+def dma_busy(chan:uint) -> int:
+    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
+    return (dma[CTRL_TRIG] >> 26) & 1	# BUSY
+#
+# DMA_INTR: the raw interrupt flags (a channel has completed, not IRQ_QUIET), clear with a mask
+#
+@micropython.viper
+def dma_intr() -> int:
+    dma=ptr32(uint(DMA_BASE))
+    return dma[DMA_INTR]
+
+@micropython.viper
+def dma_intr_clear(mask:int):
+    dma=ptr32(uint(DMA_BASE))
+    dma[DMA_INTR] = mask  # write 1 to clear
+#
+# Get the current write register value
+#
+@micropython.viper
+def dma_write_addr(chan:uint) -> int:
+    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
+    return dma[WRITE_ADDR]
+
+#
+# Get the current read register value
+#
+@micropython.viper
+def dma_read_addr(chan:uint) -> int:
+    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
+    return dma[READ_ADDR]
+#
+# Abort an transfer
+#
+@micropython.viper
+def dma_abort(chan:uint):
+    dma=ptr32(uint(DMA_BASE))
+    dma[CHAN_ABORT] = 1 << chan
+    while dma[CHAN_ABORT]:
+        time.sleep_us(10)
+#
+# The same in two steps, without sleeping: start the abort, then poll dma_aborting()
+#
+@micropython.viper
+def dma_abort_start(chan:uint):
+    dma=ptr32(uint(DMA_BASE))
+    dma[CHAN_ABORT] = 1 << chan
+
+@micropython.viper
+def dma_aborting(chan:uint) -> int:
+    dma=ptr32(uint(DMA_BASE))
+    return (dma[CHAN_ABORT] >> chan) & 1
+#
+# Disable a channel: EN = 0, it pauses and ignores triggers (e.g. from a chained channel)
+#
+@micropython.viper
+def dma_disable(chan:uint):
+    dma=ptr32(uint(DMA_BASE) + chan * 0x40)
+    dma[CTRL_ALIAS] = dma[CTRL_ALIAS] & ~1
+
+#
+# Endian conversion of 32bit words, in place: array('I'), bytearray, memoryview
+# bswap32_word() is the plain Python reference, bswap32() the viper version (runs also on rp_emu),
+# bswap32_asm() uses the Cortex-M33 REV instruction (not in the asm_thumb mnemonics, so as data()).
+# Without any CPU: DMA_BSWAP on the DMA feeding/draining the SM swaps the bytes in flight.
+# The PIO shift configuration cannot do it: out_shiftdir/in_shiftdir just reverse the bit order.
+#
+def bswap32_word(v):
+    return ((v & 0xff) << 24) | ((v & 0xff00) << 8) | ((v >> 8) & 0xff00) | ((v >> 24) & 0xff)
+
+@micropython.viper
+def bswap32(buf:ptr32, nword:int):
+    i = 0
+    while i < nword:
+        v = buf[i]
+        buf[i] = (v << 24) | ((v << 8) & 0xff0000) | ((v >> 8) & 0xff00) | ((v >> 24) & 0xff)
+        i += 1
+
+@micropython.asm_thumb
+def bswap32_asm(r0, r1):	# r0 = buffer, r1 = number of 32bit words
+    b(LOOP_END)
+    label(LOOP)
+    ldr(r2, [r0, 0])
+    data(2, 0xba12)		# rev(r2, r2)
+    str(r2, [r0, 0])
+    add(r0, 4)
+    sub(r1, 1)
+    label(LOOP_END)
+    cmp(r1, 0)
+    bgt(LOOP)
+
+#
+# Benchmark: naive Python loop vs. viper vs. asm_thumb, time in us for nword words
+#
+def bswap32_bench(nword=256):
+    buf = array('I', [0x12345678 for _ in range(nword)])
+    t0 = time.ticks_us()
+    for i in range(nword):
+        buf[i] = bswap32_word(buf[i])
+    t1 = time.ticks_us()
+    bswap32(buf, nword)
+    t2 = time.ticks_us()
+    bswap32_asm(buf, nword)
+    t3 = time.ticks_us()
+    print("bswap32 %d words: python %d us, viper %d us, asm_thumb %d us" %
+          (nword, time.ticks_diff(t1, t0), time.ticks_diff(t2, t1), time.ticks_diff(t3, t2)))
+    return buf[0] == 0x78563412			# 3 swaps = 1 swap